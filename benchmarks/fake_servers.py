@@ -0,0 +1,576 @@
+"""
+Lokale Stand-ins für Ollama, ComfyUI und Airtable (nur Standardbibliothek).
+Damit lassen sich Story- und Art-Modus ohne GPU, Modelle und Airtable-Base durchmessen.
+
+Jeder Server läuft in einem eigenen Thread auf 127.0.0.1 (freier Port) und protokolliert
+Zeitstempel (time.monotonic) in `events`, aus denen der Benchmark die Kennzahlen berechnet.
+"""
+import base64
+import hashlib
+import json
+import re
+import socket
+import struct
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    fake: "FakeServer" = None
+
+    def log_message(self, format, *args):
+        pass  # Kein Request-Log auf stderr
+
+    def _route(self, method: str):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        try:
+            self.fake.handle(self, method, url.path, parse_qs(url.query), body)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_PATCH(self):
+        self._route("PATCH")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+    def send_json(self, payload, status: int = 200):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_bytes(data, "application/json", status)
+
+    def send_bytes(self, data: bytes, content_type: str, status: int = 200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeServer:
+    """Basis: HTTP-Server im Hintergrund-Thread. Unterklassen implementieren `handle()`."""
+
+    name = "fake"
+
+    def __init__(self):
+        handler = type(f"{type(self).__name__}Handler", (_Handler,), {"fake": self})
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.events: List[Tuple[float, str, Dict]] = []
+        self._events_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def record(self, event: str, **data):
+        with self._events_lock:
+            self.events.append((time.monotonic(), event, data))
+
+    def times(self, event: str) -> List[float]:
+        with self._events_lock:
+            return [t for t, name, _ in self.events if name == event]
+
+    def start(self) -> "FakeServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def handle(self, req: _Handler, method: str, path: str, query: Dict, body: bytes):
+        req.send_json({"error": "not found"}, 404)
+
+
+# --- Ollama ---
+
+def fake_story(topic: str, scenes: int) -> str:
+    """Eine gültige Story im Format des System-Prompts (Titel + abwechselnd Text/Image Prompt)."""
+    blocks = []
+    for n in range(1, scenes + 1):
+        blocks.append({"type": "text", "content": f"Szene {n}: Ein kleiner Drache erlebt etwas zum Thema {topic}. "
+                                                  "Er lacht, schnuppert und hört die Vögel singen."})
+        # Das Thema gehört in den Prompt: sonst wären die Bilder aller Bücher identisch (Bild-Cache-Treffer)
+        blocks.append({"type": "image_prompt", "content": f"little pastel blue dragon with red striped scarf, {topic}, "
+                                                          f"scene {n}, sunny meadow, morning light, "
+                                                          "(children book illustration style:1.3)"})
+    return json.dumps({"title": f"Der kleine Drache und {topic}", "blocks": blocks}, ensure_ascii=False, indent=2)
+
+
+class FakeOllama(FakeServer):
+    """
+    /api/generate streamt die Story als NDJSON mit `token_rate` Tokens/s (ein Token ≈ `token_chars` Zeichen).
+    Ein Request mit leerem Prompt und keep_alive=0 entlädt das Modell; /api/ps zeigt geladene Modelle.
+    """
+
+    name = "FakeOllama"
+
+    def __init__(self, token_rate: float = 50.0, scenes: int = 8, token_chars: int = 4, load_seconds: float = 0.0):
+        super().__init__()
+        self.token_rate = token_rate
+        self.scenes = scenes
+        self.token_chars = token_chars
+        self.load_seconds = load_seconds
+        self.loaded: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def handle(self, req, method, path, query, body):
+        if method == "GET" and path == "/api/ps":
+            with self._lock:
+                models = [{"name": f"{m}:latest", "model": f"{m}:latest"} for m in self.loaded]
+            return req.send_json({"models": models})
+        if method == "POST" and path == "/api/generate":
+            return self._generate(req, json.loads(body or b"{}"))
+        return super().handle(req, method, path, query, body)
+
+    def _ensure_loaded(self, model: str):
+        with self._lock:
+            if model in self.loaded:
+                return
+        self.record("load", model=model)
+        time.sleep(self.load_seconds)
+        with self._lock:
+            self.loaded[model] = time.monotonic()
+
+    def _generate(self, req, payload: Dict):
+        model = payload.get("model", "model")
+        if not payload.get("prompt") and payload.get("keep_alive") == 0:
+            with self._lock:
+                self.loaded.pop(model, None)
+            self.record("unload", model=model)
+            return req.send_json({"model": model, "response": "", "done": True, "done_reason": "unload"})
+
+        self._ensure_loaded(model)
+        topic = payload.get("prompt", "").split("about:", 1)[-1].strip()
+        text = fake_story(topic, self.scenes)
+        tokens = [text[i:i + self.token_chars] for i in range(0, len(text), self.token_chars)]
+
+        req.send_response(200)
+        req.send_header("Content-Type", "application/x-ndjson")
+        req.send_header("Connection", "close")
+        req.end_headers()
+        req.close_connection = True
+
+        self.record("generate_start", topic=topic, tokens=len(tokens))
+        interval = 1.0 / self.token_rate
+        next_at = time.monotonic()
+        try:
+            for token in tokens:
+                next_at += interval
+                time.sleep(max(0.0, next_at - time.monotonic()))
+                req.wfile.write(json.dumps({"model": model, "response": token, "done": False}).encode() + b"\n")
+                req.wfile.flush()
+            req.wfile.write(json.dumps({"model": model, "response": "", "done": True}).encode() + b"\n")
+            req.wfile.flush()
+            self.record("generate_end", topic=topic, tokens=len(tokens))
+        except (BrokenPipeError, ConnectionResetError):
+            self.record("generate_aborted", topic=topic)
+
+
+# --- ComfyUI ---
+
+def tiny_png(width: int = 8, height: int = 8) -> bytes:
+    """Ein gültiges, einfarbiges PNG (ohne Pillow)."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+    raw = b"".join(b"\x00" + b"\xa0\xc8\xf0" * width for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw))
+            + chunk(b"IEND", b""))
+
+
+class _WebSocket:
+    """Server-Seite einer WebSocket-Verbindung (nur Text-Frames, ohne Fragmentierung)."""
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self._lock = threading.Lock()
+        self.open = True
+
+    def send_text(self, text: str):
+        self._send_frame(0x1, text.encode("utf-8"))
+
+    def _send_frame(self, opcode: int, payload: bytes):
+        header = bytes([0x80 | opcode])
+        n = len(payload)
+        if n < 126:
+            header += bytes([n])
+        elif n < 65536:
+            header += bytes([126]) + struct.pack(">H", n)
+        else:
+            header += bytes([127]) + struct.pack(">Q", n)
+        with self._lock:
+            if not self.open:
+                return
+            try:
+                self.sock.sendall(header + payload)
+            except OSError:
+                self.open = False
+
+    def serve(self, rfile):
+        """Liest Client-Frames bis zum Close (Ping wird beantwortet, Text ignoriert)."""
+        try:
+            while True:
+                head = rfile.read(2)
+                if len(head) < 2:
+                    break
+                opcode, length = head[0] & 0x0F, head[1] & 0x7F
+                if length == 126:
+                    length = struct.unpack(">H", rfile.read(2))[0]
+                elif length == 127:
+                    length = struct.unpack(">Q", rfile.read(8))[0]
+                mask = rfile.read(4) if head[1] & 0x80 else b"\x00" * 4
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(rfile.read(length)))
+                if opcode == 0x8:
+                    self._send_frame(0x8, payload[:2])
+                    break
+                if opcode == 0x9:
+                    self._send_frame(0xA, payload)
+        except OSError:
+            pass
+        self.open = False
+
+
+class FakeComfy(FakeServer):
+    """
+    Minimaler ComfyUI: /prompt, /ws, /history, /view, /queue (inkl. delete), /interrupt, /system_stats und /free.
+    Ein Worker-Thread "rendert" einen Prompt nach dem anderen (wie eine GPU): `prompt_overhead` Sekunden
+    pro Prompt (Validierung, Modell-Check) plus `render_latency` Sekunden pro KSampler im Graphen.
+    Fortschritt und Ergebnis (ein Bild je SaveImage Node) kommen wie bei ComfyUI über den WebSocket.
+    Mit `stall_every` = n bleibt jeder n-te Prompt nach dem ersten Schritt stumm hängen, bis /interrupt kommt.
+    """
+
+    name = "FakeComfy"
+
+    def __init__(self, render_latency: float = 1.5, steps: int = 5, vram_free_mb: float = 6000,
+                 prompt_overhead: float = 0.0, stall_every: int = 0):
+        super().__init__()
+        self.render_latency = render_latency
+        self.prompt_overhead = prompt_overhead
+        self.stall_every = stall_every
+        self.steps = steps
+        self.vram_free_mb = vram_free_mb
+        self.png = tiny_png()
+        self.history: Dict[str, Dict] = {}
+        self.sockets: Dict[str, _WebSocket] = {}
+        self._queue: List[Tuple[str, str, Dict]] = []
+        self._running: Optional[str] = None
+        self._interrupted = threading.Event()
+        self._cond = threading.Condition()
+        threading.Thread(target=self._worker, name="FakeComfyGPU", daemon=True).start()
+
+    def handle(self, req, method, path, query, body):
+        if method == "GET" and path == "/ws":
+            return self._websocket(req, query.get("clientId", [""])[0])
+        if method == "POST" and path == "/prompt":
+            payload = json.loads(body or b"{}")
+            prompt_id = str(uuid.uuid4())
+            with self._cond:
+                self._queue.append((prompt_id, payload.get("client_id", ""), payload.get("prompt", {})))
+                number = len(self._queue)
+                self._cond.notify()
+            self.record("queued", prompt_id=prompt_id)
+            return req.send_json({"prompt_id": prompt_id, "number": number, "node_errors": {}})
+        if method == "GET" and path.startswith("/history/"):
+            prompt_id = path.rsplit("/", 1)[-1]
+            with self._cond:
+                entry = self.history.get(prompt_id)
+            return req.send_json({prompt_id: entry} if entry else {})
+        if method == "GET" and path == "/view":
+            self.record("view", filename=query.get("filename", [""])[0])
+            return req.send_bytes(self.png, "image/png")
+        if method == "GET" and path == "/queue":
+            with self._cond:
+                running = [[0, self._running, {}, {}, []]] if self._running else []
+                pending = [[i + 1, pid, {}, {}, []] for i, (pid, _, _) in enumerate(self._queue)]
+            return req.send_json({"queue_running": running, "queue_pending": pending})
+        if method == "GET" and path == "/system_stats":
+            free = int(self.vram_free_mb * 1024 * 1024)
+            return req.send_json({"devices": [{"name": "fake", "type": "cuda", "vram_total": free, "vram_free": free,
+                                               "torch_vram_total": 0, "torch_vram_free": 0}]})
+        if method == "POST" and path == "/interrupt":
+            self.record("interrupt")
+            self._interrupted.set()
+            return req.send_json({})
+        if method == "POST" and path == "/queue":
+            delete = set(json.loads(body or b"{}").get("delete", []))
+            with self._cond:
+                self._queue = [item for item in self._queue if item[0] not in delete]
+            return req.send_json({})
+        if method == "POST" and path == "/free":
+            self.record("free")
+            return req.send_json({})
+        return super().handle(req, method, path, query, body)
+
+    def _websocket(self, req, client_id: str):
+        key = req.headers.get("Sec-WebSocket-Key", "")
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        req.send_response(101, "Switching Protocols")
+        req.send_header("Upgrade", "websocket")
+        req.send_header("Connection", "Upgrade")
+        req.send_header("Sec-WebSocket-Accept", accept)
+        req.end_headers()
+        req.wfile.flush()
+        req.close_connection = True
+
+        ws = _WebSocket(req.connection)
+        with self._cond:
+            self.sockets[client_id] = ws
+        ws.send_text(json.dumps({"type": "status", "data": {"status": {"exec_info": {"queue_remaining": 0}},
+                                                              "sid": client_id}}))
+        ws.serve(req.rfile)
+        with self._cond:
+            if self.sockets.get(client_id) is ws:
+                del self.sockets[client_id]
+
+    def _send(self, client_id: str, msg_type: str, data: Dict):
+        with self._cond:
+            ws = self.sockets.get(client_id)
+        if ws is not None:
+            ws.send_text(json.dumps({"type": msg_type, "data": data}))
+
+    @staticmethod
+    def _save_nodes(prompt: Dict) -> List[Tuple[str, str]]:
+        nodes = [(node_id, node.get("inputs", {}).get("filename_prefix", "ComfyUI"))
+                 for node_id, node in prompt.items() if node.get("class_type") == "SaveImage"]
+        return nodes or [("9", "ComfyUI")]
+
+    def _worker(self):
+        counter = prompts = 0
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                prompt_id, client_id, prompt = self._queue.pop(0)
+                self._running = prompt_id
+            prompts += 1
+            self._interrupted.clear()
+            stall = self.stall_every and prompts % self.stall_every == 0
+
+            self.record("render_start", prompt_id=prompt_id)
+            self._send(client_id, "execution_start", {"prompt_id": prompt_id})
+            time.sleep(self.prompt_overhead)
+            outputs = {}
+            for node_id, prefix in self._save_nodes(prompt):
+                self._send(client_id, "executing", {"node": "3", "prompt_id": prompt_id})
+                for step in range(1, self.steps + 1):
+                    time.sleep(self.render_latency / self.steps)
+                    if stall and step == 2:
+                        self.record("stall", prompt_id=prompt_id)
+                        self._interrupted.wait()  # Hängt stumm, bis jemand /interrupt schickt
+                    if self._interrupted.is_set():
+                        break
+                    self._send(client_id, "progress", {"value": step, "max": self.steps,
+                                                       "prompt_id": prompt_id, "node": "3"})
+                if self._interrupted.is_set():
+                    break
+                counter += 1
+                outputs[node_id] = {"images": [{"filename": f"{prefix}_{counter:05d}_.png", "subfolder": "",
+                                                "type": "output"}]}
+                self._send(client_id, "executed", {"node": node_id, "output": outputs[node_id],
+                                                   "prompt_id": prompt_id})
+
+            if self._interrupted.is_set():
+                with self._cond:
+                    self.history[prompt_id] = {"prompt": [0, prompt_id, prompt, {}, []], "outputs": {},
+                                               "status": {"status_str": "error", "completed": False}}
+                    self._running = None
+                self.record("interrupted", prompt_id=prompt_id)
+                self._send(client_id, "execution_interrupted", {"prompt_id": prompt_id})
+                continue
+
+            with self._cond:
+                self.history[prompt_id] = {"prompt": [0, prompt_id, prompt, {}, list(outputs)],
+                                           "outputs": outputs,
+                                           "status": {"status_str": "success", "completed": True}}
+                self._running = None
+            self.record("render_end", prompt_id=prompt_id)
+            self._send(client_id, "executing", {"node": None, "prompt_id": prompt_id})
+
+
+# --- Airtable ---
+
+def _airtable_id(prefix: str = "rec") -> str:
+    return prefix + uuid.uuid4().hex[:14]
+
+
+class FakeAirtable(FakeServer):
+    """
+    Airtable REST API im Speicher (List/Create/Update/Delete, auch als Batch) mit Rate Limit:
+    mehr als `rate_limit` Requests pro Sekunde werden wie bei Airtable mit 429 beantwortet.
+    `filterByFormula` versteht die Formeln, die der Client benutzt
+    ({Feld} = 'Wert', {Feld} != 'Wert', RECORD_ID() = '...', IS_AFTER(LAST_MODIFIED_TIME(), '...'), AND/OR(...)).
+    """
+
+    name = "FakeAirtable"
+
+    def __init__(self, rate_limit: int = 5):
+        super().__init__()
+        self.rate_limit = rate_limit
+        self.tables: Dict[str, Dict[str, Dict]] = {}
+        self.requests = 0
+        self.throttled = 0
+        self._window: List[float] = []
+        self._lock = threading.Lock()
+
+    def _throttle(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            self._window = [t for t in self._window if now - t < 1.0]
+            if len(self._window) >= self.rate_limit:
+                self.throttled += 1
+                return True
+            self._window.append(now)
+            return False
+
+    def handle(self, req, method, path, query, body):
+        parts = [p for p in path.split("/") if p]
+        if len(parts) < 3 or parts[0] != "v0":
+            return super().handle(req, method, path, query, body)
+        if self._throttle():
+            self.record("throttled")
+            return req.send_json({"errors": [{"error": "RATE_LIMIT_REACHED"}]}, 429)
+
+        table_name = parts[2]
+        payload = json.loads(body or b"{}")
+        with self._lock:
+            table = self.tables.setdefault(table_name, {})
+            if method == "GET" and len(parts) == 4:
+                record = table.get(parts[3])
+                if record is None:
+                    return req.send_json({"error": "NOT_FOUND"}, 404)
+                return req.send_json(self._public(record))
+            if method == "GET" or (method == "POST" and parts[-1] == "listRecords"):
+                return self._list(req, table, payload if method == "POST" else query)
+            if method == "POST":
+                return req.send_json(self._create(table_name, table, payload))
+            if method == "PATCH":
+                return req.send_json(self._update(table, payload, parts))
+            if method == "DELETE":
+                ids = query.get("records[]", []) or parts[3:4]
+                deleted = [{"id": rid, "deleted": table.pop(rid, None) is not None} for rid in ids]
+                self.record("delete", table=table_name, count=len(ids))
+                return req.send_json({"records": deleted} if "records[]" in query else deleted[0])
+        return super().handle(req, method, path, query, body)
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+    def _create(self, table_name: str, table: Dict, payload: Dict) -> Dict:
+        items = payload.get("records") or [{"fields": payload.get("fields", {})}]
+        created = []
+        for item in items:
+            record = {"id": _airtable_id(), "createdTime": self._now(), "fields": dict(item.get("fields", {}))}
+            record["_modified"] = record["createdTime"]
+            table[record["id"]] = record
+            created.append(self._public(record))
+        self.record("create", table=table_name, count=len(created))
+        return {"records": created} if "records" in payload else created[0]
+
+    def _update(self, table: Dict, payload: Dict, parts: List[str]) -> Dict:
+        items = payload.get("records") or [{"id": parts[3], "fields": payload.get("fields", {})}]
+        updated = []
+        for item in items:
+            record = table.get(item["id"])
+            if record is None:
+                continue
+            for key, value in item.get("fields", {}).items():
+                if value is None:
+                    record["fields"].pop(key, None)  # null leert das Feld (wie bei Airtable)
+                else:
+                    record["fields"][key] = value
+            record["_modified"] = self._now()
+            updated.append(self._public(record))
+        self.record("update", count=len(updated))
+        return {"records": updated} if "records" in payload else (updated[0] if updated else {})
+
+    @staticmethod
+    def _public(record: Dict) -> Dict:
+        return {key: value for key, value in record.items() if not key.startswith("_")}
+
+    def _list(self, req, table: Dict, options: Dict):
+        def option(name):
+            value = options.get(name)
+            return value[0] if isinstance(value, list) and name not in ("fields[]", "fields") else value
+
+        formula = option("filterByFormula")
+        page_size = int(option("pageSize") or 100)
+        offset = int(option("offset") or 0)
+        fields = options.get("fields[]") or options.get("fields")
+
+        records = [r for r in table.values() if not formula or self._matches(formula, r)]
+        if option("maxRecords"):
+            records = records[:int(option("maxRecords"))]
+        page = records[offset:offset + page_size]
+        result = []
+        for record in page:
+            public = self._public(record)
+            if fields:
+                public["fields"] = {k: v for k, v in public["fields"].items() if k in fields}
+            result.append(public)
+        response = {"records": result}
+        if offset + page_size < len(records):
+            response["offset"] = str(offset + page_size)
+        self.record("list", count=len(result))
+        return req.send_json(response)
+
+    def _matches(self, formula: str, record: Dict) -> bool:
+        formula = formula.strip()
+        if formula.startswith("AND(") and formula.endswith(")"):
+            return all(self._matches(part, record) for part in _split_args(formula[4:-1]))
+        if formula.startswith("OR(") and formula.endswith(")"):
+            return any(self._matches(part, record) for part in _split_args(formula[3:-1]))
+        m = re.fullmatch(r"RECORD_ID\(\)\s*=\s*'([^']*)'", formula)
+        if m:
+            return record["id"] == m.group(1)
+        m = re.fullmatch(r"IS_AFTER\(LAST_MODIFIED_TIME\(\),\s*'([^']+)'\)", formula)
+        if m:
+            return _parse_time(record["_modified"]) > _parse_time(m.group(1))
+        m = re.fullmatch(r"\{([^}]+)\}\s*(!?=)\s*'([^']*)'", formula)
+        if m:
+            equal = str(record["fields"].get(m.group(1), "")) == m.group(3)
+            return equal if m.group(2) == "=" else not equal
+        raise ValueError(f"Formel nicht unterstützt: {formula}")
+
+
+def _split_args(args: str) -> List[str]:
+    """Teilt 'a, B(c, d)' an Kommas auf oberster Ebene."""
+    parts, depth, current, in_string = [], 0, [], False
+    for ch in args:
+        if ch == "'":
+            in_string = not in_string
+        elif not in_string and ch == "(":
+            depth += 1
+        elif not in_string and ch == ")":
+            depth -= 1
+        elif not in_string and ch == "," and depth == 0:
+            parts.append("".join(current))
+            current = []
+            continue
+        current.append(ch)
+    parts.append("".join(current))
+    return parts
+
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
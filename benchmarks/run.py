@@ -0,0 +1,350 @@
+"""
+Offline-Benchmark für Story- und Art-Modus.
+
+Startet lokale Stand-ins für Ollama, ComfyUI und Airtable (benchmarks/fake_servers.py), biegt die
+Konfiguration per Umgebungsvariablen darauf um und fährt `run_story_mode` und `run_art_mode`
+aus main.py komplett durch. Gemessen werden Bücher/Stunde, Szenen/Stunde, Zeit bis zur ersten
+Szene bzw. zum ersten Bild und der Overhead je Stufe (alles, was nicht Token-Generierung bzw. Rendern ist).
+
+Nutzung (aus dem Projekt-Root):
+    python -m benchmarks.run
+    python -m benchmarks.run --books 3 --token-rate 40 --render-latency 2 --store airtable
+    python -m benchmarks.run --comfy-nodes 3     # Art-Modus über einen ComfyPool mit 3 Instanzen
+    python -m benchmarks.run --batch-size 8      # ein ComfyUI Prompt pro Buch
+    python -m benchmarks.run --stall-every 5     # jeder 5. Prompt hängt, der Watchdog muss ihn neu starten
+    python -m benchmarks.run --with-cache        # Story- und Bild-Cache an (Default: aus, jeder Lauf rechnet alles)
+    python -m benchmarks.run --compare benchmarks/results/<alt>.json
+
+Die Ergebnisse landen als JSON in benchmarks/results/ und lassen sich zwischen Versionen vergleichen.
+"""
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from benchmarks.fake_servers import FakeOllama, FakeComfy, FakeAirtable  # noqa: E402
+
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+
+# Minimaler SDXL-artiger Workflow, wie ihn WorkflowTemplate erwartet (KSampler, Prompts, Latent, SaveImage)
+BENCH_WORKFLOW = {
+    "3": {"class_type": "KSampler", "inputs": {"seed": 1, "steps": 20, "cfg": 7, "sampler_name": "euler",
+                                               "scheduler": "normal", "denoise": 1, "model": ["4", 0],
+                                               "positive": ["6", 0], "negative": ["7", 0],
+                                               "latent_image": ["5", 0]}},
+    "4": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "bench.safetensors"}},
+    "5": {"class_type": "EmptyLatentImage", "inputs": {"width": 1024, "height": 1024, "batch_size": 1}},
+    "6": {"class_type": "CLIPTextEncode", "inputs": {"text": "", "clip": ["4", 1]}},
+    "7": {"class_type": "CLIPTextEncode", "inputs": {"text": "blurry", "clip": ["4", 1]}},
+    "8": {"class_type": "VAEDecode", "inputs": {"samples": ["3", 0], "vae": ["4", 2]}},
+    "9": {"class_type": "SaveImage", "inputs": {"filename_prefix": "ComfyUI", "images": ["8", 0]}},
+}
+
+TOPICS = [
+    "Ein Drache lernt tanzen",
+    "Die mutige kleine Schnecke",
+    "Ein Igel sucht seinen Schatten",
+    "Der Mond hat Schluckauf",
+    "Eine Wolke will Regenbogen sein",
+]
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def prepare_environment(workdir: Path, ollama: FakeOllama, comfy: FakeComfy, airtable: FakeAirtable, store: str,
+                        extra_comfy: List[FakeComfy] = (), with_cache: bool = False):
+    """
+    Biegt config.py auf die Fakes und ein temporäres Datenverzeichnis um (vor dem Import von main).
+    Story- und Bild-Cache sind aus, außer mit `with_cache`: sonst misst der Lauf Cache-Treffer statt Ollama & ComfyUI.
+    """
+    workflows = workdir / "workflows"
+    workflows.mkdir()
+    (workflows / "comfy_workflow_api.json").write_text(json.dumps(BENCH_WORKFLOW), encoding="utf-8")
+    (workdir / "output").mkdir()
+
+    os.environ.update({
+        "KIDSBOOK_DATA_DIR": str(workdir),
+        "KIDSBOOK_WORKFLOWS_DIR": str(workflows),
+        "OLLAMA_BASE_URL": ollama.url,
+        "COMFY_URL": comfy.url,
+        "COMFY_WS_URL": comfy.url.replace("http", "ws", 1) + "/ws",
+        "COMFY_URLS": ",".join(c.url for c in [comfy, *extra_comfy]),
+        "AIRTABLE_ENDPOINT_URL": airtable.url,
+        "AIRTABLE_API_KEY": "patBenchmark",
+        "AIRTABLE_BASE_ID": "appBenchmark",
+        "USE_JOB_STORE": "1" if store == "jobstore" else "0",
+        "AIRTABLE_RETRY_SECONDS": "1",  # Die Fake-Sperre nach 429 dauert 1s, nicht 30s wie bei Airtable
+        "STORY_CACHE_ENABLED": "1" if with_cache else "0",
+        "IMAGE_CACHE_ENABLED": "1" if with_cache else "0",
+    })
+
+
+def _first_after(times: List[float], start: float) -> Optional[float]:
+    later = [t for t in times if t >= start]
+    return min(later) - start if later else None
+
+
+def _mean(values: List[float]) -> Optional[float]:
+    values = [v for v in values if v is not None]
+    return round(sum(values) / len(values), 3) if values else None
+
+
+def _pairs(server, start_event: str, end_event: str, key: str) -> Dict[str, List[float]]:
+    """Ordnet Start- und End-Events per Schlüssel (Thema / prompt_id) zu: key -> [start, end]."""
+    spans: Dict[str, List[float]] = {}
+    for t, name, data in list(server.events):
+        if name == start_event:
+            spans.setdefault(data[key], [t, None])
+        elif name == end_event and data[key] in spans:
+            spans[data[key]][1] = t
+    return spans
+
+
+def bench_story(main, ollama: FakeOllama, airtable: FakeAirtable, topics: List[str]) -> Dict:
+    books = []
+    start = time.monotonic()
+    for topic in topics:
+        book_start = time.monotonic()
+        ok = True
+        try:
+            main.run_story_mode(topic)
+        except SystemExit:
+            ok = False
+        book_end = time.monotonic()
+
+        spans = [s for t, s in _pairs(ollama, "generate_start", "generate_end", "topic").items()
+                 if s[0] >= book_start and s[1] is not None]
+        generation = sum(end - begin for begin, end in spans)
+        unload = _first_after(ollama.times("unload"), book_start)
+        last_token = max((end for _, end in spans), default=None)
+        books.append({
+            "topic": topic,
+            "ok": ok,
+            "wall_s": round(book_end - book_start, 3),
+            "generation_s": round(generation, 3),
+            "first_token_s": round(spans[0][0] - book_start, 3) if spans else None,
+            # Erste Szene in Airtable sichtbar (bei Job Store: nach dem Sync)
+            "first_scene_s": _round(_first_after(_scene_creates(airtable), book_start)),
+            "save_tail_s": _round(book_start + unload - last_token) if unload is not None and last_token else None,
+            "unload_s": _round(book_end - (book_start + unload)) if unload is not None else None,
+        })
+    wall = time.monotonic() - start
+
+    ok_books = sum(1 for b in books if b["ok"])
+    generation = sum(b["generation_s"] for b in books)
+    return {
+        "books": ok_books,
+        "failed": len(books) - ok_books,
+        "wall_s": round(wall, 3),
+        "books_per_hour": round(ok_books / wall * 3600, 1) if wall else None,
+        "generation_s": round(generation, 3),
+        "overhead_s": round(wall - generation, 3),
+        "overhead_per_book_s": round((wall - generation) / len(books), 3) if books else None,
+        "time_to_first_scene_s": _mean([b["first_scene_s"] for b in books]),
+        "stages_per_book_s": {
+            "first_token": _mean([b["first_token_s"] for b in books]),
+            "generation": _mean([b["generation_s"] for b in books]),
+            "save_tail": _mean([b["save_tail_s"] for b in books]),
+            "unload": _mean([b["unload_s"] for b in books]),
+        },
+        "per_book": books,
+    }
+
+
+def _scene_creates(airtable: FakeAirtable) -> List[float]:
+    return [t for t, name, data in list(airtable.events) if name == "create" and data.get("table") == "Scenes"]
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
+
+
+def bench_art(main, comfys: List[FakeComfy], concurrency: int, batch_size: int) -> Dict:
+    start = time.monotonic()
+    scenes = main.run_art_mode(concurrency=concurrency, batch_size=batch_size)
+    wall = time.monotonic() - start
+
+    renders, gaps = [], []
+    for comfy in comfys:
+        node_renders = sorted(s for s in _pairs(comfy, "render_start", "render_end", "prompt_id").values()
+                              if s[0] >= start and s[1] is not None)
+        renders += node_renders
+        gaps += [b[0] - a[1] for a, b in zip(node_renders, node_renders[1:])]
+    renders.sort()
+    # Downloads laufen über eine beliebige Instanz (server_address des Jobs), daher über alle zählen
+    downloads = [t for comfy in comfys for t in comfy.times("view") if t >= start]
+    busy = sum(end - begin for begin, end in renders)
+    return {
+        "nodes": len(comfys),
+        # Fertige Szenen laut Pipeline (inkl. Bild-Cache), nicht die Zahl der ComfyUI Prompts oder Downloads
+        "scenes": scenes,
+        "downloads": len(downloads),
+        "wall_s": round(wall, 3),
+        "scenes_per_hour": round(scenes / wall * 3600, 1) if wall and scenes else 0.0,
+        "gpu_busy_s": round(busy, 3),
+        "gpu_utilization": round(busy / (wall * len(comfys)), 3) if wall else None,
+        "overhead_s": round(wall - busy, 3),
+        "overhead_per_scene_s": round((wall - busy) / scenes, 3) if scenes else None,
+        "time_to_first_render_s": _round(renders[0][0] - start) if renders else None,
+        "time_to_first_image_s": _round(min(downloads) - start) if downloads else None,
+        "stalls": sum(len([t for t in comfy.times("stall") if t >= start]) for comfy in comfys),
+        "stalls_interrupted": sum(len([t for t in comfy.times("interrupted") if t >= start]) for comfy in comfys),
+        "stages_s": {
+            "startup": _round(renders[0][0] - start) if renders else None,
+            "render": round(busy, 3),
+            "gpu_idle_between_renders": round(sum(gaps), 3),
+            "tail": _round(start + wall - max(end for _, end in renders)) if renders else None,
+        },
+    }
+
+
+def run(args) -> Dict:
+    ollama = FakeOllama(token_rate=args.token_rate, scenes=args.scenes).start()
+    comfys = [FakeComfy(render_latency=args.render_latency, prompt_overhead=args.prompt_overhead,
+                        stall_every=args.stall_every).start()
+              for _ in range(max(1, args.comfy_nodes))]
+    airtable = FakeAirtable(rate_limit=args.airtable_rate).start()
+    topics = (TOPICS * (args.books // len(TOPICS) + 1))[:args.books]
+
+    with tempfile.TemporaryDirectory(prefix="kidsbook-bench-") as tmp:
+        workdir = Path(tmp)
+        prepare_environment(workdir, ollama, comfys[0], airtable, args.store, comfys[1:], args.with_cache)
+        if args.stall_every:
+            # Watchdog auf Benchmark-Maßstab: Sekunden statt Minuten bis zum Stall
+            os.environ.update({"COMFY_WATCHDOG_INTERVAL": "0.2", "COMFY_STALL_MIN_SECONDS": "1",
+                               "COMFY_STALL_MAX_SECONDS": str(max(2.0, args.render_latency * 2)),
+                               "COMFY_STALL_GRACE_SECONDS": "0.5"})
+        log_path = workdir / "bench.log"
+
+        # Logs und Token-Echo in eine Datei statt auf die Konsole
+        with open(log_path, "w", encoding="utf-8") as log, contextlib.redirect_stdout(log):
+            import main  # erst jetzt: config.py liest die Umgebungsvariablen beim Import
+            if args.concurrency is None:
+                args.concurrency = main.COMFY_MAX_INFLIGHT
+            story = bench_story(main, ollama, airtable, topics)
+            if args.batch_size is None:
+                args.batch_size = main.COMFY_BATCH_SIZE
+            art = bench_art(main, comfys, args.concurrency, args.batch_size)
+
+        if args.keep_log:
+            target = Path(args.keep_log)
+            target.write_text(log_path.read_text(encoding="utf-8"), encoding="utf-8")
+
+    for server in (ollama, *comfys, airtable):
+        server.stop()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git": git_revision(),
+            "python": sys.version.split()[0],
+        },
+        "params": {
+            "books": args.books, "scenes": args.scenes, "token_rate": args.token_rate,
+            "render_latency": args.render_latency, "airtable_rate": args.airtable_rate,
+            "concurrency": args.concurrency, "store": args.store, "comfy_nodes": len(comfys),
+            "batch_size": args.batch_size, "prompt_overhead": args.prompt_overhead,
+            "stall_every": args.stall_every, "with_cache": args.with_cache,
+        },
+        "story": story,
+        "art": art,
+        "airtable": {"requests": airtable.requests, "throttled": airtable.throttled},
+    }
+
+
+def _flatten(data: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(old: Dict, new: Dict):
+    """Druckt die Kennzahlen zweier Läufe nebeneinander (ohne per_book Details)."""
+    old_flat = _flatten({k: old[k] for k in ("story", "art", "airtable") if k in old})
+    new_flat = _flatten({k: new[k] for k in ("story", "art", "airtable") if k in new})
+    print(f"\n{'Kennzahl':<42}{old['meta'].get('git') or 'alt':>12}{new['meta'].get('git') or 'neu':>12}{'Δ':>10}")
+    for name in sorted(set(old_flat) | set(new_flat)):
+        a, b = old_flat.get(name), new_flat.get(name)
+        delta = f"{(b - a) / a * 100:+.1f}%" if a and b is not None else ""
+        print(f"{name:<42}{_fmt(a):>12}{_fmt(b):>12}{delta:>10}")
+    if old.get("params") != new.get("params"):
+        print("⚠️ Unterschiedliche Parameter – Werte nur bedingt vergleichbar.")
+
+
+def _fmt(value) -> str:
+    return "-" if value is None else f"{value:g}"
+
+
+def summary(result: Dict):
+    story, art, airtable = result["story"], result["art"], result["airtable"]
+    print(f"📖 Story: {story['books']} Bücher in {story['wall_s']}s -> {story['books_per_hour']} Bücher/h, "
+          f"Overhead {story['overhead_per_book_s']}s/Buch, erste Szene nach {story['time_to_first_scene_s']}s")
+    print(f"🎨 Art:   {art['scenes']} Szenen ({art.get('downloads', art['scenes'])} gerendert & geladen) "
+          f"in {art['wall_s']}s -> {art['scenes_per_hour']} Szenen/h, "
+          f"GPU {art['gpu_utilization']:.0%} ausgelastet ({art.get('nodes', 1)} Instanzen), erstes Bild nach {art['time_to_first_image_s']}s")
+    if art.get("stalls"):
+        print(f"⏰ Stalls: {art['stalls']} hängende Prompts, {art['stalls_interrupted']} per /interrupt abgebrochen")
+    print(f"📇 Airtable: {airtable['requests']} Requests, {airtable['throttled']} mit 429 beantwortet")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline-Benchmark (Fake Ollama, ComfyUI & Airtable)")
+    parser.add_argument("--books", type=int, default=2, help="Anzahl Bücher im Story-Modus")
+    parser.add_argument("--scenes", type=int, default=8, help="Szenen pro Buch")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="Fake Ollama Tokens/s")
+    parser.add_argument("--render-latency", type=float, default=1.5, help="Fake ComfyUI Sekunden pro Bild")
+    parser.add_argument("--airtable-rate", type=int, default=5, help="Fake Airtable Requests/s bis 429")
+    parser.add_argument("--concurrency", type=int, default=None, help="Art-Modus --concurrency (Default: config)")
+    parser.add_argument("--prompt-overhead", type=float, default=0.3,
+                        help="Fake ComfyUI Sekunden pro Prompt (Validierung, Scheduling) zusätzlich zum Rendern")
+    parser.add_argument("--batch-size", type=int, default=None, help="Art-Modus --batch-size (Default: config)")
+    parser.add_argument("--comfy-nodes", type=int, default=1, help="Anzahl Fake ComfyUI Instanzen (COMFY_URLS)")
+    parser.add_argument("--stall-every", type=int, default=0,
+                        help="Jeder n-te Fake ComfyUI Prompt hängt bis /interrupt (0 = nie)")
+    parser.add_argument("--with-cache", action="store_true",
+                        help="Story- und Bild-Cache wie im Betrieb nutzen (Default: aus, alles wird neu berechnet)")
+    parser.add_argument("--store", choices=["jobstore", "airtable"], default="jobstore",
+                        help="Lokaler Job Store oder direkter Airtable-Zugriff")
+    parser.add_argument("--output", type=str, default=None, help="Ergebnis-Datei (Default: benchmarks/results/)")
+    parser.add_argument("--compare", type=str, default=None, help="Älteres Ergebnis zum Vergleich")
+    parser.add_argument("--keep-log", type=str, default=None, help="Log des Laufs hierhin kopieren")
+    args = parser.parse_args()
+
+    result = run(args)
+
+    output = Path(args.output) if args.output else \
+        RESULTS_DIR / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{result['meta']['git'] or 'local'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    summary(result)
+    print(f"💾 Ergebnis gespeichert: {output}")
+
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text(encoding="utf-8")), result)
+
+
+if __name__ == "__main__":
+    main()
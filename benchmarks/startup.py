@@ -0,0 +1,117 @@
+"""
+Startzeit-Benchmark für die CLI.
+
+Scheduler, Cron-Wrapper und Health Checks rufen main.py sehr oft auf, jeder Aufruf zahlt den Kaltstart.
+Gemessen wird in frischen Interpretern:
+  - `import main` (Median über mehrere Läufe) gegen ein Budget,
+  - die Wandzeit von `main.py --help` und `main.py <modus> --help` (inkl. Python-Start),
+  - welche schweren Pakete `import main` schon lädt (dürfen erst in den Modi kommen).
+
+Nutzung (aus dem Projekt-Root):
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 20 --budget 0.1
+
+Exit-Code 1, wenn das Budget gerissen wird oder ein schweres Paket beim Import mitkommt.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Import von main.py (ohne Python-Start) in Sekunden
+IMPORT_BUDGET_SECONDS = 0.15
+# Diese Pakete gehören in die Modi, nicht in den Import von main.py
+HEAVY_MODULES = ["requests", "websocket", "pyairtable", "pydantic", "asyncio", "PIL", "dotenv"]
+COMMANDS = [["--help"], ["art", "--help"], ["book", "--help"]]
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "modules": [m for m in %r if m in sys.modules]}))
+"""
+
+
+def _env() -> Dict[str, str]:
+    env = dict(os.environ)
+    env["METRICS_ENABLED"] = "0"  # Kein Trace/Textfile aus den Probe-Prozessen
+    env.pop("PYTHONPROFILEIMPORTTIME", None)
+    return env
+
+
+def probe_import() -> Dict:
+    out = subprocess.run([sys.executable, "-c", _PROBE % (HEAVY_MODULES,)], cwd=ROOT, env=_env(),
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def time_command(args: List[str]) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "main.py", *args], cwd=ROOT, env=_env(),
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+
+def heaviest_imports(limit: int = 8) -> List[Tuple[str, float]]:
+    """Module unter main mit der größten kumulierten Importzeit (python -X importtime)."""
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=ROOT, env=_env(),
+                         capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in err.splitlines():
+        match = re.match(r"import time:\s+\d+\s+\|\s+(\d+)\s+\|\s(\s*)(\S+)", line)
+        if not match:
+            continue
+        depth, name, seconds = len(match.group(2)) // 2, match.group(3), int(match.group(1)) / 1e6
+        # importtime listet Kinder vor dem Eltern-Modul: alles seit dem letzten Top-Level-Import gehört zu main
+        if depth == 0:
+            if name == "main":
+                return sorted(rows, key=lambda row: row[1], reverse=True)[:limit]
+            rows = []
+        elif depth == 1:
+            rows.append((name, seconds))
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startzeit-Benchmark der CLI (Import-Budget)")
+    parser.add_argument("--runs", type=int, default=10, help="Läufe pro Messung (Median)")
+    parser.add_argument("--budget", type=float, default=IMPORT_BUDGET_SECONDS,
+                        help="Budget für `import main` in Sekunden")
+    args = parser.parse_args()
+
+    probe_import()  # Erster Lauf schreibt die .pyc Dateien
+    probes = [probe_import() for _ in range(args.runs)]
+    import_s = statistics.median(p["seconds"] for p in probes)
+    heavy = sorted({m for p in probes for m in p["modules"]})
+
+    print(f"📦 import main: {import_s * 1000:.1f}ms (Median aus {args.runs}, Budget {args.budget * 1000:.0f}ms)")
+    for command in COMMANDS:
+        wall = statistics.median(time_command(command) for _ in range(args.runs))
+        print(f"⏱  main.py {' '.join(command):<14} {wall * 1000:7.1f}ms (inkl. Python-Start)")
+    print("🔍 Teuerste Imports unter main:")
+    for name, seconds in heaviest_imports():
+        print(f"   {name:<28}{seconds * 1000:7.1f}ms")
+
+    ok = True
+    if heavy:
+        print(f"❌ Schwere Pakete schon beim Import geladen: {', '.join(heavy)}")
+        ok = False
+    if import_s > args.budget:
+        print(f"❌ Import-Budget überschritten: {import_s * 1000:.1f}ms > {args.budget * 1000:.0f}ms")
+        ok = False
+    if ok:
+        print("✅ Startzeit im Budget.")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,150 @@
 import os
 from pathlib import Path
-from dotenv import load_dotenv
-
-# Lade Umgebungsvariablen aus .env Datei
-load_dotenv()
 
 # Base Paths
 BASE_DIR = Path(__file__).parent.resolve()
-OUTPUT_DIR = BASE_DIR / "output"
-WORKFLOWS_DIR = BASE_DIR / "workflows"
+
+
+def _find_env_file():
+    """Sucht die .env wie find_dotenv: im Projektordner und darüber."""
+    for directory in (BASE_DIR, *BASE_DIR.parents):
+        candidate = directory / ".env"
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+# Lade Umgebungsvariablen aus .env Datei. python-dotenv (~20ms Import) nur laden, wenn es eine gibt:
+# Cron, Health Checks & Container setzen die Variablen oft direkt.
+_ENV_FILE = _find_env_file()
+if _ENV_FILE is not None:
+    from dotenv import load_dotenv
+    load_dotenv(_ENV_FILE)
+
+# Arbeitsdaten (Bilder, Job Store, Cursor, Queues). Per KIDSBOOK_DATA_DIR umlenkbar, z.B. für Benchmarks.
+DATA_DIR = Path(os.getenv("KIDSBOOK_DATA_DIR", BASE_DIR))
+OUTPUT_DIR = DATA_DIR / "output"
+WORKFLOWS_DIR = Path(os.getenv("KIDSBOOK_WORKFLOWS_DIR", BASE_DIR / "workflows"))
 
 # Airtable Settings
 AIRTABLE_API_KEY = os.getenv("AIRTABLE_API_KEY")
 AIRTABLE_BASE_ID = os.getenv("AIRTABLE_BASE_ID")
+AIRTABLE_ENDPOINT_URL = os.getenv("AIRTABLE_ENDPOINT_URL", "https://api.airtable.com")
 AIRTABLE_TABLE_BOOKS = "Books"
 AIRTABLE_TABLE_SCENES = "Scenes"
+AIRTABLE_RATE_LIMIT = 5          # Requests pro Sekunde (Airtable Limit pro Base)
+AIRTABLE_RETRY_SECONDS = float(os.getenv("AIRTABLE_RETRY_SECONDS", "30"))  # Wartezeit nach 429 (Airtable sperrt 30s)
+AIRTABLE_BATCH_SIZE = 10         # Max. Records pro Batch-Request (Airtable Limit)
+AIRTABLE_FLUSH_INTERVAL = 1.0    # Sekunden, bis ein unvollständiger Batch trotzdem geschrieben wird
+AIRTABLE_PAGE_SIZE = 100         # Records pro Seite beim Lesen (Airtable Maximum)
+AIRTABLE_CURSOR_FILE = DATA_DIR / ".airtable_cursor.json"  # Cursor für inkrementelle Art-Läufe
+
+# Lokaler Job Store (SQLite) als Source of Truth, Airtable wird im Hintergrund synchronisiert.
+# USE_JOB_STORE=0 in der .env schaltet zurück auf direkten Airtable-Zugriff.
+USE_JOB_STORE = os.getenv("USE_JOB_STORE", "1") == "1"
+JOB_STORE_PATH = DATA_DIR / "jobs.sqlite3"
+JOB_STORE_PUSH_INTERVAL = 5      # Sekunden zwischen zwei Pushes nach Airtable (spätestens)
+JOB_STORE_PULL_INTERVAL = 60     # Sekunden zwischen zwei Pulls aus Airtable (Änderungen aus der UI)
+JOB_STORE_RECONCILE_INTERVAL = 3600  # Sekunden zwischen zwei Abgleichen aller Szenen-IDs (in der UI gelöschte Szenen)
+SCENE_LEASE_SECONDS = 900        # So lange gehört eine Szene im Art-Modus einem Lauf ('In Progress')
+SCENE_LEASE_RENEW_SECONDS = 120  # Solange ihr Job läuft, verlängert der Lauf den Lease in diesem Takt (und bei jedem Neustart)
+SCENE_MAX_ATTEMPTS = 3           # Nach so vielen Fehlschlägen bekommt eine Szene den Status 'Failed'
+SCENE_RETRY_BACKOFF_SECONDS = 300  # Wartezeit vor dem nächsten Versuch, verdoppelt sich mit jedem Fehlschlag
+# Direkter Airtable-Modus: Wartezeit zwischen Lease schreiben und zurücklesen (gleichzeitige Läufe überschreiben sich)
+AIRTABLE_LEASE_SETTLE_SECONDS = float(os.getenv("AIRTABLE_LEASE_SETTLE_SECONDS", "1.0"))
+
+# HTTP zu Ollama & ComfyUI (modules/transport.py): eine Keep-Alive Session pro Host, Timeouts, Retries
+HTTP_CONNECT_TIMEOUT = 5          # Sekunden für den Verbindungsaufbau
+HTTP_READ_TIMEOUT = 60            # Sekunden ohne Daten, bevor ein Request abbricht
+HTTP_POOL_SIZE = 16               # Offene Verbindungen pro Host (Render-Threads + Downloads)
+HTTP_RETRIES = 3                  # Wiederholungen idempotenter Requests (GET, /free, Ollama Entladen)
+HTTP_BACKOFF_SECONDS = 0.5        # Erste Wartezeit vor einer Wiederholung, verdoppelt sich pro Versuch
+HTTP_BACKOFF_MAX_SECONDS = 8
+HTTP_DOWNLOAD_CHUNK_BYTES = 1024 * 1024  # Bilder werden blockweise auf die Platte gestreamt
 
 # Ollama Settings (Text Engine)
-OLLAMA_BASE_URL = "http://localhost:11434"
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 OLLAMA_API_GENERATE = f"{OLLAMA_BASE_URL}/api/generate"
+OLLAMA_API_PS = f"{OLLAMA_BASE_URL}/api/ps"
 OLLAMA_MODEL = "llama3.1"
+OLLAMA_READ_TIMEOUT = 300        # Modell laden bis zum ersten Token kann bei kaltem VRAM dauern
+OLLAMA_BATCH_KEEP_ALIVE = "30m"  # Modell bleibt im Batch-Modus zwischen den Büchern geladen
+# Parallele Story-Generierungen im Batch-Modus. Ollama muss mit gleichem OLLAMA_NUM_PARALLEL laufen.
+OLLAMA_NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "1"))
+
+# Story-Validierung (Streaming Early-Abort)
+STORY_MIN_SCENES = 8                 # Weniger Szenen = ungültige Story
+STORY_MAX_ATTEMPTS = 3               # Max. Generierungsversuche pro Thema
+STORY_RETRY_TEMPERATURE_STEP = 0.1   # Temperatur-Erhöhung pro Wiederholung
+
+# Story-Cache: validierte Stories pro (Modell, System-Prompt, Thema, Optionen), umgehen mit --no-cache
+STORY_CACHE_ENABLED = os.getenv("STORY_CACHE_ENABLED", "1") == "1"
+STORY_CACHE_DIR = DATA_DIR / "cache" / "stories"
+STORY_CACHE_TTL_DAYS = 30
+STORY_CACHE_MAX_ENTRIES = 1000
 
 # ComfyUI Settings (Image Engine)
-COMFY_URL = "http://127.0.0.1:8188"
-COMFY_WS_URL = "ws://127.0.0.1:8188/ws"
+COMFY_URL = os.getenv("COMFY_URL", "http://127.0.0.1:8188")
+COMFY_WS_URL = os.getenv("COMFY_WS_URL", COMFY_URL.replace("http", "ws", 1) + "/ws")
+# Mehrere GPU-Rechner: kommagetrennte Liste (z.B. "http://gpu1:8188,http://gpu2:8188"), Default nur COMFY_URL
+COMFY_URLS = [url.strip() for url in os.getenv("COMFY_URLS", "").split(",") if url.strip()] or [COMFY_URL]
+COMFY_WORKFLOW = "comfy_workflow_api.json"  # Standard-Workflow in WORKFLOWS_DIR
+COMFY_MAX_INFLIGHT = 3  # So viele Prompts liegen gleichzeitig in der ComfyUI Queue (GPU läuft ohne Pause durch), pro Instanz
+# Szenen eines Buchs pro ComfyUI Prompt (1 = jede Szene einzeln). Größer spart Validierung, Scheduling & Modell-Checks
+# pro Prompt, hält aber alle Zwischenbilder des Batches im Speicher -> bei 6GB VRAM klein halten
+COMFY_BATCH_SIZE = int(os.getenv("COMFY_BATCH_SIZE", "1"))
+COMFY_NODE_TIMEOUT = 5  # Sekunden für den /queue Check beim Verteilen; wer nicht antwortet, gilt als ausgefallen
+COMFY_NODE_RETRY_SECONDS = 60  # So lange wird eine ausgefallene Instanz übergangen, bevor sie es wieder versucht
+COMFY_QUEUE_DEPTH_TTL = 2.0    # So lange gilt die /queue Länge einer Instanz beim Verteilen, dazwischen zählen eigene Jobs
+# Stall-Watchdog: ein Job ohne Events (Fortschritt, Node-Wechsel) gilt nach einem adaptiven Timeout als hängend
+# (COMFY_STALL_STEP_FACTOR x gemessene Sekunden pro Sampler-Schritt, begrenzt auf MIN..MAX). Dann: /interrupt,
+# aus /queue löschen, WebSocket neu verbinden und neu einreihen, höchstens COMFY_STALL_RETRIES mal pro Job.
+COMFY_WATCHDOG_INTERVAL = float(os.getenv("COMFY_WATCHDOG_INTERVAL", "5"))    # Sekunden zwischen zwei Checks
+COMFY_STALL_STEP_FACTOR = 20
+COMFY_STALL_MIN_SECONDS = float(os.getenv("COMFY_STALL_MIN_SECONDS", "120"))  # VAE Decode, Upscale & Co. melden keine Schritte
+COMFY_STALL_MAX_SECONDS = float(os.getenv("COMFY_STALL_MAX_SECONDS", "600"))  # Gilt auch, solange keine Schrittzeit bekannt ist
+COMFY_STALL_GRACE_SECONDS = float(os.getenv("COMFY_STALL_GRACE_SECONDS", "30"))  # Nach Reconnect: so lange muss er still bleiben
+COMFY_STALL_RETRIES = 2
+ART_DOWNLOAD_WORKERS = 2  # Parallele Bild-Downloads in der Art-Pipeline
+# Seed pro Bild: "prompt" = aus dem Prompt abgeleitet (reproduzierbar, Cache greift bei Reruns), "random" = wie früher
+IMAGE_SEED_POLICY = os.getenv("IMAGE_SEED_POLICY", "prompt")
+# Bild-Cache (Prompt + Seed + Workflow -> PNG), prozessübergreifend auf der Platte, LRU-begrenzt
+IMAGE_CACHE_ENABLED = os.getenv("IMAGE_CACHE_ENABLED", "1") == "1"
+IMAGE_CACHE_DIR = DATA_DIR / "cache" / "images"
+IMAGE_CACHE_MAX_MB = int(os.getenv("IMAGE_CACHE_MAX_MB", "2048"))
+
+# Buch-Export (main.py book): PDF pro Buch, Seitenbilder verkleinert & als JPEG im Seiten-Cache
+BOOKS_DIR = DATA_DIR / "books"
+PAGE_CACHE_DIR = DATA_DIR / "cache" / "pages"
+PDF_IMAGE_MAX_PX = 1600   # Längste Bildkante im PDF (~200 dpi bei 20cm Bildbreite)
+PDF_JPEG_QUALITY = 85
+PDF_WORKERS = os.cpu_count() or 1  # Prozesse für Verkleinern & JPEG-Encoding
 
 # Hardware Constraints
-VRAM_COOLDOWN_SECONDS = 10
\ No newline at end of file
+VRAM_COOLDOWN_SECONDS = 10      # Nur noch Fallback, wenn der Handoff-Check nicht bestätigt werden kann
+VRAM_HANDOFF_TIMEOUT = 30       # Max. Wartezeit auf Ollama-Unload bzw. freien ComfyUI VRAM
+VRAM_POLL_INTERVAL = 0.5        # Poll-Intervall für /api/ps und /system_stats
+COMFY_MIN_FREE_VRAM_MB = 4000   # So viel VRAM (frei + von ComfyUI belegt) vor dem Art Modus, falls Ollama noch lädt
+
+# Scheduler (main.py serve): wechselt die GPU je nach Queue-Tiefe zwischen Story und Art
+TOPIC_QUEUE_FILE = DATA_DIR / "topics_queue.txt"     # Ein Thema pro Zeile, wird abgearbeitet
+TOPIC_FAILED_FILE = DATA_DIR / "topics_failed.txt"   # Themen, deren Generierung fehlschlug
+SCHEDULER_STORY_HIGH_WATERMARK = 3    # Ab so vielen Themen lohnt sich ein Wechsel zu Ollama
+SCHEDULER_STORY_LOW_WATERMARK = 0
+SCHEDULER_ART_HIGH_WATERMARK = 24     # Ab so vielen offenen Szenen lohnt sich ein Wechsel zu ComfyUI
+SCHEDULER_ART_LOW_WATERMARK = 4
+SCHEDULER_MIN_DWELL_SECONDS = 300     # Mindestdauer einer Phase
+SCHEDULER_MAX_DWELL_SECONDS = 3600    # Danach wird gewechselt, sobald die andere Queue Arbeit hat
+SCHEDULER_MAX_IDLE_WAIT_SECONDS = 900 # Kleine Queues werden spätestens nach dieser Wartezeit abgearbeitet
+SCHEDULER_POLL_SECONDS = 30           # Poll-Intervall im Leerlauf
+SCHEDULER_ART_CHUNK = 8               # Szenen pro Arbeitseinheit im Art-Modus
+SCHEDULER_ART_DEPTH_SECONDS = 60      # So lange gilt die gezählte Zahl offener Szenen (neu gezählt auch nach Art-Arbeit)
+
+# Metriken: Timing-Spans als JSON-Lines Trace + Prometheus Textfile (Aggregate) pro Lauf.
+# METRICS_ENABLED=0 schaltet das Schreiben der Dateien ab (--profile funktioniert trotzdem).
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_DIR = DATA_DIR / "metrics"
+METRICS_TRACE_FILE = METRICS_DIR / "trace.jsonl"
+METRICS_TRACE_MAX_BYTES = int(os.getenv("METRICS_TRACE_MAX_BYTES", str(50 * 1024 * 1024)))  # Danach -> trace.jsonl.1
+METRICS_PROM_FILE = METRICS_DIR / "kidsbook.prom"   # Pro Befehl eine eigene Datei: kidsbook_<befehl>.prom
+METRICS_WRITE_SECONDS = 60                          # Lange Läufe (serve, art) schreiben das Textfile in diesem Takt
\ No newline at end of file
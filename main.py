@@ -1,145 +1,488 @@
 import argparse
+import itertools
 import sys
 import time
-from modules.llm_engine import OllamaClient
-from modules.image_engine import ComfyClient
-from modules.airtable_client import AirtableClient
-from modules.utils import setup_logging
+from typing import TYPE_CHECKING, List, Dict, Iterable, Union
+from config import (
+    USE_JOB_STORE, JOB_STORE_PATH,
+    COMFY_MAX_INFLIGHT, COMFY_BATCH_SIZE, OLLAMA_BATCH_KEEP_ALIVE, OLLAMA_NUM_PARALLEL,
+    TOPIC_QUEUE_FILE, TOPIC_FAILED_FILE, SCHEDULER_STORY_HIGH_WATERMARK, SCHEDULER_STORY_LOW_WATERMARK,
+    SCHEDULER_ART_HIGH_WATERMARK, SCHEDULER_ART_LOW_WATERMARK, SCHEDULER_MIN_DWELL_SECONDS,
+    SCHEDULER_MAX_DWELL_SECONDS, SCHEDULER_MAX_IDLE_WAIT_SECONDS, SCHEDULER_POLL_SECONDS, SCHEDULER_ART_CHUNK,
+    SCHEDULER_ART_DEPTH_SECONDS,
+    PDF_WORKERS
+)
+from modules.utils import setup_logging, Lazy
+from modules.metrics import metrics
+
+# Die Subsysteme (requests, websocket, pyairtable, asyncio, Pillow) werden erst in den Modi importiert,
+# die sie brauchen: `--help`, Tippfehler und Cron-/Health-Check-Aufrufe starten so ohne ~1s Import-Zeit.
+# benchmarks/startup.py prüft das Budget.
+if TYPE_CHECKING:
+    from modules.llm_engine import OllamaClient
+    from modules.image_engine import ComfyClient
+    from modules.comfy_pool import ComfyPool
+    from modules.airtable_client import AirtableClient
+    from modules.job_store import JobStore
 
 logger = setup_logging("Main")
 
-def run_story_mode(topic: str):
+# Story- und Art-Modus arbeiten gegen den lokalen Job Store (mit Airtable-Sync) oder direkt gegen Airtable.
+# Beide bieten dieselben Methoden (create_book, add_scene, get_pending_scenes, update_scene_image, ...).
+SceneStore = Union["JobStore", "AirtableClient"]
+
+def open_store() -> SceneStore:
+    """Öffnet den Job Store (USE_JOB_STORE) inkl. Hintergrund-Sync, sonst den direkten Airtable Client."""
+    from modules.airtable_client import AirtableClient
+    from modules.job_store import JobStore, AirtableSyncer
+
+    airtable = AirtableClient()
+    if not USE_JOB_STORE:
+        return airtable
+    store = JobStore(JOB_STORE_PATH)
+    syncer = AirtableSyncer(store, airtable)
+    # Änderungen aus der Airtable-Oberfläche übernehmen, bevor wir lokal arbeiten
+    try:
+        syncer.pull()
+    except Exception as e:
+        logger.warning(f"⚠️ Airtable Pull fehlgeschlagen, arbeite mit lokalem Stand: {e}")
+    syncer.start()
+    return store
+
+def require_leases(store: SceneStore) -> bool:
+    """Art-Läufe ohne Leases würden dieselben Szenen doppelt malen -> dann lieber gar nicht starten."""
+    if store.check_leases():
+        return True
+    logger.error("❌ Airtable kann keine Szenen belegen. Lege in der Tabelle 'Scenes' die Felder "
+                 "'Lease Owner' (Text), 'Lease Expires' (Zahl) und 'Prompt ID' (Text) an "
+                 "oder nutze den Job Store (USE_JOB_STORE=1).")
+    return False
+
+def _discard_book(store: SceneStore, book_id: str, scene_ids: list):
+    """Verwirft ein halb gespeichertes Buch: Szenen löschen (sonst malt der Art Modus sie), Buch 'Failed'."""
+    store.flush()  # Erst alle Creates schreiben, damit wir alle Szenen-IDs kennen (Airtable-Modus)
+    if scene_ids:
+        store.delete_scenes(scene_ids)
+    store.update_book_status(book_id, "Failed")
+    store.flush()
+    logger.warning(f"⚠️ Buch {book_id} verworfen ({len(scene_ids)} Szenen gelöscht, Status 'Failed').")
+
+def save_story_stream(events, store: SceneStore, topic: str) -> str:
+    """
+    Speichert eine Story, während das LLM noch schreibt:
+    das Buch sobald der Titel steht, jede Szene sobald ihr 'image_prompt' Block fertig ist.
+    Bricht ein Versuch ab ("retry" Event) oder scheitert die Generierung, wird das halbe Buch verworfen.
+    Gibt die Airtable Book ID zurück.
+    """
+    from modules.llm_engine import StoryGenerationError
+
+    book_id = None
+    scene_ids = []     # Airtable IDs der angelegten Szenen (für das Verwerfen)
+    early_blocks = []  # Blöcke, die (ungewöhnlicherweise) vor dem Titel ankommen
+    scene_count = 0
+    current_text_buffer = ""
+
+    try:
+        for event, value in events:
+            if event == "retry":
+                # Neuer Versuch: alles vom abgebrochenen Versuch verwerfen
+                if book_id:
+                    _discard_book(store, book_id, scene_ids)
+                book_id, scene_ids, early_blocks = None, [], []
+                scene_count, current_text_buffer = 0, ""
+                continue
+            elif event == "title":
+                # Buch anlegen
+                book_id = store.create_book(value, topic)
+                logger.info(f"📚 Buch '{value}' in Airtable angelegt (ID: {book_id}).")
+                blocks, early_blocks = early_blocks, []
+            elif event == "block":
+                blocks = [value]
+            elif event == "story" and book_id is None:
+                # Titel kam nicht als String im Strom -> aus der fertigen Story nehmen
+                title = value.get("title") or "Unbekannter Titel"
+                book_id = store.create_book(str(title), topic)
+                logger.info(f"📚 Buch '{title}' in Airtable angelegt (ID: {book_id}).")
+                blocks, early_blocks = early_blocks, []
+            else:
+                continue
+
+            if book_id is None:
+                early_blocks.extend(blocks)
+                continue
+
+            # Szenen anlegen
+            for block in blocks:
+                b_type = block.get("type")
+                content = block.get("content")
+
+                if b_type == "text":
+                    current_text_buffer = content # Wir merken uns den Text für die nächste Szene
+                    # Wir gehen davon aus, dass ein "text" Block VOR einem "image_prompt" Block kommt.
+                    # Hier: Wir speichern jede "Szene" wenn ein Image Prompt kommt.
+
+                elif b_type == "image_prompt":
+                    scene_count += 1
+                    # Wir nehmen den letzten Text als Kontext für die Szene, falls vorhanden
+                    store.add_scene(
+                        book_id=book_id,
+                        scene_number=scene_count,
+                        text=current_text_buffer,
+                        image_prompt=content,
+                        on_created=scene_ids.append
+                    )
+                    logger.info(f"   + Szene {scene_count} vorgemerkt.")
+                    current_text_buffer = "" # Reset für nächsten Abschnitt
+
+        # Falls noch Text übrig ist ohne Bild (z.B. Ende), könnten wir das auch speichern,
+        # aber unser aktuelles Schema erwartet 'Image Prompt'.
+        # Wir lassen es für MVP einfach.
+
+    except StoryGenerationError:
+        if book_id:
+            _discard_book(store, book_id, scene_ids)
+        raise
+
+    # Gepufferte Szenen (10er-Batches) jetzt wirklich schreiben
+    failed = store.flush()
+    if failed:
+        raise RuntimeError(f"{failed} Szenen konnten nicht gespeichert werden")
+    return book_id
+
+def unload_if_used(llm: "OllamaClient"):
+    """Entlädt das Modell – außer alle Stories kamen aus dem Cache (ein Entlade-Request würde es erst laden)."""
+    if not llm.requests:
+        logger.info("♻️ Alle Stories aus dem Cache, Ollama wurde nicht benutzt.")
+        return
+    logger.info("🧹 Bereinige VRAM (Ollama entladen)...")
+    llm.unload_model()
+    llm.requests = 0  # Serve Mode: die nächste Story-Phase zählt neu
+
+def run_story_mode(topic: str, use_cache: bool = True):
     """
     Phase 1: Generiert Story & speichert in Airtable.
+    Szenen werden schon während der Generierung gespeichert (Streaming).
     KEINE Bildgenerierung hier -> VRAM bleibt sauber.
+    Gibt es die Story schon im Story-Cache (z.B. weil das Speichern beim letzten Mal scheiterte),
+    wird nur gespeichert. use_cache=False erzwingt eine Neu-Generierung.
     """
+    from modules.llm_engine import OllamaClient, StoryGenerationError
+
     logger.info(f"🚀 --- START: STORY MODUS (Thema: {topic}) ---")
     
     # 1. Init Clients
-    llm = OllamaClient()
-    airtable = AirtableClient()
+    llm = OllamaClient(use_cache=use_cache)
+    store = open_store()
 
-    # 2. Generierung
-    story_data = llm.generate_story(topic)
-    if not story_data:
+    # 2. Generierung & 3. Speichern in Airtable (parallel zum Token-Strom)
+    try:
+        save_story_stream(llm.stream_story(topic), store, topic)
+    except StoryGenerationError:
         logger.error("❌ Keine Story generiert. Abbruch.")
         sys.exit(1)
-
-    title = story_data.get("title", "Unbekannter Titel")
-    blocks = story_data.get("blocks", [])
-
-    # 3. Speichern in Airtable
-    try:
-        # Buch anlegen
-        book_id = airtable.create_book(title, topic)
-        logger.info(f"📚 Buch '{title}' in Airtable angelegt (ID: {book_id}).")
-
-        # Szenen anlegen
-        scene_count = 0
-        current_text_buffer = ""
-        
-        for block in blocks:
-            b_type = block.get("type")
-            content = block.get("content")
-
-            if b_type == "text":
-                current_text_buffer = content # Wir merken uns den Text für die nächste Szene oder speichern ihn separat
-                # Vereinfachung: Wir speichern Text oft zusammen mit dem Bildprompt oder als eigene "Szene" ohne Bild?
-                # Bessere Logik für Airtable:
-                # Wir gehen davon aus, dass ein "text" Block VOR einem "image_prompt" Block kommt.
-                # Oder wir speichern einfach alles linear.
-                # Hier: Wir speichern jede "Szene" wenn ein Image Prompt kommt.
-                pass
-            
-            elif b_type == "image_prompt":
-                scene_count += 1
-                # Wir nehmen den letzten Text als Kontext für die Szene, falls vorhanden
-                airtable.add_scene(
-                    book_id=book_id, 
-                    scene_number=scene_count, 
-                    text=current_text_buffer, 
-                    image_prompt=content
-                )
-                logger.info(f"   + Szene {scene_count} gespeichert.")
-                current_text_buffer = "" # Reset für nächsten Abschnitt
-
-        # Falls noch Text übrig ist ohne Bild (z.B. Ende), könnten wir das auch speichern, 
-        # aber unser aktuelles Schema erwartet 'Image Prompt'. 
-        # Wir lassen es für MVP einfach.
-
     except Exception as e:
         logger.error(f"❌ Fehler beim Speichern in Airtable: {e}")
         sys.exit(1)
+    finally:
+        store.close()
 
     # 4. Cleanup
-    logger.info("🧹 Bereinige VRAM (Ollama entladen)...")
-    llm.unload_model()
+    unload_if_used(llm)
     logger.info("✅ Story Modus fertig. Du kannst jetzt 'python main.py art' starten.")
 
-def run_art_mode():
+def read_topics(source: str) -> List[str]:
+    """Liest Themen zeilenweise aus einer Datei oder stdin ('-'). Leerzeilen und #-Kommentare werden ignoriert."""
+    if source == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(source, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.strip().startswith("#")]
+
+def run_batch_story_mode(topics: List[str], concurrency: int = OLLAMA_NUM_PARALLEL, use_cache: bool = True) -> bool:
+    """
+    Phase 1 für viele Themen: Das Modell bleibt für den ganzen Batch im VRAM
+    und wird erst am Ende einmal entladen. Fehler bei einem Thema brechen den Batch nicht ab.
+    Gibt True zurück, wenn alle Themen erfolgreich waren.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from modules.llm_engine import OllamaClient
+
+    logger.info(f"🚀 --- START: BATCH STORY MODUS ({len(topics)} Themen, {concurrency} parallel) ---")
+
+    # Bei paralleler Generierung keine Token-Ausgabe, sonst mischen sich die Streams
+    llm = OllamaClient(keep_alive=OLLAMA_BATCH_KEEP_ALIVE, echo=concurrency <= 1, use_cache=use_cache)
+    store = open_store()
+    results = []
+
+    def produce(topic: str) -> str:
+        return save_story_stream(llm.stream_story(topic), store, topic)
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = [(topic, pool.submit(produce, topic)) for topic in topics]
+        for topic, future in futures:
+            try:
+                book_id = future.result()
+                logger.info(f"✅ '{topic}' -> Buch {book_id}")
+                results.append((topic, book_id, None))
+            except Exception as e:
+                logger.error(f"❌ '{topic}' fehlgeschlagen: {e}")
+                results.append((topic, None, str(e)))
+
+    store.close()
+
+    # Einmal entladen statt nach jedem Buch
+    unload_if_used(llm)
+
+    ok = sum(1 for _, book_id, _ in results if book_id)
+    logger.info(f"📊 Batch fertig: {ok}/{len(results)} Bücher erstellt.")
+    for topic, book_id, error in results:
+        logger.info(f"   {'✅' if book_id else '❌'} {topic}: {book_id or error}")
+    return ok == len(results)
+
+def run_art_mode(incremental: bool = False, concurrency: int = COMFY_MAX_INFLIGHT,
+                 batch_size: int = COMFY_BATCH_SIZE) -> int:
     """
-    Phase 2: Holt 'Pending' Szenen aus Airtable & generiert Bilder.
+    Phase 2: Holt 'Pending' Szenen & generiert Bilder.
+    Die Szenen kommen seitenweise, das Malen startet schon nach der ersten Seite.
     Ollama ist hier aus, also volle 6GB VRAM für ComfyUI.
+    Gibt die Anzahl fertig gemalter Szenen zurück (auch aus dem Bild-Cache).
     """
+    from modules.comfy_pool import open_comfy
+    from modules.art_pipeline import recover_stale_leases
+    from modules.vram import VramHandoff
+
     logger.info("🎨 --- START: ART MODUS ---")
 
     # 1. Init Clients
-    airtable = AirtableClient()
-    # ComfyClient erst initialisieren, wenn wir wirklich was zu tun haben? 
-    # Nein, Check ist billig.
-    
-    pending_scenes = airtable.get_pending_scenes()
-    
-    if not pending_scenes:
+    store = open_store()
+    if not require_leases(store):
+        store.close()
+        sys.exit(1)
+    comfy = open_comfy()
+
+    # Szenen, die ein abgestürzter Lauf belegt hat: fertige Bilder übernehmen, den Rest wieder freigeben
+    recover_stale_leases(comfy, store)
+
+    pending_scenes = store.iter_pending_scenes(incremental=incremental)
+    first = next(pending_scenes, None)
+
+    if first is None:
         logger.info("🤷‍♂️ Keine offenen Szenen in Airtable gefunden. Alles erledigt!")
-        return
+        store.close()
+        return 0
 
-    logger.info(f"🖌 Habe {len(pending_scenes)} Szenen zum Malen gefunden.")
-    
-    # Init Comfy nur wenn nötig
-    comfy = ComfyClient()
-
-    for record in pending_scenes:
-        fields = record.get("fields", {})
-        scene_id = record.get("id")
-        prompt = fields.get("Image Prompt")
-        book_ids = fields.get("Book", [])
-        scene_num = fields.get("Scene Number", 0)
-        
-        # Dateiname generieren (BuchID_SceneX)
-        safe_book_id = book_ids[0] if book_ids else "unknown_book"
-        filename = f"{safe_book_id}_scene_{scene_num}"
-        
-        logger.info(f"🎨 Generiere Bild für Szene {scene_num} (ID: {scene_id})...")
-        
-        # Generierung
-        image_path = comfy.generate_image(prompt, filename)
-        
-        if image_path:
-            # Update Airtable
-            airtable.update_scene_image(scene_id, str(image_path))
-        else:
-            logger.error(f"❌ Bild fehlgeschlagen für Szene {scene_id}")
-
-    logger.info("✅ Alle Aufträge abgearbeitet.")
+    # GPU-Übergabe: erst starten, wenn ComfyUI genug freien VRAM meldet (statt blind zu warten)
+    VramHandoff().wait_for_comfy_vram()
+
+    # WebSocket nur wenn nötig. Eine Session für den ganzen Lauf.
+    with comfy:
+        painted = paint_scenes(comfy, store, itertools.chain([first], pending_scenes), concurrency, batch_size)
+
+    # Offene Status-Updates gebündelt schreiben
+    store.close()
+    logger.info(f"✅ Alle Aufträge abgearbeitet ({painted} Szenen fertig).")
+    return painted
+
+def paint_scenes(comfy: Union["ComfyClient", "ComfyPool"], store: SceneStore, records: Iterable[Dict],
+                 concurrency: int = COMFY_MAX_INFLIGHT, batch_size: int = COMFY_BATCH_SIZE) -> int:
+    """
+    Malt die Bilder für die übergebenen Szenen-Records (Liste oder Generator).
+    Rendern, Download und Store-Update laufen als überlappende Stufen (siehe ArtPipeline).
+    Gibt die Anzahl der fertig gemalten Szenen zurück.
+    """
+    import asyncio
+    from modules.art_pipeline import ArtPipeline
+
+    pipeline = ArtPipeline(comfy, store, concurrency, batch_size=batch_size)
+    asyncio.run(pipeline.run(records))
+    return pipeline.done
+
+def run_book_mode(book_ids: List[str], all_books: bool = False, workers: int = PDF_WORKERS) -> bool:
+    """
+    Phase 3: Baut PDFs (Titelseite + Bild & Text pro Szene) für die angegebenen bzw. alle Bücher.
+    Gibt False zurück, wenn mindestens ein Buch nicht exportiert werden konnte.
+    """
+    from modules.book_export import BookExporter
+
+    logger.info("📕 --- START: BUCH EXPORT ---")
+    store = open_store()
+    try:
+        if all_books:
+            book_ids = [book["id"] for book in store.list_books()]
+        if not book_ids:
+            logger.info("🤷‍♂️ Keine Bücher zum Exportieren gefunden.")
+            return True
+        written = BookExporter(store, workers).export(book_ids)
+    finally:
+        store.close()
+    return len(written) == len(book_ids)
+
+def run_serve_mode(args):
+    """
+    Dauerbetrieb: beobachtet die Themen-Queue (TOPIC_QUEUE_FILE) und die offenen Szenen in Airtable
+    und wechselt die GPU zwischen Ollama und ComfyUI nur, wenn sich der Wechsel lohnt.
+    Ollama- und ComfyUI-Client entstehen erst, wenn die jeweilige Phase zum ersten Mal läuft.
+    """
+    from modules.llm_engine import OllamaClient
+    from modules.comfy_pool import open_comfy
+    from modules.art_pipeline import recover_stale_leases
+    from modules.vram import VramHandoff
+    from modules.scheduler import PhaseScheduler, TopicQueue, PHASE_STORY, PHASE_ART
+
+    logger.info("🗓 --- START: SERVE MODUS ---")
+
+    topics = TopicQueue(TOPIC_QUEUE_FILE)
+    failed_topics = TopicQueue(TOPIC_FAILED_FILE)
+    store = open_store()
+    if not require_leases(store):
+        store.close()
+        sys.exit(1)
+    llm = Lazy(lambda: OllamaClient(keep_alive=OLLAMA_BATCH_KEEP_ALIVE))
+    comfy = Lazy(open_comfy)
+    # Offene Szenen zählen kostet im Airtable-Modus Requests -> Tiefe zwischenspeichern. Gezählt wird nur bis
+    # zur High-Watermark, mehr braucht der Scheduler nicht.
+    art_queue = {"depth": 0, "counted_at": None}
+
+    def art_depth() -> int:
+        counted_at = art_queue["counted_at"]
+        if counted_at is None or time.monotonic() - counted_at >= SCHEDULER_ART_DEPTH_SECONDS:
+            art_queue["depth"] = store.count_pending_scenes(limit=max(1, args.art_high))
+            art_queue["counted_at"] = time.monotonic()
+        return art_queue["depth"]
+
+    def do_story():
+        topic = topics.pop()
+        if topic is None:
+            return
+        try:
+            book_id = save_story_stream(llm.get().stream_story(topic), store, topic)
+            logger.info(f"✅ '{topic}' -> Buch {book_id}")
+            # Neue Szenen: nachzählen, solange die High-Watermark nicht erreicht ist (darüber ändert mehr nichts)
+            if art_queue["depth"] < args.art_high:
+                art_queue["counted_at"] = None
+        except Exception as e:
+            logger.error(f"❌ '{topic}' fehlgeschlagen: {e}")
+            failed_topics.push(topic)
+
+    def do_art():
+        recover_stale_leases(comfy.get(), store)
+        chunk = store.get_pending_scenes(limit=SCHEDULER_ART_CHUNK)
+        painted = 0
+        if chunk:
+            painted = paint_scenes(comfy.get(), store, chunk)
+            store.flush()
+        art_queue["counted_at"] = None  # Nach Art-Arbeit neu zählen
+        if chunk and not painted:
+            # Nichts fertig geworden (alles fehlgeschlagen oder belegt): nicht sofort den nächsten Chunk ziehen
+            logger.warning(f"⏳ Kein Bild aus {len(chunk)} Szenen fertig, warte {SCHEDULER_POLL_SECONDS}s.")
+            time.sleep(SCHEDULER_POLL_SECONDS)
+
+    # Nie gebaute Clients haben nichts geladen und nichts verbunden -> nichts aufzuräumen
+    def switch(old: str, new: str):
+        if old == PHASE_STORY and llm.built:
+            unload_if_used(llm.get())
+        elif old == PHASE_ART and comfy.built:
+            comfy.get().disconnect()
+            comfy.get().free_memory()
+        if new == PHASE_ART:
+            VramHandoff().wait_for_comfy_vram()
+            comfy.get().connect()
+
+    def shutdown(active: str):
+        if active == PHASE_STORY and llm.built:
+            unload_if_used(llm.get())
+        elif active == PHASE_ART and comfy.built:
+            comfy.get().disconnect()
+        store.close()
+
+    scheduler = PhaseScheduler(
+        story_depth=topics.depth, art_depth=art_depth,
+        do_story=do_story, do_art=do_art, switch=switch, shutdown=shutdown,
+        story_high=args.story_high, story_low=SCHEDULER_STORY_LOW_WATERMARK,
+        art_high=args.art_high, art_low=args.art_low,
+        min_dwell=args.min_dwell, max_dwell=SCHEDULER_MAX_DWELL_SECONDS,
+        max_idle_wait=SCHEDULER_MAX_IDLE_WAIT_SECONDS, poll_interval=SCHEDULER_POLL_SECONDS
+    )
+    scheduler.run_forever()
 
 def main():
     parser = argparse.ArgumentParser(description="Low-VRAM Kids Book Generator")
+    parser.add_argument("--profile", action="store_true",
+                        help="Am Ende eine Tabelle mit Timing pro Stufe ausgeben (Ollama, ComfyUI, Airtable)")
     subparsers = parser.add_subparsers(dest="command", required=True)
 
     # Subcommand: Story
     parser_story = subparsers.add_parser("story", help="Generiert Text & Prompts (Airtable)")
     parser_story.add_argument("topic", type=str, help="Das Thema des Buches")
+    parser_story.add_argument("--no-cache", action="store_true",
+                              help="Story-Cache ignorieren und neu generieren")
+
+    # Subcommand: Batch (viele Themen)
+    parser_batch = subparsers.add_parser("batch", help="Generiert Stories für eine Themenliste (Datei oder '-' für stdin)")
+    parser_batch.add_argument("topics_file", type=str, help="Datei mit einem Thema pro Zeile, '-' = stdin")
+    parser_batch.add_argument("--concurrency", type=int, default=OLLAMA_NUM_PARALLEL,
+                              help="Parallele Generierungen (Ollama braucht OLLAMA_NUM_PARALLEL >= Wert)")
+    parser_batch.add_argument("--no-cache", action="store_true",
+                              help="Story-Cache ignorieren und alle Themen neu generieren")
 
     # Subcommand: Art
     parser_art = subparsers.add_parser("art", help="Generiert Bilder für offene Szenen")
+    parser_art.add_argument("--incremental", action="store_true",
+                            help="Nur seit dem letzten Lauf neue/geänderte Szenen holen (direkter Airtable-Modus)")
+    parser_art.add_argument("--concurrency", type=int, default=COMFY_MAX_INFLIGHT,
+                            help="Prompts, die gleichzeitig in der ComfyUI Queue liegen (pro Instanz in COMFY_URLS)")
+    parser_art.add_argument("--batch-size", type=int, default=COMFY_BATCH_SIZE,
+                            help="Szenen eines Buchs pro ComfyUI Prompt (1 = einzeln, größer braucht mehr VRAM)")
+
+    # Subcommand: Book (PDF Export)
+    parser_book = subparsers.add_parser("book", help="Baut PDFs aus fertigen Büchern (Bild + Text pro Szene)")
+    parser_book.add_argument("book_ids", nargs="*", help="Buch-IDs (lokal oder Airtable)")
+    parser_book.add_argument("--all", action="store_true", help="Alle Bücher exportieren")
+    parser_book.add_argument("--workers", type=int, default=PDF_WORKERS,
+                             help="Prozesse für die Bildverarbeitung (Default: alle CPU-Kerne)")
+
+    # Subcommand: Serve (Dauerbetrieb)
+    parser_serve = subparsers.add_parser("serve", help="Scheduler: arbeitet Themen-Queue und offene Szenen automatisch ab")
+    parser_serve.add_argument("--story-high", type=int, default=SCHEDULER_STORY_HIGH_WATERMARK,
+                              help="Themen, ab denen zu Ollama gewechselt wird")
+    parser_serve.add_argument("--art-high", type=int, default=SCHEDULER_ART_HIGH_WATERMARK,
+                              help="Offene Szenen, ab denen zu ComfyUI gewechselt wird")
+    parser_serve.add_argument("--art-low", type=int, default=SCHEDULER_ART_LOW_WATERMARK,
+                              help="Art-Phase wird erst unter diese Szenenzahl für Stories unterbrochen")
+    parser_serve.add_argument("--min-dwell", type=float, default=SCHEDULER_MIN_DWELL_SECONDS,
+                              help="Mindestdauer einer Phase in Sekunden")
 
     args = parser.parse_args()
+    metrics.set_command(args.command)
+
+    try:
+        with metrics.span("run_seconds", {"command": args.command}):
+            run_command(args)
+    finally:
+        if args.profile:
+            metrics.print_summary()
 
+def run_command(args):
     if args.command == "story":
-        run_story_mode(args.topic)
+        run_story_mode(args.topic, use_cache=not args.no_cache)
+    elif args.command == "batch":
+        topics = read_topics(args.topics_file)
+        if not topics:
+            logger.error("❌ Keine Themen gefunden.")
+            sys.exit(1)
+        if not run_batch_story_mode(topics, args.concurrency, use_cache=not args.no_cache):
+            sys.exit(1)
     elif args.command == "art":
-        run_art_mode()
+        run_art_mode(args.incremental, args.concurrency, args.batch_size)
+    elif args.command == "book":
+        if not args.book_ids and not args.all:
+            logger.error("❌ Buch-IDs oder --all angeben.")
+            sys.exit(1)
+        if not run_book_mode(args.book_ids, args.all, args.workers):
+            sys.exit(1)
+    elif args.command == "serve":
+        run_serve_mode(args)
 
 if __name__ == "__main__":
     main()
@@ -1,24 +1,311 @@
-from pyairtable import Api
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Callable, Tuple, Iterator
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import atexit
+import json
 import logging
-from config import AIRTABLE_API_KEY, AIRTABLE_BASE_ID, AIRTABLE_TABLE_BOOKS, AIRTABLE_TABLE_SCENES
+import os
+import queue
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from config import (
+    AIRTABLE_API_KEY, AIRTABLE_BASE_ID, AIRTABLE_ENDPOINT_URL, AIRTABLE_TABLE_BOOKS, AIRTABLE_TABLE_SCENES,
+    AIRTABLE_RATE_LIMIT, AIRTABLE_RETRY_SECONDS, AIRTABLE_BATCH_SIZE, AIRTABLE_FLUSH_INTERVAL, AIRTABLE_PAGE_SIZE,
+    AIRTABLE_CURSOR_FILE, AIRTABLE_LEASE_SETTLE_SECONDS, SCENE_LEASE_SECONDS, SCENE_MAX_ATTEMPTS,
+    SCENE_RETRY_BACKOFF_SECONDS, HTTP_RETRIES, HTTP_BACKOFF_SECONDS, HTTP_BACKOFF_MAX_SECONDS
+)
+from modules.job_store import owner_alive
+from modules.utils import TokenBucket
+from modules.metrics import metrics
 
 logger = logging.getLogger("AirtableClient")
 
+CreateCallback = Callable[[Dict], None]
+
+# Wir filtern nach Szenen, wo 'Image Status' == 'Pending'
+PENDING_FORMULA = "{Image Status} = 'Pending'"
+# Nur diese Felder braucht der Art-Loop
+ART_FIELDS = ["Image Prompt", "Book", "Scene Number"]
+# Lease-Felder der Szenen-Tabelle (Text, Zahl mit Unix-Zeit, Text) für den direkten Airtable-Modus
+LEASE_OWNER = "Lease Owner"
+LEASE_EXPIRES = "Lease Expires"
+LEASE_PROMPT_ID = "Prompt ID"
+LEASE_FIELDS = [LEASE_OWNER, LEASE_EXPIRES, LEASE_PROMPT_ID]
+LEASE_CLEARED = {field: None for field in LEASE_FIELDS}
+# Puffer gegen Uhrabweichung zwischen uns und Airtable beim inkrementellen Cursor
+CURSOR_CLOCK_SKEW = timedelta(seconds=30)
+# Knapp unter dem Limit takten: schwankende Latenzen verschieben die Ankunft bei Airtable um einige ms
+RATE_HEADROOM = 0.9
+# Antworten, die der Transport wiederholt (wie die Default-Strategie von pyairtable)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _record_response(response, *args, **kwargs):
+    """Session-Hook: Latenz und Status jedes Airtable Requests (Wiederholungen zählt _RateLimitedAdapter)."""
+    path = response.request.path_url.split("?", 1)[0].split("/")
+    labels = {"method": response.request.method, "status": str(response.status_code)}
+    metrics.observe("airtable_request_seconds", response.elapsed.total_seconds(), labels,
+                    table=path[3] if len(path) > 3 else None)
+
+
+# Ein Bucket pro Base und Prozess: das Limit gilt pro Base, egal wie viele Clients ein Lauf nacheinander öffnet
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def _base_bucket(base_id: str) -> TokenBucket:
+    """Gleichmäßig getakteter Bucket (capacity=1, kein Burst): keine Sekunde hat mehr als AIRTABLE_RATE_LIMIT Requests."""
+    with _buckets_lock:
+        bucket = _buckets.get(base_id)
+        if bucket is None:
+            bucket = _buckets[base_id] = TokenBucket(
+                AIRTABLE_RATE_LIMIT * RATE_HEADROOM, capacity=1,
+                on_wait=lambda waited: metrics.observe("airtable_rate_limit_wait_seconds", waited))
+        return bucket
+
+
+class _RateLimitedAdapter(HTTPAdapter):
+    """
+    Transport der Airtable Session: jeder HTTP Request nimmt vorher ein Token aus dem gemeinsamen Bucket –
+    synchrone Calls, Folgeseiten, Write-Queue-Batches und auch Wiederholungen. pyairtable selbst wiederholt
+    nichts (retry_strategy=None), sonst liefen seine 429-Retries am Bucket vorbei.
+    Nach 429 wird AIRTABLE_RETRY_SECONDS gewartet (bzw. Retry-After), nach 5xx mit Backoff.
+    """
+
+    def __init__(self, bucket: TokenBucket, retries: int = HTTP_RETRIES):
+        super().__init__()
+        self.bucket = bucket
+        self.retries = retries
+
+    def send(self, request, **kwargs):
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            response = super().send(request, **kwargs)
+            if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                return response
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                wait = float(retry_after)
+            elif response.status_code == 429:
+                wait = AIRTABLE_RETRY_SECONDS
+            else:
+                wait = min(HTTP_BACKOFF_MAX_SECONDS, HTTP_BACKOFF_SECONDS * 2 ** attempt)
+            metrics.inc("airtable_retries_total", labels={"method": request.method, "status": str(response.status_code)})
+            logger.warning(f"🔁 Airtable {request.method} mit HTTP {response.status_code} beantwortet, "
+                           f"Versuch {attempt + 2}/{self.retries + 1} in {wait:.1f}s...")
+            response.close()
+            time.sleep(wait)
+
+
+class AirtableWriteQueue:
+    """
+    Write-Behind Puffer für Airtable.
+    Sammelt Creates und Updates und schreibt sie gebündelt (max. 10 Records pro Request),
+    ohne das Rate Limit (5 Requests/s) zu reißen (das hält der Transport der Tabellen ein, siehe
+    _RateLimitedAdapter). Mehrere Updates auf denselben Record werden vor dem Senden zu einem
+    einzigen Update zusammengeführt.
+    """
+
+    def __init__(self, tables: Dict[str, object],
+                 batch_size: int = AIRTABLE_BATCH_SIZE,
+                 flush_interval: float = AIRTABLE_FLUSH_INTERVAL):
+        self.tables = tables
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._creates: Dict[str, List[Tuple[Dict, Optional[CreateCallback]]]] = {name: [] for name in tables}
+        self._updates: Dict[str, "OrderedDict[str, Dict]"] = {name: OrderedDict() for name in tables}
+        self._oldest: Optional[float] = None
+        self._failed = 0
+        self._closed = False
+
+        self._cond = threading.Condition()
+        self._send_lock = threading.Lock()  # Serialisiert Hintergrund-Flush und expliziten Flush
+        self._thread = threading.Thread(target=self._run, name="AirtableWriteQueue", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # --- Öffentliche API ---
+
+    def create(self, table: str, fields: Dict, on_created: Optional[CreateCallback] = None):
+        """Reiht einen neuen Record ein. `on_created` bekommt den angelegten Record (inkl. ID)."""
+        with self._cond:
+            self._creates[table].append((fields, on_created))
+            self._touch()
+
+    def update(self, table: str, record_id: str, fields: Dict):
+        """Reiht ein Update ein. Spätere Updates auf denselben Record überschreiben frühere Felder."""
+        with self._cond:
+            pending = self._updates[table]
+            if record_id in pending:
+                pending[record_id].update(fields)
+            else:
+                pending[record_id] = dict(fields)
+            self._touch()
+
+    def pending(self) -> int:
+        with self._cond:
+            return self._pending_locked()
+
+    def flush(self) -> int:
+        """Schreibt alle offenen Änderungen synchron. Gibt die Anzahl fehlgeschlagener Records zurück."""
+        while self._send_batches(force=True):
+            pass
+        with self._cond:
+            failed, self._failed = self._failed, 0
+        return failed
+
+    def close(self):
+        """Flusht alles und beendet den Hintergrund-Thread (idempotent, läuft auch via atexit)."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+        failed = self.flush()
+        if failed:
+            logger.error(f"❌ {failed} Airtable-Änderungen konnten nicht geschrieben werden.")
+
+    # --- Intern ---
+
+    def _touch(self):
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        if self._full_batch_locked():
+            self._cond.notify_all()
+
+    def _pending_locked(self) -> int:
+        return sum(len(c) for c in self._creates.values()) + sum(len(u) for u in self._updates.values())
+
+    def _full_batch_locked(self) -> bool:
+        return any(len(c) >= self.batch_size for c in self._creates.values()) or \
+            any(len(u) >= self.batch_size for u in self._updates.values())
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if self._full_batch_locked():
+                        break
+                    if self._oldest is not None:
+                        remaining = self.flush_interval - (time.monotonic() - self._oldest)
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                if self._closed:
+                    return
+            self._send_batches(force=True)
+
+    def _take_batches(self, force: bool) -> List[Tuple[str, str, list]]:
+        """Entnimmt (unter Lock) die nächsten Batches: (kind, table, items)."""
+        batches = []
+        with self._cond:
+            for name, pending in self._creates.items():
+                if pending and (force or len(pending) >= self.batch_size):
+                    batches.append(("create", name, pending[:self.batch_size]))
+                    del pending[:self.batch_size]
+            for name, pending in self._updates.items():
+                if pending and (force or len(pending) >= self.batch_size):
+                    items = []
+                    while pending and len(items) < self.batch_size:
+                        record_id, fields = pending.popitem(last=False)
+                        items.append({"id": record_id, "fields": fields})
+                    batches.append(("update", name, items))
+            self._oldest = time.monotonic() if self._pending_locked() else None
+        return batches
+
+    def _send_batches(self, force: bool) -> bool:
+        """Sendet eine Runde Batches. Gibt True zurück, wenn etwas gesendet wurde."""
+        with self._send_lock:
+            batches = self._take_batches(force)
+            for kind, name, items in batches:
+                table = self.tables[name]
+                try:
+                    if kind == "create":
+                        records = table.batch_create([fields for fields, _ in items])
+                        for (_, callback), record in zip(items, records):
+                            if callback:
+                                callback(record)
+                    else:
+                        table.batch_update(items)
+                    logger.info(f"📤 Airtable Batch: {len(items)}x {kind} in '{name}'.")
+                except Exception as e:
+                    logger.error(f"❌ Airtable Batch-{kind} in '{name}' fehlgeschlagen ({len(items)} Records): {e}")
+                    with self._cond:
+                        self._failed += len(items)
+            return bool(batches)
+
+
 class AirtableClient:
+    """
+    Airtable Zugriff mit gemeinsamem Rate Limit und Write-Behind Puffer.
+    pyairtable (zieht pydantic & requests nach, ~0.7s Import) wird erst beim ersten Request geladen,
+    der Puffer-Thread erst beim ersten Schreibzugriff gestartet. Ein Client, der nie benutzt wird, kostet nichts.
+    """
+
     def __init__(self):
         if not AIRTABLE_API_KEY or not AIRTABLE_BASE_ID:
             logger.error("❌ Airtable Credentials fehlen in .env oder config.py!")
             raise ValueError("Airtable Credentials missing")
-        
-        self.api = Api(AIRTABLE_API_KEY)
-        self.table_books = self.api.table(AIRTABLE_BASE_ID, AIRTABLE_TABLE_BOOKS)
-        self.table_scenes = self.api.table(AIRTABLE_BASE_ID, AIRTABLE_TABLE_SCENES)
+
+        # Gemeinsames Rate Limit für alle Requests auf diese Base (im Transport, siehe _connect)
+        self.bucket = _base_bucket(AIRTABLE_BASE_ID)
+        self._tables: Optional[Dict[str, object]] = None
+        self._writer: Optional[AirtableWriteQueue] = None
+        self._init_lock = threading.Lock()
+        self._leases_checked = False
+        # Fehlgeschlagene Szenen: ID -> (Versuche, frühestens wieder ab). Nur im Speicher dieses Laufs.
+        self._attempts: Dict[str, Tuple[int, float]] = {}
+        self._attempts_lock = threading.Lock()
+
+    def _connect(self) -> Dict[str, object]:
+        with self._init_lock:
+            if self._tables is None:
+                from pyairtable import Api
+                api = Api(AIRTABLE_API_KEY, endpoint_url=AIRTABLE_ENDPOINT_URL, retry_strategy=None)
+                # Jeder HTTP Request (auch aus Write-Queue und Pager) läuft über diese Session
+                adapter = _RateLimitedAdapter(self.bucket)
+                api.session.mount("https://", adapter)
+                api.session.mount("http://", adapter)
+                api.session.hooks["response"].append(_record_response)
+                self._tables = {AIRTABLE_TABLE_BOOKS: api.table(AIRTABLE_BASE_ID, AIRTABLE_TABLE_BOOKS),
+                                AIRTABLE_TABLE_SCENES: api.table(AIRTABLE_BASE_ID, AIRTABLE_TABLE_SCENES)}
+            return self._tables
+
+    @property
+    def table_books(self):
+        return self._connect()[AIRTABLE_TABLE_BOOKS]
+
+    @property
+    def table_scenes(self):
+        return self._connect()[AIRTABLE_TABLE_SCENES]
+
+    @property
+    def writer(self) -> AirtableWriteQueue:
+        tables = self._connect()
+        with self._init_lock:
+            if self._writer is None:
+                self._writer = AirtableWriteQueue(tables)
+            return self._writer
+
+    def flush(self) -> int:
+        """Schreibt alle gepufferten Änderungen. Gibt die Anzahl fehlgeschlagener Records zurück."""
+        return self._writer.flush() if self._writer is not None else 0
+
+    def close(self):
+        """Flusht den Write-Behind Puffer. Sollte am Ende jedes Modus aufgerufen werden."""
+        if self._writer is not None:
+            self._writer.close()
 
     def create_book(self, title: str, topic: str) -> str:
         """Erstellt einen neuen Bucheintrag und gibt die Record ID zurück."""
         logger.info(f"📚 Erstelle Buch in Airtable: {title}")
         try:
+            # Synchron, weil die Szenen die Record ID für die Verknüpfung brauchen
             record = self.table_books.create({
                 "Title": title,
                 "Topic": topic,
@@ -29,39 +316,303 @@ class AirtableClient:
             logger.error(f"❌ Fehler beim Erstellen des Buches: {e}")
             raise
 
-    def add_scene(self, book_id: str, scene_number: int, text: str, image_prompt: str):
-        """Fügt eine Szene zu einem Buch hinzu."""
+    def update_book_status(self, book_id: str, status: str):
+        """Setzt den Status eines Buches (gepuffert)."""
+        self.writer.update(AIRTABLE_TABLE_BOOKS, book_id, {"Status": status})
+
+    def add_scene(self, book_id: str, scene_number: int, text: str, image_prompt: str,
+                  on_created: Optional[CreateCallback] = None):
+        """
+        Fügt eine Szene zu einem Buch hinzu (gepuffert, wird im 10er-Batch geschrieben).
+        `on_created` bekommt die Airtable ID der Szene, sobald sie angelegt ist.
+        """
+        callback = (lambda record: on_created(record["id"])) if on_created else None
+        self.writer.create(AIRTABLE_TABLE_SCENES, {
+            "Book": [book_id], # Verknüpfung zum Buch
+            "Scene Number": scene_number,
+            "Story Text": text,
+            "Image Prompt": image_prompt,
+            "Image Status": "Pending"
+        }, callback)
+
+    def delete_scenes(self, scene_ids: List[str]):
+        """Löscht Szenen (synchron, in 10er-Batches)."""
         try:
-            self.table_scenes.create({
-                "Book": [book_id], # Verknüpfung zum Buch
-                "Scene Number": scene_number,
-                "Story Text": text,
-                "Image Prompt": image_prompt,
-                "Image Status": "Pending"
-            })
+            self.batch_delete(AIRTABLE_TABLE_SCENES, scene_ids)
         except Exception as e:
-            logger.error(f"❌ Fehler beim Speichern der Szene {scene_number}: {e}")
+            logger.error(f"❌ Fehler beim Löschen der Szenen: {e}")
+
+    # --- Batch-Primitive (synchron, rate-limitiert), z.B. für den Job Store Sync ---
+
+    def _table(self, table_name: str):
+        return self.table_books if table_name == AIRTABLE_TABLE_BOOKS else self.table_scenes
+
+    def batch_create(self, table_name: str, fields_list: List[Dict]) -> List[Dict]:
+        """Legt Records in 10er-Batches an und gibt sie (inkl. ID, gleiche Reihenfolge) zurück."""
+        records = []
+        for i in range(0, len(fields_list), AIRTABLE_BATCH_SIZE):
+            records.extend(self._table(table_name).batch_create(fields_list[i:i + AIRTABLE_BATCH_SIZE]))
+        return records
+
+    def batch_update(self, table_name: str, updates: List[Dict]):
+        """Aktualisiert Records ({"id": ..., "fields": {...}}) in 10er-Batches."""
+        for i in range(0, len(updates), AIRTABLE_BATCH_SIZE):
+            self._table(table_name).batch_update(updates[i:i + AIRTABLE_BATCH_SIZE])
+
+    def batch_delete(self, table_name: str, record_ids: List[str]):
+        """Löscht Records in 10er-Batches."""
+        for i in range(0, len(record_ids), AIRTABLE_BATCH_SIZE):
+            self._table(table_name).batch_delete(record_ids[i:i + AIRTABLE_BATCH_SIZE])
+
+    def iter_scene_pages(self, formula: Optional[str] = None, fields: Optional[List[str]] = None,
+                         page_size: int = AIRTABLE_PAGE_SIZE, max_records: Optional[int] = None) -> Iterator[List[Dict]]:
+        """
+        Liefert Szenen Seite für Seite, sobald die jeweilige Seite da ist.
+        Ein Hintergrund-Thread holt die Folgeseiten direkt nach (rate-limitiert), damit der
+        Airtable-Offset nicht abläuft, während der Aufrufer an der ersten Seite arbeitet.
+        `max_records` begrenzt die Treffer serverseitig (der Thread hört dann von selbst auf).
+        """
+        # Read-your-writes: gepufferte Änderungen zuerst schreiben
+        self.flush()
+        options = {"page_size": page_size}
+        if formula:
+            options["formula"] = formula
+        if fields:
+            options["fields"] = fields
+        if max_records:
+            options["max_records"] = max_records
+            options["page_size"] = min(page_size, max_records)
+
+        pages: "queue.Queue" = queue.Queue()
+        done = object()
+
+        def fetch():
+            try:
+                for page in self.table_scenes.iterate(**options):
+                    pages.put(page)
+            except Exception as e:
+                pages.put(e)
+            pages.put(done)
+
+        threading.Thread(target=fetch, name="AirtablePager", daemon=True).start()
+        while True:
+            item = pages.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def iter_scenes_modified_since(self, since_iso: Optional[str] = None) -> Iterator[List[Dict]]:
+        """Seitenweise alle Szenen, die seit `since_iso` (ISO 8601, UTC) angelegt oder geändert wurden. None = alle."""
+        formula = f"IS_AFTER(LAST_MODIFIED_TIME(), '{since_iso}')" if since_iso else None
+        return self.iter_scene_pages(formula)
 
-    def get_pending_scenes(self) -> List[Dict]:
-        """Holt alle Szenen, die noch kein Bild haben (Status 'Pending')."""
+    def iter_pending_scenes(self, incremental: bool = False, fields: Optional[List[str]] = None,
+                            limit: Optional[int] = None) -> Iterator[Dict]:
+        """
+        Generator über alle Szenen mit Status 'Pending' – das Malen kann nach der ersten Seite starten.
+        Standardmäßig werden nur die Felder geholt, die der Art-Loop braucht. `limit`: höchstens so viele.
+
+        incremental=True: nur Szenen, die seit dem letzten vollständigen Durchlauf angelegt oder geändert
+        wurden (Cursor in AIRTABLE_CURSOR_FILE). Achtung: Szenen, die in einem früheren Lauf fehlschlugen
+        und seitdem unverändert sind, werden dann nicht erneut geliefert.
+        """
+        formula = PENDING_FORMULA
+        cursor = self._load_cursor() if incremental else None
+        if cursor:
+            formula = f"AND({PENDING_FORMULA}, IS_AFTER(LAST_MODIFIED_TIME(), '{cursor}'))"
+        started = datetime.now(timezone.utc) - CURSOR_CLOCK_SKEW
+
+        # Szenen, die nach einem Fehlschlag noch warten, überspringen (und dafür entsprechend mehr holen)
+        waiting = self._waiting_scenes()
+        count = 0
         try:
-            # Wir filtern nach Szenen, wo 'Image Status' == 'Pending'
-            # Hinweis: Airtable Formeln können komplex sein, hier nutzen wir client-seitige Filterung oder formula parameter
-            formula = "{Image Status} = 'Pending'"
-            records = self.table_scenes.all(formula=formula)
-            logger.info(f"🔍 Gefundene Szenen zum Malen: {len(records)}")
-            return records
+            for page in self.iter_scene_pages(formula, fields or ART_FIELDS,
+                                              max_records=limit and limit + len(waiting)):
+                page = [record for record in page if record["id"] not in waiting][:limit - count if limit else None]
+                count += len(page)
+                yield from page
+                if limit and count >= limit:
+                    break
         except Exception as e:
             logger.error(f"❌ Fehler beim Abrufen der Szenen: {e}")
+            return
+
+        logger.info(f"🔍 Gefundene Szenen zum Malen: {count}{' (inkrementell)' if cursor else ''}")
+        # Cursor erst nach vollständigem Durchlauf weitersetzen
+        if incremental and not limit:
+            self._save_cursor(started.strftime("%Y-%m-%dT%H:%M:%S.000Z"))
+
+    def get_pending_scenes(self, limit: Optional[int] = None) -> List[Dict]:
+        """Holt alle (bzw. höchstens `limit`) Szenen, die noch kein Bild haben (Status 'Pending')."""
+        return list(self.iter_pending_scenes(limit=limit))
+
+    def count_pending_scenes(self, limit: Optional[int] = None) -> int:
+        """
+        Anzahl offener Szenen, höchstens `limit`. Airtable kennt kein COUNT: gelesen werden nur
+        die Record IDs (ein Feld) bis zum Limit. Wartende Wiederholungen zählen nicht mit.
+        Bei Fehlern 0 (wie iter_pending_scenes).
+        """
+        waiting = self._waiting_scenes()
+        try:
+            count = sum(len([record for record in page if record["id"] not in waiting])
+                        for page in self.iter_scene_pages(PENDING_FORMULA, ["Scene Number"],
+                                                          max_records=limit and limit + len(waiting)))
+            return min(count, limit) if limit else count
+        except Exception as e:
+            logger.error(f"❌ Fehler beim Zählen der offenen Szenen: {e}")
+            return 0
+
+    def get_book(self, book_id: str) -> Optional[Dict]:
+        """Buch-Record inkl. Rück-Verknüpfung auf die Szenen (Feld wie die Szenen-Tabelle). None, wenn unbekannt."""
+        try:
+            return self.table_books.get(book_id)
+        except Exception as e:
+            logger.error(f"❌ Buch {book_id} nicht gefunden: {e}")
+            return None
+
+    def get_books(self, book_ids: List[str]) -> List[Dict]:
+        """Buch-Records zu mehreren IDs (eine Formel je 50 IDs, seitenweise, rate-limitiert). Unbekannte fehlen."""
+        books = []
+        for i in range(0, len(book_ids), 50):
+            formula = "OR(" + ", ".join(f"RECORD_ID() = '{book_id}'" for book_id in book_ids[i:i + 50]) + ")"
+            for page in self.table_books.iterate(formula=formula, page_size=AIRTABLE_PAGE_SIZE):
+                books.extend(page)
+        return books
+
+    def list_books(self) -> List[Dict]:
+        """Alle Bücher (seitenweise, rate-limitiert)."""
+        books = []
+        for page in self.table_books.iterate(page_size=AIRTABLE_PAGE_SIZE):
+            books.extend(page)
+        return books
+
+    def get_book_scenes(self, book_id: str) -> List[Dict]:
+        """Szenen eines Buchs in Szenen-Reihenfolge (über die Rück-Verknüpfung im Buch-Record)."""
+        book = self.get_book(book_id)
+        scene_ids = (book or {}).get("fields", {}).get(AIRTABLE_TABLE_SCENES, [])
+        if not scene_ids:
             return []
+        formula = "OR(" + ", ".join(f"RECORD_ID() = '{scene_id}'" for scene_id in scene_ids) + ")"
+        scenes = [record for page in self.iter_scene_pages(formula) for record in page]
+        return sorted(scenes, key=lambda record: record["fields"].get("Scene Number", 0))
 
-    def update_scene_image(self, scene_id: str, image_path: str):
-        """Setzt den Pfad zum Bild und markiert die Szene als fertig."""
+    @staticmethod
+    def _load_cursor() -> Optional[str]:
         try:
-            self.table_scenes.update(scene_id, {
-                "Local Image Path": image_path,
-                "Image Status": "Done"
-            })
-            logger.info(f"✅ Szene {scene_id} in Airtable aktualisiert.")
+            with open(AIRTABLE_CURSOR_FILE, "r", encoding="utf-8") as f:
+                return json.load(f).get("pending_scenes")
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    @staticmethod
+    def _save_cursor(value: str):
+        tmp = AIRTABLE_CURSOR_FILE.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"pending_scenes": value}, f)
+        os.replace(tmp, AIRTABLE_CURSOR_FILE)
+
+    # --- Leases: optimistisch über die Lease-Felder, der 'Image Status' bleibt dabei 'Pending' ---
+
+    def check_leases(self) -> bool:
+        """
+        True, wenn die Szenen-Tabelle die Lease-Felder hat. Ohne sie könnten zwei Art-Läufe
+        dieselbe Szene malen, deshalb starten Art- und Serve-Modus dann nicht.
+        """
+        if not self._leases_checked:
+            try:
+                self.table_scenes.first(fields=LEASE_FIELDS)
+            except Exception as e:
+                logger.error(f"❌ Szenen-Tabelle ohne Lease-Felder ({', '.join(LEASE_FIELDS)}): {e}")
+                return False
+            self._leases_checked = True
+        return True
+
+    def _scene_fields(self, scene_id: str) -> Dict:
+        return self.table_scenes.get(scene_id).get("fields", {})
+
+    def claim_scene(self, scene_id: str, owner: str, ttl: float = SCENE_LEASE_SECONDS) -> bool:
+        """
+        Belegt eine offene Szene für `owner`. Airtable kennt kein Compare-and-Set: der Lease wird
+        geschrieben und nach AIRTABLE_LEASE_SETTLE_SECONDS zurückgelesen. Hat ein gleichzeitiger Lauf
+        ihn in der Zwischenzeit überschrieben, gewinnt dieser. False, wenn die Szene nicht (mehr) frei ist.
+        """
+        fields = self._scene_fields(scene_id)
+        holder = fields.get(LEASE_OWNER)
+        if fields.get("Image Status") != "Pending":
+            return False
+        if holder and holder != owner and (fields.get(LEASE_EXPIRES) or 0) >= time.time() and owner_alive(holder):
+            return False
+
+        self.table_scenes.update(scene_id, {LEASE_OWNER: owner, LEASE_EXPIRES: time.time() + ttl,
+                                            LEASE_PROMPT_ID: None})
+        time.sleep(AIRTABLE_LEASE_SETTLE_SECONDS)
+        return self._scene_fields(scene_id).get(LEASE_OWNER) == owner
+
+    def set_scene_prompt(self, scene_id: str, owner: str, prompt_id: str, ttl: float = SCENE_LEASE_SECONDS):
+        """Merkt sich die aktuelle ComfyUI prompt_id der Szene und verlängert den Lease (gepuffert)."""
+        self.writer.update(AIRTABLE_TABLE_SCENES, scene_id, {LEASE_PROMPT_ID: prompt_id,
+                                                             LEASE_EXPIRES: time.time() + ttl})
+
+    def _holds_lease(self, scene_id: str, owner: str) -> bool:
+        try:
+            return self._scene_fields(scene_id).get(LEASE_OWNER) == owner
         except Exception as e:
-            logger.error(f"❌ Fehler beim Aktualisieren der Szene: {e}")
+            logger.warning(f"⚠️ Lease von Szene {scene_id} nicht lesbar, läuft nach Ablauf aus: {e}")
+            return False
+
+    def release_scene(self, scene_id: str, owner: Optional[str] = None):
+        """Gibt eine belegte Szene wieder frei (gepuffert). Mit `owner` nur, wenn sie diesem gehört."""
+        if owner is not None and not self._holds_lease(scene_id, owner):
+            return
+        self.writer.update(AIRTABLE_TABLE_SCENES, scene_id, LEASE_CLEARED)
+
+    def fail_scene(self, scene_id: str, owner: str, max_attempts: int = SCENE_MAX_ATTEMPTS,
+                   backoff: float = SCENE_RETRY_BACKOFF_SECONDS) -> bool:
+        """
+        Wie JobStore.fail_scene: gibt die Szene frei, bis zum nächsten Versuch wartet sie `backoff` Sekunden
+        (verdoppelt je Fehlschlag), nach `max_attempts` Versuchen wird 'Image Status' 'Failed'.
+        Die Versuche zählt nur dieser Lauf (im Speicher), Airtable hat dafür kein Feld.
+        """
+        if not self._holds_lease(scene_id, owner):
+            return False
+        with self._attempts_lock:
+            attempts = self._attempts.get(scene_id, (0, 0.0))[0] + 1
+            self._attempts[scene_id] = (attempts, time.time() + backoff * 2 ** (attempts - 1))
+        if attempts >= max_attempts:
+            self.writer.update(AIRTABLE_TABLE_SCENES, scene_id, {"Image Status": "Failed", **LEASE_CLEARED})
+            return True
+        self.writer.update(AIRTABLE_TABLE_SCENES, scene_id, LEASE_CLEARED)
+        return False
+
+    def _waiting_scenes(self) -> set:
+        """IDs der Szenen, deren nächster Versuch nach einem Fehlschlag noch nicht dran ist."""
+        now = time.time()
+        with self._attempts_lock:
+            return {scene_id for scene_id, (_, retry_after) in self._attempts.items() if retry_after > now}
+
+    def stale_leases(self) -> List[Dict]:
+        """
+        Belegte Szenen, deren Lauf nicht mehr lebt: Lease abgelaufen oder Besitzer-Prozess beendet.
+        Records wie iter_pending_scenes, zusätzlich mit 'prompt_id' und 'lease_owner'.
+        """
+        formula = f"AND({PENDING_FORMULA}, {{{LEASE_OWNER}}} != '')"
+        now = time.time()
+        stale = []
+        for page in self.iter_scene_pages(formula, ART_FIELDS + LEASE_FIELDS):
+            for record in page:
+                fields = record["fields"]
+                if (fields.get(LEASE_EXPIRES) or 0) < now or not owner_alive(fields.get(LEASE_OWNER)):
+                    stale.append({**record, "prompt_id": fields.get(LEASE_PROMPT_ID),
+                                  "lease_owner": fields.get(LEASE_OWNER)})
+        return stale
+
+    def update_scene_image(self, scene_id: str, image_path: str):
+        """Setzt den Pfad zum Bild und markiert die Szene als fertig (gepuffert)."""
+        self.writer.update(AIRTABLE_TABLE_SCENES, scene_id, {
+            "Local Image Path": image_path,
+            "Image Status": "Done",
+            **LEASE_CLEARED
+        })
+        logger.info(f"✅ Szene {scene_id} für Airtable-Update vorgemerkt.")
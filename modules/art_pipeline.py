@@ -0,0 +1,301 @@
+import asyncio
+import requests
+from typing import Dict, Iterable, List, Optional
+from config import (
+    COMFY_MAX_INFLIGHT, COMFY_BATCH_SIZE, ART_DOWNLOAD_WORKERS, OUTPUT_DIR, SCENE_LEASE_RENEW_SECONDS, SCENE_MAX_ATTEMPTS
+)
+from modules.image_engine import ComfyClient, ComfyJob
+from modules.job_store import lease_owner
+from modules.metrics import metrics
+from modules.utils import setup_logging
+
+logger = setup_logging("Art_Pipeline")
+
+
+def scene_job(record: Dict) -> Dict:
+    """Macht aus einem Szenen-Record (Airtable-Format) einen Render-Auftrag inkl. Dateiname."""
+    fields = record.get("fields", {})
+    book_ids = fields.get("Book", [])
+    scene_num = fields.get("Scene Number", 0)
+
+    # Dateiname generieren (BuchID_SceneX)
+    safe_book_id = book_ids[0] if book_ids else "unknown_book"
+    return {
+        "id": record.get("id"),
+        "prompt": fields.get("Image Prompt"),
+        "number": scene_num,
+        "book_id": safe_book_id,
+        "filename": f"{safe_book_id}_scene_{scene_num}",
+    }
+
+
+def recover_stale_leases(comfy: ComfyClient, store) -> int:
+    """
+    Räumt Szenen auf, die ein abgestürzter oder abgelaufener Lauf belegt hat ('In Progress'):
+    - Hat ComfyUI das Bild laut /history fertig, wird es heruntergeladen statt neu gerendert.
+    - Liegt das Bild schon im Output-Ordner, wird nur der Status nachgetragen.
+    - Läuft der Prompt noch in ComfyUI, bleibt die Szene belegt (nächster Lauf holt das Ergebnis).
+    - Sonst geht die Szene zurück auf 'Pending'.
+    Gibt die Anzahl wiederhergestellter Bilder zurück.
+    """
+    stale = store.stale_leases()
+    if not stale:
+        return 0
+    try:
+        active = comfy.active_prompt_ids()
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"⚠️ ComfyUI nicht erreichbar, {len(stale)} verwaiste Szenen bleiben belegt: {e}")
+        return 0
+
+    logger.info(f"🩹 {len(stale)} verwaiste Szenen aus einem früheren Lauf gefunden. Prüfe ComfyUI & Output...")
+    recovered = released = 0
+    for record in stale:
+        scene = scene_job(record)
+        prompt_id = record.get("prompt_id")
+        if prompt_id and prompt_id in active:
+            logger.info(f"   ⏳ Szene {scene['id']}: Prompt {prompt_id} läuft noch in ComfyUI.")
+            continue
+
+        path = None
+        try:
+            if prompt_id:
+                path = comfy.fetch_finished(prompt_id, scene["filename"])
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"⚠️ History für Szene {scene['id']} nicht abrufbar: {e}")
+        if path is None:
+            existing = OUTPUT_DIR / f"{scene['filename']}.png"
+            if existing.exists():
+                path = str(existing)
+
+        if path:
+            store.update_scene_image(scene["id"], path)
+            recovered += 1
+        else:
+            store.release_scene(scene["id"])
+            released += 1
+
+    logger.info(f"🩹 Wiederhergestellt: {recovered} Bilder, {released} Szenen wieder offen.")
+    return recovered
+
+
+class ArtPipeline:
+    """
+    Asynchrone Art-Pipeline mit drei Stufen, verbunden über begrenzte Queues:
+
+        Render (ComfyUI)  ->  Download (PNG)  ->  Bookkeeping (Store/Airtable)
+
+    Bis zu `concurrency` Prompts pro ComfyUI Instanz liegen gleichzeitig in der Queue (bei einem
+    ComfyPool also `concurrency * node_count`). Ein Render-Slot wird frei,
+    sobald ComfyUI fertig ist – nicht erst nach Download und Update. So rendert Szene N+1 bereits,
+    während Szene N gespeichert wird, und die GPU ist der einzige Flaschenhals.
+    Bilder, die schon im Bild-Cache liegen, überspringen Render und Download.
+    Mit `batch_size` > 1 gehen bis zu so viele Szenen desselben Buchs als ein Prompt an ComfyUI
+    (WorkflowTemplate.render_batch) und belegen zusammen einen Render-Slot.
+    Vor dem Rendern (und vor dem Blick in den Bild-Cache) wird jede Szene im Store belegt (Lease); Szenen,
+    die ein anderer Lauf belegt hat, werden übersprungen. Solange ihr Job läuft, wird der Lease alle
+    SCENE_LEASE_RENEW_SECONDS verlängert und bei jedem Neustart durch den Watchdog sofort mit der neuen
+    prompt_id gespeichert (siehe recover_stale_leases). Hängt ein Job, beendet ihn der Watchdog nach
+    höchstens COMFY_STALL_RETRIES Neustarts; stirbt der Lauf, läuft der Lease ab.
+    Die blockierenden Client-Aufrufe laufen in Threads; Fehler einzelner Szenen brechen den Lauf nicht ab.
+    Eine fehlgeschlagene Szene wartet vor dem nächsten Versuch (SCENE_RETRY_BACKOFF_SECONDS, verdoppelt)
+    und bekommt nach SCENE_MAX_ATTEMPTS Versuchen den Status 'Failed' (siehe JobStore.fail_scene).
+    """
+
+    def __init__(self, comfy: ComfyClient, store, concurrency: int = COMFY_MAX_INFLIGHT,
+                 download_workers: int = ART_DOWNLOAD_WORKERS, batch_size: int = COMFY_BATCH_SIZE):
+        self.comfy = comfy
+        self.store = store
+        self.concurrency = max(1, concurrency) * comfy.node_count
+        self.download_workers = max(1, download_workers)
+        self.batch_size = max(1, batch_size)
+        self.owner = lease_owner()
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+
+    async def run(self, records: Iterable[Dict]) -> int:
+        """Arbeitet alle Records ab und gibt die Anzahl bearbeiteter Szenen zurück."""
+        downloads: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        bookkeeping: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 4)
+        slots = asyncio.Semaphore(self.concurrency)
+        renders = set()
+
+        download_tasks = [asyncio.create_task(self._download_stage(downloads, bookkeeping))
+                          for _ in range(self.download_workers)]
+        bookkeeping_task = asyncio.create_task(self._bookkeeping_stage(bookkeeping))
+
+        def start(stage):
+            task = asyncio.create_task(stage)
+            renders.add(task)
+            task.add_done_callback(renders.discard)
+
+        count = 0
+        batch: List[Dict] = []
+        records = iter(records)
+        while True:
+            # Records können ein Generator über Airtable-Seiten sein -> nicht im Event-Loop blockieren
+            record = await asyncio.to_thread(next, records, None)
+            scene = scene_job(record) if record is not None else None
+            if self.batch_size > 1:
+                # Batch abschicken, wenn er voll ist, das Buch wechselt oder keine Szenen mehr kommen
+                if batch and (scene is None or len(batch) >= self.batch_size or scene["book_id"] != batch[0]["book_id"]):
+                    await slots.acquire()
+                    start(self._render_batch_stage(batch, slots, downloads, bookkeeping))
+                    batch = []
+                if scene is not None:
+                    batch.append(scene)
+                    count += 1
+            elif scene is not None:
+                await slots.acquire()
+                count += 1
+                start(self._render_stage(scene, slots, downloads, bookkeeping))
+            if scene is None:
+                break
+
+        if renders:
+            await asyncio.gather(*renders)
+        for _ in download_tasks:
+            await downloads.put(None)
+        await asyncio.gather(*download_tasks)
+        await bookkeeping.put(None)
+        await bookkeeping_task
+
+        logger.info(f"📊 Art-Pipeline: {self.done} fertig, {self.failed} fehlgeschlagen, "
+                    f"{self.skipped} von anderen Läufen belegt.")
+        return count
+
+    async def _wait_job(self, job: ComfyJob, scenes: List[Dict]):
+        """Wartet auf den Job und hält dabei die Leases der Szenen (prompt_id & Ablauf) aktuell."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        job.add_done_callback(lambda _: loop.call_soon_threadsafe(
+            lambda: future.done() or future.set_result(None)))
+        requeued = asyncio.Event()
+        job.add_prompt_callback(lambda _: loop.call_soon_threadsafe(requeued.set))
+        while not future.done():
+            waiter = asyncio.ensure_future(requeued.wait())
+            await asyncio.wait({future, waiter}, timeout=SCENE_LEASE_RENEW_SECONDS,
+                               return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+            if future.done():
+                break
+            requeued.clear()
+            for scene in scenes:
+                await asyncio.to_thread(self.store.set_scene_prompt, scene["id"], self.owner, job.prompt_id)
+
+    async def _cached(self, scene: Dict) -> Optional[str]:
+        """Gleicher Prompt, Seed & Workflow schon einmal gerendert? Dann der Pfad im Output-Ordner."""
+        try:
+            return await asyncio.to_thread(self.comfy.cached_image, scene["prompt"], scene["filename"])
+        except Exception as e:
+            logger.warning(f"⚠️ Bild-Cache nicht lesbar für Szene {scene['id']}: {e}")
+            return None
+
+    async def _claim(self, scene: Dict) -> bool:
+        if await asyncio.to_thread(self.store.claim_scene, scene["id"], self.owner):
+            return True
+        logger.info(f"⏭ Szene {scene['id']} wird schon von einem anderen Lauf bearbeitet.")
+        self.skipped += 1
+        return False
+
+    async def _fail(self, scene: Dict):
+        """Zählt den Fehlschlag am Store: die Szene wartet vor dem nächsten Versuch, zu oft -> 'Failed'."""
+        logger.error(f"❌ Bild fehlgeschlagen für Szene {scene['id']}")
+        self.failed += 1
+        if await asyncio.to_thread(self.store.fail_scene, scene["id"], self.owner):
+            logger.error(f"🛑 Szene {scene['id']} nach {SCENE_MAX_ATTEMPTS} Versuchen aufgegeben ('Failed').")
+
+    async def _render_stage(self, scene: Dict, slots: asyncio.Semaphore, downloads: asyncio.Queue,
+                            bookkeeping: asyncio.Queue):
+        img_data: Optional[Dict] = None
+        job = None
+        try:
+            if not await self._claim(scene):
+                return
+            # Treffer im Bild-Cache gehen ohne GPU direkt ins Bookkeeping (erst nach dem Claim,
+            # sonst tragen zwei Läufe dieselbe Szene ein)
+            cached = await self._cached(scene)
+            if cached:
+                await bookkeeping.put((scene, cached))
+                return
+            logger.info(f"🎨 Generiere Bild für Szene {scene['number']} (ID: {scene['id']})...")
+            job = await asyncio.to_thread(self.comfy.submit, scene["prompt"], scene["filename"])
+            await asyncio.to_thread(self.store.set_scene_prompt, scene["id"], self.owner, job.prompt_id)
+            await self._wait_job(job, [scene])
+            img_data = await asyncio.to_thread(self.comfy.resolve_image, job)
+        except Exception as e:
+            logger.error(f"❌ Render fehlgeschlagen für Szene {scene['id']}: {e}")
+        finally:
+            slots.release()
+
+        if img_data is None:
+            await self._fail(scene)
+            return
+        await downloads.put((scene, job, img_data))
+
+    async def _render_batch_stage(self, scenes: List[Dict], slots: asyncio.Semaphore, downloads: asyncio.Queue,
+                                  bookkeeping: asyncio.Queue):
+        """Wie _render_stage, aber alle nicht gecachten Szenen gehen als ein Prompt an ComfyUI."""
+        claimed: List[Dict] = []
+        images: Dict[str, Optional[Dict]] = {}
+        job = None
+        try:
+            for scene in scenes:
+                if not await self._claim(scene):
+                    continue
+                cached = await self._cached(scene)
+                if cached:
+                    await bookkeeping.put((scene, cached))
+                else:
+                    claimed.append(scene)
+            if not claimed:
+                return
+            logger.info(f"🎨 Generiere {len(claimed)} Bilder für Buch {claimed[0]['book_id']} in einem Prompt...")
+            job = await asyncio.to_thread(self.comfy.submit_batch,
+                                          [(scene["prompt"], scene["filename"]) for scene in claimed])
+            for scene in claimed:
+                await asyncio.to_thread(self.store.set_scene_prompt, scene["id"], self.owner, job.prompt_id)
+            await self._wait_job(job, claimed)
+            images = await asyncio.to_thread(self.comfy.resolve_images, job)
+        except Exception as e:
+            logger.error(f"❌ Batch-Render fehlgeschlagen für Buch {scenes[0]['book_id']}: {e}")
+        finally:
+            slots.release()
+
+        for scene in claimed:
+            img_data = images.get(scene["filename"])
+            if img_data is None:
+                await self._fail(scene)
+            else:
+                await downloads.put((scene, job, img_data))
+
+    async def _download_stage(self, downloads: asyncio.Queue, bookkeeping: asyncio.Queue):
+        while True:
+            item = await downloads.get()
+            if item is None:
+                return
+            scene, job, img_data = item
+            path = await asyncio.to_thread(
+                self.comfy.download_image,
+                img_data["filename"], img_data["subfolder"], img_data["type"], scene["filename"], job.server_address)
+            if path:
+                await asyncio.to_thread(self.comfy.remember, job, path, scene["filename"])
+                await bookkeeping.put((scene, path))
+            else:
+                await self._fail(scene)
+
+    async def _bookkeeping_stage(self, bookkeeping: asyncio.Queue):
+        while True:
+            item = await bookkeeping.get()
+            if item is None:
+                return
+            scene, path = item
+            try:
+                await asyncio.to_thread(self.store.update_scene_image, scene["id"], str(path))
+                self.done += 1
+                metrics.write_if_due()
+            except Exception as e:
+                logger.error(f"❌ Update fehlgeschlagen für Szene {scene['id']}: {e}")
+                self.failed += 1
+                # Lease (inkl. prompt_id) bleibt stehen: läuft er ab oder endet dieser Prozess, übernimmt
+                # recover_stale_leases das Bild aus dem Output-Ordner statt die Szene neu zu rendern
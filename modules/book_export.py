@@ -0,0 +1,322 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from config import (OUTPUT_DIR, BOOKS_DIR, PAGE_CACHE_DIR, PDF_IMAGE_MAX_PX, PDF_JPEG_QUALITY, PDF_WORKERS)
+from modules.utils import setup_logging
+from modules.metrics import metrics
+
+logger = setup_logging("Book_Export")
+
+# Seitenlayout in PDF-Punkten (A4 hochkant): Bild oben, Text darunter
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+MARGIN = 40
+TEXT_FONT_SIZES = (16, 15, 14, 13, 12, 11, 10)  # Der Text wird so lange verkleinert, bis er passt
+
+# Zeichenbreiten von Helvetica (1/1000 em, aus den Standard-AFM). Für den Zeilenumbruch.
+_HELVETICA_WIDTHS = dict(zip(
+    " !\"#$%&'()*+,-./0123456789:;<=>?@ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_`abcdefghijklmnopqrstuvwxyz{|}~",
+    [278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+     556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+     1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+     667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+     333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+     556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584]))
+_HELVETICA_WIDTHS.update({"ä": 556, "ö": 556, "ü": 556, "Ä": 667, "Ö": 778, "Ü": 722, "ß": 611})
+
+
+def text_width(text: str, font_size: float) -> float:
+    return sum(_HELVETICA_WIDTHS.get(ch, 556) for ch in text) * font_size / 1000
+
+
+def wrap_text(text: str, font_size: float, max_width: float) -> List[str]:
+    """Bricht Absätze wortweise um, so dass jede Zeile höchstens `max_width` Punkte breit ist."""
+    lines = []
+    for paragraph in text.splitlines() or [""]:
+        line = ""
+        for word in paragraph.split():
+            candidate = f"{line} {word}" if line else word
+            if line and text_width(candidate, font_size) > max_width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+
+def _pdf_string(text: str) -> bytes:
+    """PDF String-Literal in WinAnsi (cp1252, deckt Umlaute & deutsche Anführungszeichen ab)."""
+    raw = text.encode("cp1252", errors="replace")
+    return b"(" + raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def prepare_page_image(source: str, target: str, max_px: int, quality: int) -> Tuple[int, int]:
+    """
+    Läuft im Prozess-Pool: verkleinert ein Szenenbild auf `max_px` (längste Kante) und speichert es
+    als JPEG unter `target` (atomar). Gibt (Breite, Höhe) zurück. Pro Worker liegt nur ein Bild im Speicher.
+    """
+    from PIL import Image  # Nur die Worker brauchen Pillow
+
+    with Image.open(source) as img:
+        img.draft("RGB", (max_px, max_px))  # JPEG-Quellen gleich verkleinert dekodieren
+        img = img.convert("RGB")
+        img.thumbnail((max_px, max_px), Image.LANCZOS)
+        tmp = f"{target}.{os.getpid()}.tmp"
+        img.save(tmp, "JPEG", quality=quality, optimize=True, progressive=False)
+        size = img.size
+    os.replace(tmp, target)
+    return size
+
+
+class PageCache:
+    """
+    Verkleinerte Seitenbilder (JPEG) auf der Platte. Schlüssel: Quelldatei (Pfad, Größe, mtime) + Einstellungen.
+    Ändert sich nur der Text eines Buchs, werden die Bilder beim Neubau nicht erneut kodiert.
+    """
+
+    def __init__(self, root: Path = PAGE_CACHE_DIR, max_px: int = PDF_IMAGE_MAX_PX, quality: int = PDF_JPEG_QUALITY):
+        self.root = root
+        self.max_px = max_px
+        self.quality = quality
+
+    def path(self, source: Path) -> Path:
+        stat = source.stat()
+        payload = json.dumps([str(source.resolve()), stat.st_size, stat.st_mtime_ns, self.max_px, self.quality])
+        key = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        return self.root / key[:2] / f"{key}.jpg"
+
+    @staticmethod
+    def dimensions(path: Path) -> Optional[Tuple[int, int]]:
+        """(Breite, Höhe) eines gecachten JPEGs aus dem SOF-Header, ohne es zu dekodieren. None, wenn nicht da."""
+        try:
+            with open(path, "rb") as f:
+                if f.read(2) != b"\xff\xd8":
+                    return None
+                while True:
+                    marker = f.read(2)
+                    if len(marker) < 2 or marker[0] != 0xFF:
+                        return None
+                    length = int.from_bytes(f.read(2), "big")
+                    if marker[1] in (0xC0, 0xC1, 0xC2):
+                        header = f.read(5)
+                        return int.from_bytes(header[3:5], "big"), int.from_bytes(header[1:3], "big")
+                    f.seek(length - 2, os.SEEK_CUR)
+        except FileNotFoundError:
+            return None
+
+
+class PdfWriter:
+    """
+    Minimaler PDF-Writer, der Seite für Seite direkt in die Datei schreibt.
+    Bilder werden als fertige JPEGs eingebettet (DCTDecode, kein erneutes Kodieren) und in Blöcken
+    aus dem Seiten-Cache kopiert – es liegt nie mehr als ein Bild-Block im Speicher.
+    Text nutzt die PDF-Standardschrift Helvetica (WinAnsi), es werden keine Fonts eingebettet.
+    """
+
+    def __init__(self, path: Path, title: str):
+        self.path = path
+        self.tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        self.title = title
+        self.offsets: Dict[int, int] = {}
+        self.pages: List[int] = []
+        self.next_id = 5  # 1 Catalog, 2 Pages, 3/4 Fonts – Pages wird am Ende geschrieben
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.f = open(self.tmp, "wb")
+        self.f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        self._object(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+        self._object(4, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>")
+
+    def _new_id(self) -> int:
+        self.next_id += 1
+        return self.next_id - 1
+
+    def _object(self, obj_id: int, body: bytes):
+        self.offsets[obj_id] = self.f.tell()
+        self.f.write(b"%d 0 obj\n" % obj_id + body + b"\nendobj\n")
+
+    def _stream(self, obj_id: int, data: bytes):
+        self._object(obj_id, b"<< /Length %d >>\nstream\n" % len(data) + data + b"\nendstream")
+
+    def _page(self, content: bytes, image_id: Optional[int] = None):
+        content_id = self._new_id()
+        self._stream(content_id, content)
+        resources = b"/Font << /F1 3 0 R /F2 4 0 R >>"
+        if image_id:
+            resources += b" /XObject << /Im1 %d 0 R >>" % image_id
+        page_id = self._new_id()
+        self._object(page_id, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << %s >> "
+                              b"/Contents %d 0 R >>" % (PAGE_WIDTH, PAGE_HEIGHT, resources, content_id))
+        self.pages.append(page_id)
+
+    @staticmethod
+    def _text_lines(lines: List[str], font: bytes, size: float, top: float, leading: float, center: bool) -> bytes:
+        ops = []
+        y = top
+        for line in lines:
+            x = (PAGE_WIDTH - text_width(line, size)) / 2 if center else MARGIN
+            ops.append(b"BT %s %.1f Tf %.2f %.2f Td %s Tj ET" % (font, size, x, y, _pdf_string(line)))
+            y -= leading
+        return b"\n".join(ops)
+
+    def add_title_page(self, title: str, subtitle: Optional[str] = None):
+        lines = wrap_text(title, 28, PAGE_WIDTH - 2 * MARGIN)
+        content = self._text_lines(lines, b"/F2", 28, PAGE_HEIGHT * 0.6, 36, center=True)
+        if subtitle:
+            content += b"\n" + self._text_lines(wrap_text(subtitle, 14, PAGE_WIDTH - 2 * MARGIN), b"/F1", 14,
+                                                PAGE_HEIGHT * 0.6 - 36 * len(lines) - 20, 18, center=True)
+        self._page(content)
+
+    def add_scene_page(self, jpeg_path: Path, size: Tuple[int, int], text: str):
+        """Bild (auf Seitenbreite eingepasst) oben, darunter der Text (Schrift schrumpft bei langem Text)."""
+        width, height = size
+        image_id = self._new_id()
+        length = jpeg_path.stat().st_size
+        self.offsets[image_id] = self.f.tell()
+        self.f.write(b"%d 0 obj\n<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB "
+                     b"/BitsPerComponent 8 /Filter /DCTDecode /Length %d >>\nstream\n" % (image_id, width, height, length))
+        with open(jpeg_path, "rb") as src:
+            shutil.copyfileobj(src, self.f)
+        self.f.write(b"\nendstream\nendobj\n")
+
+        box = PAGE_WIDTH - 2 * MARGIN
+        scale = min(box / width, box / height)
+        draw_w, draw_h = width * scale, height * scale
+        image_top = PAGE_HEIGHT - MARGIN
+        content = b"q %.2f 0 0 %.2f %.2f %.2f cm /Im1 Do Q" % (
+            draw_w, draw_h, (PAGE_WIDTH - draw_w) / 2, image_top - draw_h)
+
+        text_top = image_top - draw_h - 30
+        for size_pt in TEXT_FONT_SIZES:
+            leading = size_pt * 1.4
+            lines = wrap_text(text, size_pt, box)
+            if text_top - leading * (len(lines) - 1) >= MARGIN:
+                break
+        content += b"\n" + self._text_lines(lines, b"/F1", size_pt, text_top, leading, center=False)
+        self._page(content, image_id)
+
+    def close(self):
+        """Schreibt Seitenbaum, Xref & Trailer und ersetzt die Zieldatei atomar."""
+        kids = b" ".join(b"%d 0 R" % page_id for page_id in self.pages)
+        self._object(2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self.pages)))
+        info_id = self._new_id()
+        self._object(info_id, b"<< /Title %s /Producer (kids-book-ai) >>" % _pdf_string(self.title))
+
+        xref = self.f.tell()
+        count = self.next_id
+        self.f.write(b"xref\n0 %d\n0000000000 65535 f \n" % count)
+        for obj_id in range(1, count):
+            self.f.write(b"%010d 00000 n \n" % self.offsets[obj_id])
+        self.f.write(b"trailer\n<< /Size %d /Root 1 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                     % (count, info_id, xref))
+        self.f.close()
+        os.replace(self.tmp, self.path)
+
+    def abort(self):
+        self.f.close()
+        self.tmp.unlink(missing_ok=True)
+
+
+class BookExporter:
+    """
+    Baut PDFs aus fertigen Büchern: Titelseite, dann pro Szene (nach 'Scene Number') Bild + Story Text.
+    Alle Seitenbilder aller angefragten Bücher gehen sofort an einen Prozess-Pool (Verkleinern + JPEG),
+    damit alle CPU-Kerne arbeiten; geschrieben wird Buch für Buch, sobald dessen Seiten fertig sind.
+    Bücher mit fehlenden Bildern werden übersprungen.
+    """
+
+    def __init__(self, store, workers: int = PDF_WORKERS, out_dir: Path = BOOKS_DIR,
+                 cache: Optional[PageCache] = None):
+        self.store = store
+        self.workers = max(1, workers)
+        self.out_dir = out_dir
+        self.cache = cache or PageCache()
+
+    @staticmethod
+    def _image_path(record: Dict) -> Path:
+        fields = record.get("fields", {})
+        if fields.get("Local Image Path"):
+            return Path(fields["Local Image Path"])
+        # Fallback: Dateiname wie in der Art-Pipeline
+        book = (fields.get("Book") or ["unknown_book"])[0]
+        return OUTPUT_DIR / f"{book}_scene_{fields.get('Scene Number', 0)}.png"
+
+    def _submit_pages(self, pool: ProcessPoolExecutor, scenes: List[Dict]) -> Optional[List[Tuple[Dict, Path, object]]]:
+        """Pro Szene (Record, Cache-Pfad, Future oder fertige Größe). None, wenn Bilder fehlen."""
+        pages = []
+        missing = []
+        for scene in scenes:
+            source = self._image_path(scene)
+            if not source.exists():
+                missing.append(scene["fields"].get("Scene Number"))
+                continue
+            target = self.cache.path(source)
+            size = self.cache.dimensions(target)
+            if size:
+                metrics.inc("book_page_cache_total", labels={"result": "hit"})
+                pages.append((scene, target, size))
+                continue
+            metrics.inc("book_page_cache_total", labels={"result": "miss"})
+            target.parent.mkdir(parents=True, exist_ok=True)
+            pages.append((scene, target, pool.submit(prepare_page_image, str(source), str(target),
+                                                     self.cache.max_px, self.cache.quality)))
+        if missing:
+            logger.warning(f"⚠️ Bilder fehlen für Szene(n) {missing}, Buch wird übersprungen.")
+            return None
+        return pages
+
+    def export(self, book_ids: List[str]) -> List[Path]:
+        """Exportiert die Bücher und gibt die Pfade der erzeugten PDFs zurück."""
+        start = time.monotonic()
+        written = []
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            jobs = []
+            for book_id in book_ids:
+                book = self.store.get_book(book_id)
+                if book is None:
+                    logger.error(f"❌ Buch {book_id} nicht gefunden.")
+                    continue
+                scenes = self.store.get_book_scenes(book["id"])
+                if not scenes:
+                    logger.warning(f"⚠️ Buch {book_id} hat keine Szenen.")
+                    continue
+                pages = self._submit_pages(pool, scenes)
+                if pages is not None:
+                    jobs.append((book, pages))
+
+            logger.info(f"📚 Exportiere {len(jobs)} Bücher ({self.workers} Prozesse)...")
+            for book, pages in jobs:
+                path = self._write_book(book, pages)
+                if path:
+                    written.append(path)
+
+        logger.info(f"✅ {len(written)}/{len(book_ids)} PDFs in {time.monotonic() - start:.1f}s erstellt.")
+        return written
+
+    def _write_book(self, book: Dict, pages: List[Tuple[Dict, Path, object]]) -> Optional[Path]:
+        fields = book.get("fields", {})
+        title = fields.get("Title") or f"Buch {book['id']}"
+        path = self.out_dir / f"{book['id']}.pdf"
+        try:
+            with metrics.span("book_export_seconds", book=book["id"], pages=len(pages)):
+                writer = PdfWriter(path, title)
+                try:
+                    writer.add_title_page(title, fields.get("Topic"))
+                    for scene, jpeg, size in pages:
+                        if isinstance(size, Future):
+                            size = size.result()
+                        writer.add_scene_page(jpeg, size, scene["fields"].get("Story Text") or "")
+                    writer.close()
+                except Exception:
+                    writer.abort()
+                    raise
+        except Exception as e:
+            logger.error(f"❌ PDF für Buch {book['id']} fehlgeschlagen: {e}")
+            return None
+        logger.info(f"📕 {title}: {path}")
+        return path
@@ -0,0 +1,298 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from config import (COMFY_URLS, COMFY_WORKFLOW, COMFY_NODE_TIMEOUT, COMFY_NODE_RETRY_SECONDS,
+                    COMFY_QUEUE_DEPTH_TTL, IMAGE_CACHE_ENABLED)
+from modules.image_engine import ComfyClient, ComfyJob
+from modules.image_cache import ImageCache
+from modules.utils import setup_logging
+from modules.metrics import metrics
+
+logger = setup_logging("Comfy_Pool")
+
+RENDER_TIME_SMOOTHING = 0.3  # Gewicht der letzten Renderzeit im gleitenden Mittel
+
+
+class ComfyNode:
+    """Eine ComfyUI Instanz im Pool: eigener Client (eigene WebSocket-Session), Gesundheit und Renderzeit."""
+
+    def __init__(self, client: ComfyClient):
+        self.client = client
+        self.healthy = True
+        self.retry_at = 0.0
+        self.inflight = 0  # Jobs dieses Pools, die dort gerade liegen
+        self.depth = 0  # Zuletzt gesehene /queue Länge (alle Clients)
+        self.depth_at = float("-inf")  # Wann `depth` abgefragt wurde (monotonic)
+        self.render_seconds: Optional[float] = None  # Geglättete Renderzeit (Start bis Ende) laut WebSocket
+
+    @property
+    def address(self) -> str:
+        return self.client.server_address
+
+    def observe(self, job: ComfyJob):
+        if job.error or job.started_at is None or job.finished_at is None:
+            return
+        seconds = job.finished_at - job.started_at
+        if self.render_seconds is None:
+            self.render_seconds = seconds
+        else:
+            self.render_seconds += RENDER_TIME_SMOOTHING * (seconds - self.render_seconds)
+
+
+class ComfyPool:
+    """
+    Verteilt Bild-Jobs auf mehrere ComfyUI Instanzen (COMFY_URLS), eine WebSocket-Session pro Instanz.
+    Jeder Job geht an die Instanz mit der kürzesten erwarteten Wartezeit:
+    (Prompts in deren /queue + 1) * geglättete Renderzeit dieser Instanz.
+    Die /queue Länge wird höchstens alle COMFY_QUEUE_DEPTH_TTL Sekunden abgefragt (veraltete Instanzen
+    parallel); dazwischen zählen die eigenen Jobs (`inflight`). Ein Submit kostet so meist keinen Request extra.
+
+    Antwortet eine Instanz nicht mehr (/queue, Submit oder abgerissener WebSocket), wird sie
+    COMFY_NODE_RETRY_SECONDS lang übergangen und ihre laufenden Jobs starten auf einer anderen Instanz neu.
+    Gibt der Stall-Watchdog einen einzelnen Job auf, startet nur dieser woanders neu; die Instanz bleibt im Pool.
+    Aufrufer merken davon nichts: sie halten denselben ComfyJob, bis er irgendwo fertig ist.
+
+    Bietet dieselben Methoden wie ComfyClient (submit, resolve_image, download_image, cached_image, ...).
+    """
+
+    def __init__(self, urls: List[str] = COMFY_URLS, workflow_name: str = COMFY_WORKFLOW,
+                 cache: Optional[ImageCache] = None):
+        if not urls:
+            raise ValueError("ComfyPool braucht mindestens eine ComfyUI URL.")
+        self.workflow_name = workflow_name
+        self.cache = cache if cache is not None else (ImageCache() if IMAGE_CACHE_ENABLED else None)
+        self.nodes = [ComfyNode(ComfyClient(workflow_name, self.cache, url)) for url in urls]
+        # Für alles ohne Instanzbezug (Cache, Downloads per server_address)
+        self.primary = self.nodes[0].client
+        self._lock = threading.Lock()
+        self._closing = False
+        # Threads für die /queue Abfragen, entstehen erst bei Bedarf
+        self._refresher = ThreadPoolExecutor(max_workers=len(self.nodes), thread_name_prefix="ComfyPoolQueue")
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.disconnect()
+
+    @property
+    def node_count(self) -> int:
+        return len(self.nodes)
+
+    @property
+    def connected(self) -> bool:
+        return any(node.client.connected for node in self.nodes)
+
+    def connect(self):
+        """Verbindet zu allen Instanzen. Nicht erreichbare werden übergangen, solange mindestens eine läuft."""
+        self._closing = False
+        for node in self.nodes:
+            try:
+                node.client.connect()
+                node.healthy = True
+            except Exception as e:
+                self._mark_unhealthy(node, e)
+        if not self.connected:
+            raise RuntimeError("Keine ComfyUI Instanz erreichbar.")
+        logger.info(f"🖥 ComfyUI Pool: {sum(n.healthy for n in self.nodes)}/{len(self.nodes)} Instanzen bereit.")
+
+    def disconnect(self):
+        self._closing = True  # Jobs, die dabei abreißen, nicht neu verteilen
+        for node in self.nodes:
+            node.client.disconnect()
+
+    def free_memory(self) -> bool:
+        return all([node.client.free_memory() for node in self.nodes if node.healthy])
+
+    # --- Verteilung ---
+
+    def _mark_unhealthy(self, node: ComfyNode, reason):
+        with self._lock:
+            was_healthy = node.healthy
+            node.healthy = False
+            node.retry_at = time.monotonic() + COMFY_NODE_RETRY_SECONDS
+        if was_healthy:
+            logger.warning(f"⚠️ ComfyUI {node.address} antwortet nicht ({reason}). "
+                           f"Wird {COMFY_NODE_RETRY_SECONDS}s übergangen.")
+            metrics.inc("comfy_node_unhealthy_total", labels={"node": node.address})
+        # Session schließen: noch laufende Jobs dort enden als 'lost' und werden neu verteilt
+        node.client.disconnect()
+
+    def _expected_wait(self, node: ComfyNode, depth: int) -> float:
+        known = [n.render_seconds for n in self.nodes if n.render_seconds is not None]
+        render = node.render_seconds or (sum(known) / len(known) if known else 1.0)
+        # /queue hinkt eigenen, gerade abgeschickten Prompts hinterher
+        return (max(depth, node.inflight) + 1) * render
+
+    def _refresh(self, node: ComfyNode):
+        """Fragt die /queue Länge ab und verbindet ggf. neu. Wer nicht antwortet, wird übergangen."""
+        try:
+            depth = node.client.queue_depth(COMFY_NODE_TIMEOUT)
+            node.client.connect()
+        except Exception as e:
+            self._mark_unhealthy(node, e)
+            return
+        with self._lock:
+            recovered = not node.healthy
+            node.depth = depth
+            node.depth_at = time.monotonic()
+            node.healthy = True
+        if recovered:
+            logger.info(f"✅ ComfyUI {node.address} ist wieder erreichbar.")
+
+    def _pick(self, exclude: Set[ComfyNode]) -> Optional[ComfyNode]:
+        """Instanz mit der kürzesten erwarteten Wartezeit (reserviert einen Platz: inflight + 1)."""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [n for n in self.nodes if n not in exclude and (n.healthy or now >= n.retry_at)]
+            stale = [n for n in candidates if not n.healthy or now - n.depth_at >= COMFY_QUEUE_DEPTH_TTL]
+            # Abfrage reservieren: gleichzeitige Aufrufer nehmen solange den alten Wert bzw. warten den Retry ab
+            for node in stale:
+                node.depth_at = now
+                if not node.healthy:
+                    node.retry_at = now + COMFY_NODE_RETRY_SECONDS
+        if len(stale) == 1:
+            self._refresh(stale[0])
+        elif stale:
+            list(self._refresher.map(self._refresh, stale))
+        with self._lock:
+            healthy = [n for n in candidates if n.healthy]
+            if not healthy:
+                return None
+            node = min(healthy, key=lambda n: (self._expected_wait(n, n.depth), n.inflight))
+            node.inflight += 1
+        return node
+
+    def submit(self, prompt_text: str, filename_prefix: str, seed: Optional[int] = None) -> ComfyJob:
+        """Wie ComfyClient.submit, aber auf der am wenigsten ausgelasteten Instanz."""
+        if seed is None:
+            seed = ComfyClient.image_seed(prompt_text)
+        job = ComfyJob("", filename_prefix)
+        self._dispatch(job, lambda client: client.submit(prompt_text, filename_prefix, seed), set())
+        return job
+
+    def submit_batch(self, scenes: List[Tuple[str, str]]) -> ComfyJob:
+        """Wie ComfyClient.submit_batch; der ganze Batch läuft auf einer Instanz (und zieht ggf. gemeinsam um)."""
+        job = ComfyJob("", scenes[0][1])
+        self._dispatch(job, lambda client: client.submit_batch(scenes), set())
+        return job
+
+    def _dispatch(self, job: ComfyJob, submit: Callable[[ComfyClient], ComfyJob], tried: Set[ComfyNode]):
+        while True:
+            node = self._pick(tried)
+            if node is None:
+                raise RuntimeError("Keine ComfyUI Instanz erreichbar.")
+            try:
+                inner = submit(node.client)
+                break
+            except Exception as e:
+                with self._lock:
+                    node.inflight -= 1
+                tried.add(node)
+                self._mark_unhealthy(node, e)
+
+        job.cache_key = inner.cache_key
+        job.branches = inner.branches
+        job.server_address = inner.server_address
+        job.set_prompt_id(inner.prompt_id)
+        # Neustarts durch den Watchdog der Instanz ändern die prompt_id auch für den Aufrufer
+        inner.add_prompt_callback(lambda inner: job.set_prompt_id(inner.prompt_id))
+        inner.add_done_callback(lambda inner: self._on_done(job, node, inner, submit, tried))
+
+    def _on_done(self, job: ComfyJob, node: ComfyNode, inner: ComfyJob, submit: Callable[[ComfyClient], ComfyJob],
+                 tried: Set[ComfyNode]):
+        with self._lock:
+            node.inflight -= 1
+        if (inner.lost or inner.stalled) and not self._closing:
+            tried.add(node)
+            # Ein einzelner hängender Workflow sagt nichts über die Instanz: nur 'lost' nimmt sie aus dem Pool
+            if inner.lost:
+                self._mark_unhealthy(node, inner.error)
+            metrics.inc("comfy_requeued_total", labels={"node": node.address}, prompt_id=inner.prompt_id)
+            logger.warning(f"🔁 '{job.filename_prefix}' wird auf einer anderen ComfyUI Instanz neu gestartet.")
+            try:
+                self._dispatch(job, submit, tried)
+                return
+            except Exception as e:
+                job.lost, job.stalled = inner.lost, inner.stalled
+                job.finish(f"{inner.error}; Neustart fehlgeschlagen: {e}")
+                return
+
+        node.observe(inner)
+        job.prompt_id = inner.prompt_id  # Nach einem Stall-Neustart hat der Job dort eine neue prompt_id
+        job.outputs = inner.outputs
+        job.progress = inner.progress
+        job.started_at = inner.started_at
+        job.lost = inner.lost
+        job.stalled = inner.stalled
+        job.finish(inner.error)
+
+    # --- Wie ComfyClient ---
+
+    def active_prompt_ids(self) -> set:
+        """prompt_ids aller erreichbaren Instanzen. Wirft nur, wenn keine antwortet."""
+        active, error = set(), None
+        reachable = 0
+        for node in self.nodes:
+            try:
+                active |= node.client.active_prompt_ids()
+                reachable += 1
+            except Exception as e:
+                logger.warning(f"⚠️ Queue von {node.address} nicht abrufbar: {e}")
+                error = e
+        if reachable == 0:
+            raise error
+        return active
+
+    def fetch_finished(self, prompt_id: str, output_name: str) -> Optional[str]:
+        for node in self.nodes:
+            try:
+                path = node.client.fetch_finished(prompt_id, output_name)
+            except Exception as e:
+                logger.warning(f"⚠️ History von {node.address} nicht abrufbar: {e}")
+                continue
+            if path:
+                return path
+        return None
+
+    def image_seed(self, prompt_text: str) -> int:
+        return self.primary.image_seed(prompt_text)
+
+    def cached_image(self, prompt_text: str, output_name: str, seed: Optional[int] = None) -> Optional[str]:
+        return self.primary.cached_image(prompt_text, output_name, seed)
+
+    def remember(self, job: ComfyJob, path: str, filename_prefix: Optional[str] = None):
+        self.primary.remember(job, path, filename_prefix)
+
+    def resolve_image(self, job: ComfyJob) -> Optional[Dict]:
+        return self.primary.resolve_image(job)
+
+    def resolve_images(self, job: ComfyJob) -> Dict[str, Optional[Dict]]:
+        return self.primary.resolve_images(job)
+
+    def download_image(self, filename: str, subfolder: str, folder_type: str, output_name: str,
+                       server_address: Optional[str] = None):
+        return self.primary.download_image(filename, subfolder, folder_type, output_name, server_address)
+
+    def collect(self, job: ComfyJob) -> Optional[str]:
+        return self.primary.collect(job)
+
+    def generate_image(self, prompt_text: str, filename_prefix: str) -> Optional[str]:
+        cached = self.cached_image(prompt_text, filename_prefix)
+        if cached:
+            return cached
+        try:
+            job = self.submit(prompt_text, filename_prefix)
+        except Exception as e:
+            logger.error(f"❌ Kritischer Fehler im Image-Loop: {e}")
+            return None
+        return self.collect(job)
+
+
+def open_comfy(workflow_name: str = COMFY_WORKFLOW):
+    """ComfyPool bei mehreren COMFY_URLS, sonst ein einzelner ComfyClient (wie bisher)."""
+    if len(COMFY_URLS) > 1:
+        return ComfyPool(COMFY_URLS, workflow_name)
+    return ComfyClient(workflow_name, server_address=COMFY_URLS[0])
@@ -0,0 +1,113 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Optional
+from config import IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_MB
+from modules.utils import setup_logging
+from modules.metrics import metrics
+
+logger = setup_logging("Image_Cache")
+
+
+def prompt_seed(prompt_text: str) -> int:
+    """Deterministischer Seed aus dem Prompt: gleicher Prompt -> gleiches Bild (auch nach Re-Import)."""
+    digest = hashlib.sha256(prompt_text.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % 1000000000 + 1
+
+
+def _link_or_copy(source: Path, target: Path):
+    """Hardlink (kostet keinen Platz), über Dateisystem-Grenzen hinweg Kopie. Ersetzt `target` atomar."""
+    try:
+        if os.path.samefile(source, target):
+            return  # Schon verlinkt (rename auf dieselbe Datei wäre ein No-op und ließe tmp liegen)
+    except FileNotFoundError:
+        pass
+    tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    try:
+        os.link(source, tmp)
+    except OSError:
+        shutil.copyfile(source, tmp)
+    os.replace(tmp, target)
+
+
+class ImageCache:
+    """
+    Content-addressed Bild-Cache auf der Platte, geteilt zwischen Prozessen.
+    Schlüssel ist der Hash aus Prompt, Seed und Workflow-Fingerprint – ändert sich eins davon,
+    wird neu gerendert. Treffer werden per Hardlink (sonst Kopie) in den Output-Ordner gelegt.
+    Die Größe ist begrenzt: beim Überschreiten fliegen die am längsten nicht benutzten Bilder raus
+    (mtime = letzter Zugriff).
+    """
+
+    def __init__(self, root: Path = IMAGE_CACHE_DIR, max_bytes: int = IMAGE_CACHE_MAX_MB * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._size: Optional[int] = None  # Geschätzte Größe, wird beim ersten put() gemessen
+
+    @staticmethod
+    def key(prompt_text: str, seed: int, workflow_fingerprint: str) -> str:
+        payload = json.dumps([prompt_text, seed, workflow_fingerprint], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.png"
+
+    def fetch(self, key: str, target: Path) -> bool:
+        """Legt das gecachte Bild unter `target` ab. False, wenn es nicht im Cache ist."""
+        source = self.path(key)
+        try:
+            os.utime(source)  # LRU: Zugriff merken
+            target.parent.mkdir(parents=True, exist_ok=True)
+            _link_or_copy(source, target)
+        except FileNotFoundError:
+            metrics.inc("image_cache_total", labels={"result": "miss"})
+            return False
+        metrics.inc("image_cache_total", labels={"result": "hit"})
+        return True
+
+    def put(self, key: str, source: Path):
+        """Übernimmt ein frisch gerendertes Bild in den Cache."""
+        target = self.path(key)
+        try:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            _link_or_copy(source, target)
+        except OSError as e:
+            logger.warning(f"⚠️ Bild konnte nicht gecacht werden: {e}")
+            return
+        if self._size is None:
+            self._size = self._measure()
+        else:
+            self._size += target.stat().st_size
+        if self._size > self.max_bytes:
+            self._evict()
+
+    def _measure(self) -> int:
+        return sum(f.stat().st_size for f in self.root.glob("*/*.png"))
+
+    def _evict(self):
+        """Löscht die ältesten Einträge, bis der Cache wieder unter 90% der Maximalgröße liegt."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = []
+            for f in self.root.glob("*/*.png"):
+                try:
+                    stat = f.stat()
+                except FileNotFoundError:
+                    continue  # Von einem anderen Prozess gerade gelöscht
+                entries.append((stat.st_mtime, stat.st_size, f))
+            size = sum(s for _, s, _ in entries)
+            limit = int(self.max_bytes * 0.9)
+            removed = 0
+            for _, entry_size, f in sorted(entries):
+                if size <= limit:
+                    break
+                f.unlink(missing_ok=True)
+                size -= entry_size
+                removed += 1
+            self._size = size
+        if removed:
+            logger.info(f"🧹 Bild-Cache: {removed} alte Einträge entfernt ({size / 1024 / 1024:.0f} MB belegt).")
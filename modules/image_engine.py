@@ -1,88 +1,483 @@
 import json
 import random
 import time
+import requests
 import websocket
 import uuid
-import requests
 import shutil
-from typing import Dict, Optional, Any, Tuple
+import threading
+from typing import Callable, Dict, List, Optional, Any, Tuple
 from pathlib import Path
-from config import COMFY_URL, COMFY_WS_URL, WORKFLOWS_DIR, OUTPUT_DIR
+from config import (COMFY_URL, COMFY_WS_URL, COMFY_WORKFLOW, OUTPUT_DIR, IMAGE_SEED_POLICY, IMAGE_CACHE_ENABLED,
+                    HTTP_RETRIES, COMFY_NODE_TIMEOUT, COMFY_WATCHDOG_INTERVAL, COMFY_STALL_STEP_FACTOR,
+                    COMFY_STALL_MIN_SECONDS, COMFY_STALL_MAX_SECONDS, COMFY_STALL_GRACE_SECONDS, COMFY_STALL_RETRIES)
 from modules.utils import setup_logging
+from modules.metrics import metrics
+from modules.image_cache import ImageCache, prompt_seed
+from modules.workflow import get_workflow_template
+from modules import transport
 
 logger = setup_logging("Image_Engine")
 
+STEP_TIME_SMOOTHING = 0.2  # Gewicht des letzten Sampler-Schritts in der gleitenden Schrittzeit
+
+
+class ComfyJob:
+    """
+    Ein an ComfyUI übergebener Auftrag.
+    Der WebSocket-Empfänger setzt `done`, sobald ComfyUI das Ende (oder einen Fehler) für
+    diese prompt_id meldet. Aufrufer warten mit `wait()`.
+    """
+
+    def __init__(self, prompt_id: str, filename_prefix: str, cache_key: Optional[str] = None):
+        self.prompt_id = prompt_id
+        self.filename_prefix = filename_prefix
+        self.cache_key = cache_key  # Schlüssel im Bild-Cache (Prompt + Seed + Workflow)
+        # Batch-Jobs (submit_batch): filename_prefix -> Cache-Schlüssel, ein Eintrag pro Szene
+        self.branches: Dict[str, Optional[str]] = {}
+        self.server_address = COMFY_URL  # ComfyUI Instanz, die den Job rendert (für den Download)
+        self.error: Optional[str] = None
+        self.lost = False  # True, wenn die Verbindung zur Instanz vor dem Ende abgerissen ist
+        self.stalled = False  # True, wenn der Watchdog den Job nach COMFY_STALL_RETRIES Neustarts aufgegeben hat
+        # Node ID -> Output, gesammelt aus den 'executed' Events des WebSockets
+        self.outputs: Dict[str, Dict] = {}
+        self.done = threading.Event()
+        # Zeitpunkte (monotonic) für Queue-Wartezeit und Ausführungsdauer
+        self.submitted_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.progress: Tuple[int, int] = (0, 0)  # (Schritt, Schritte) laut 'progress' Events
+        # Stall-Watchdog: letztes Event, letzter Sampler-Schritt, Payload & Versuche für das Neu-Einreihen
+        self.last_activity = self.submitted_at
+        self.progress_at: Optional[float] = None
+        self.workflow: Optional[Dict] = None
+        self.attempts = 0
+        self._callbacks = []
+        self._prompt_callbacks = []
+        self._callbacks_lock = threading.Lock()
+
+    def set_prompt_id(self, prompt_id: str):
+        """Setzt die prompt_id (z.B. nach einem Neustart durch den Watchdog) und meldet sie den Prompt-Callbacks."""
+        self.prompt_id = prompt_id
+        with self._callbacks_lock:
+            callbacks = list(self._prompt_callbacks)
+        for callback in callbacks:
+            callback(self)
+
+    def add_prompt_callback(self, callback):
+        """
+        Ruft `callback(job)` bei jeder neuen prompt_id auf. Läuft im Empfänger- bzw. Watchdog-Thread
+        (teils unter dem Client-Lock), darf also nur kurz etwas anstoßen.
+        """
+        with self._callbacks_lock:
+            self._prompt_callbacks.append(callback)
+
+    def finish(self, error: Optional[str] = None):
+        self.error = error
+        self.finished_at = time.monotonic()
+        with self._callbacks_lock:
+            self.done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback):
+        """Ruft `callback(job)` auf, sobald der Job fertig ist (sofort, falls er es schon ist)."""
+        with self._callbacks_lock:
+            if not self.done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """True, wenn der Job erfolgreich fertig ist."""
+        return self.done.wait(timeout) and self.error is None
+
+
 class ComfyClient:
-    def __init__(self):
-        self.server_address = COMFY_URL
-        self.ws_address = COMFY_WS_URL
+    """
+    ComfyUI Client mit einer langlebigen WebSocket-Session.
+    Ein Hintergrund-Thread liest alle Nachrichten und verteilt sie per prompt_id an die
+    wartenden Jobs. So können mehrere Prompts gleichzeitig in der ComfyUI Queue liegen,
+    und die GPU wartet nicht auf Reconnect, History oder Download.
+
+    Ein Watchdog-Thread passt auf, dass kein Job ewig hängt (siehe _check_stalls): Jobs ohne Event
+    seit stall_timeout() werden gegen /queue und /history geprüft, hängende abgebrochen und neu eingereiht.
+
+    Nutzung:
+        with ComfyClient() as comfy:
+            job = comfy.submit(prompt, "book_scene_1")
+            path = comfy.collect(job)
+    """
+
+    def __init__(self, workflow_name: str = COMFY_WORKFLOW, cache: Optional[ImageCache] = None,
+                 server_address: str = COMFY_URL, ws_address: Optional[str] = None):
+        self.workflow_name = workflow_name
+        self.cache = cache if cache is not None else (ImageCache() if IMAGE_CACHE_ENABLED else None)
+        self.server_address = server_address.rstrip("/")
+        if ws_address is None:
+            ws_address = COMFY_WS_URL if server_address == COMFY_URL else \
+                self.server_address.replace("http", "ws", 1) + "/ws"
+        self.ws_address = ws_address
         self.client_id = str(uuid.uuid4())
         self.ws = None
+        self._jobs: Dict[str, ComfyJob] = {}
+        self._lock = threading.Lock()
+        self._receiver: Optional[threading.Thread] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._watchdog_stop = threading.Event()
+        self._session_started = 0.0  # monotonic, letzter (Re)Connect des WebSockets
+        self._session_lost = False   # Empfänger hat die offenen Jobs schon als 'lost' beendet
+        # Laufende /prompt Requests und Events für noch nicht registrierte prompt_ids (siehe _enqueue)
+        self._submitting = 0
+        self._early: Dict[str, List[Dict]] = {}
+        self.step_seconds: Optional[float] = None  # Gleitende Sekunden pro Sampler-Schritt (alle Jobs)
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.disconnect()
+
+    @property
+    def connected(self) -> bool:
+        return self.ws is not None and self.ws.connected
+
+    @property
+    def node_count(self) -> int:
+        """Anzahl ComfyUI Instanzen hinter diesem Client (siehe ComfyPool)."""
+        return 1
 
     def connect(self):
-        """Verbindet zum WebSocket."""
+        """Verbindet zum WebSocket und startet den Empfänger-Thread (no-op, wenn schon verbunden)."""
+        if self.connected:
+            return
         try:
-            # ComfyUI erwartet client_id im URL Parameter
-            ws_url = f"{self.ws_address}?clientId={self.client_id}"
-            self.ws = websocket.WebSocket()
-            self.ws.connect(ws_url)
-            logger.info("🔌 WebSocket Verbindung zu ComfyUI hergestellt.")
+            ws = self._open_websocket()
+            logger.info(f"🔌 WebSocket Verbindung zu ComfyUI hergestellt ({self.server_address}).")
         except Exception as e:
-            logger.error(f"❌ Konnte keine WebSocket Verbindung herstellen: {e}")
+            logger.error(f"❌ Konnte keine WebSocket Verbindung herstellen ({self.server_address}): {e}")
             raise
+        self._start_receiver(ws)
+        if self._watchdog is None:
+            self._watchdog_stop = threading.Event()
+            self._watchdog = threading.Thread(target=self._watchdog_loop, args=(self._watchdog_stop,),
+                                              name="ComfyWatchdog", daemon=True)
+            self._watchdog.start()
+
+    def _open_websocket(self, timeout: Optional[float] = None):
+        # ComfyUI erwartet client_id im URL Parameter
+        ws = websocket.WebSocket()
+        ws.connect(f"{self.ws_address}?clientId={self.client_id}", timeout=timeout)
+        ws.settimeout(None)  # recv() blockiert; Stille erkennt der Watchdog
+        return ws
+
+    def _start_receiver(self, ws):
+        self.ws = ws
+        self._session_lost = False
+        self._session_started = time.monotonic()
+        self._receiver = threading.Thread(target=self._receive_loop, args=(ws,), name="ComfyReceiver", daemon=True)
+        self._receiver.start()
 
     def disconnect(self):
         if self.ws:
-            self.ws.close()
+            ws, self.ws = self.ws, None
+            ws.close()
             logger.info("🔌 WebSocket Verbindung geschlossen.")
+        # Aus einem Job-Callback bzw. dem Watchdog heraus läuft disconnect() im jeweiligen Thread selbst
+        if self._receiver:
+            if self._receiver is not threading.current_thread():
+                self._receiver.join(timeout=5)
+            self._receiver = None
+        if self._watchdog:
+            self._watchdog_stop.set()
+            if self._watchdog is not threading.current_thread():
+                self._watchdog.join(timeout=5)
+            self._watchdog = None
 
-    def load_workflow(self, workflow_name: str = "comfy_workflow_api.json") -> Dict:
-        path = WORKFLOWS_DIR / workflow_name
+    def _reconnect(self) -> bool:
+        """
+        Ersetzt die WebSocket-Session (gleiche client_id, ComfyUI schickt die Events dann an die neue).
+        Offene Jobs bleiben registriert. Klappt es nicht, wird getrennt und alle offenen Jobs enden als 'lost'.
+        """
+        old = self.ws
+        if old is None:
+            return False
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except FileNotFoundError:
-            logger.error(f"❌ Workflow Datei nicht gefunden: {path}")
-            raise
+            ws = self._open_websocket(COMFY_NODE_TIMEOUT)
+        except Exception as e:
+            logger.error(f"❌ Reconnect zu ComfyUI ({self.server_address}) fehlgeschlagen: {e}")
+            self.disconnect()
+            return False
+        self._start_receiver(ws)
+        old.close()
+        logger.info(f"🔌 WebSocket zu ComfyUI neu verbunden ({self.server_address}).")
+        return True
+
+    def _receive_loop(self, ws):
+        """Liest WebSocket-Nachrichten und routet sie per prompt_id an die Jobs."""
+        try:
+            while True:
+                out = ws.recv()
+                if not isinstance(out, str):
+                    continue  # Binäre Vorschaubilder ignorieren
+                self._dispatch(json.loads(out))
+        except Exception as e:
+            if self.ws is ws:
+                logger.error(f"❌ WebSocket Verbindung verloren: {e}")
+            reason = f"WebSocket geschlossen: {e}"
+        else:
+            reason = "WebSocket geschlossen"
+        if self.ws is not None and self.ws is not ws:
+            return  # Reconnect: die offenen Jobs laufen über die neue Session weiter
+        # Alle noch offenen Jobs freigeben, damit kein Aufrufer ewig wartet
+        with self._lock:
+            jobs, self._jobs = list(self._jobs.values()), {}
+            self._session_lost = True
+        for job in jobs:
+            job.lost = True
+            job.finish(reason)
+
+    def _dispatch(self, message: Dict):
+        with self._lock:
+            self._dispatch_locked(message)
+
+    def _dispatch_locked(self, message: Dict):
+        msg_type = message.get("type")
+        data = message.get("data", {})
+        prompt_id = data.get("prompt_id")
+        job = self._jobs.get(prompt_id)
+        if job is None:
+            # Schnelle Jobs melden sich evtl., bevor _enqueue sie registriert hat
+            if prompt_id and self._submitting:
+                self._early.setdefault(prompt_id, []).append(message)
+            return
+        now = time.monotonic()
+        job.last_activity = now
+        if msg_type == "execution_start" or (msg_type == "executing" and data.get("node") is not None):
+            # Job hat die ComfyUI Queue verlassen und läuft auf der GPU
+            if job.started_at is None:
+                job.started_at = time.monotonic()
+        elif msg_type == "progress":
+            value = data.get("value", 0)
+            self._observe_step(job, value, now)
+            job.progress = (value, data.get("max", 0))
+        elif msg_type == "executed" and data.get("output"):
+            job.outputs[str(data.get("node"))] = data["output"]
+        elif msg_type == "executing" and data.get("node") is None:
+            del self._jobs[job.prompt_id]
+            job.finish()
+            self._record_job(job)
+        elif msg_type in ("execution_error", "execution_interrupted"):
+            del self._jobs[job.prompt_id]
+            job.finish(data.get("exception_message") or msg_type)
+            self._record_job(job)
 
-    def find_nodes(self, workflow: Dict) -> Tuple[str, str]:
+    @staticmethod
+    def _record_job(job: ComfyJob):
+        """Queue-Wartezeit (Submit bis Start) und Ausführungsdauer (Start bis Ende) laut WebSocket Events."""
+        labels = {"status": "error" if job.error else "ok"}
+        started = job.started_at or job.finished_at
+        metrics.observe("comfy_queue_wait_seconds", started - job.submitted_at, labels, prompt_id=job.prompt_id)
+        metrics.observe("comfy_execution_seconds", job.finished_at - started, labels,
+                        prompt_id=job.prompt_id, steps=job.progress[1])
+
+    # --- Stall-Watchdog ---
+
+    def _observe_step(self, job: ComfyJob, value: int, now: float):
+        """Gleitende Sekunden pro Sampler-Schritt (Basis für stall_timeout). Neustarts des Zählers (Batch) zählen nicht."""
+        steps = value - job.progress[0]
+        if job.progress_at is not None and steps > 0:
+            seconds = (now - job.progress_at) / steps
+            if self.step_seconds is None:
+                self.step_seconds = seconds
+            else:
+                self.step_seconds += STEP_TIME_SMOOTHING * (seconds - self.step_seconds)
+        job.progress_at = now
+
+    def stall_timeout(self) -> float:
+        """So lange darf ein Job ohne Event bleiben: COMFY_STALL_STEP_FACTOR Sampler-Schritte, begrenzt auf MIN..MAX."""
+        if self.step_seconds is None:
+            return COMFY_STALL_MAX_SECONDS
+        return min(COMFY_STALL_MAX_SECONDS, max(COMFY_STALL_MIN_SECONDS, COMFY_STALL_STEP_FACTOR * self.step_seconds))
+
+    def _watchdog_loop(self, stop: threading.Event):
+        while not stop.wait(COMFY_WATCHDOG_INTERVAL):
+            try:
+                self._check_stalls()
+            except Exception as e:
+                logger.warning(f"⚠️ Watchdog ({self.server_address}): {e}")
+
+    def _check_stalls(self, verify_all: bool = False):
         """
-        Analysiert den Graphen und findet dynamisch:
-        1. Die KSampler Node (für Seed)
-        2. Die Positive Prompt Node (CLIPTextEncode)
-        
-        Returns: (sampler_id, prompt_node_id)
+        Ein Durchlauf des Watchdogs. Jobs ohne Event seit stall_timeout() werden gegen /queue geprüft:
+        - wartet noch in der Queue -> ok (z.B. hinter fremden Prompts)
+        - läuft laut /queue -> erst die Session erneuern (vielleicht ist nur der WebSocket still abgerissen);
+          bleibt der Job danach COMFY_STALL_GRACE_SECONDS still, hängt er: /interrupt, aus /queue löschen, neu einreihen
+        - ComfyUI kennt ihn nicht mehr -> fertig laut /history (Ende verpasst) oder verschwunden (neu einreihen)
+        `verify_all` prüft alle offenen Jobs auf verpasste Enden (nach einem Reconnect).
         """
-        sampler_id = None
-        prompt_id = None
-        
-        # 1. Suche KSampler
-        for node_id, node_data in workflow.items():
-            if node_data.get("class_type") == "KSampler":
-                sampler_id = node_id
-                # Finde den Input Link für "positive"
-                # Format: "positive": ["6", 0] -> Node ID ist "6"
-                positive_input = node_data.get("inputs", {}).get("positive")
-                if positive_input and isinstance(positive_input, list):
-                    prompt_id = positive_input[0]
-                break
-        
-        if not sampler_id or not prompt_id:
-             # Fallback Suche: Falls kein KSampler gefunden (z.B. anderer Sampler Name), suche einfach nach CLIPTextEncode
-             logger.warning("⚠️ Standard KSampler Verbindung nicht gefunden. Suche nach erstem CLIPTextEncode...")
-             for node_id, node_data in workflow.items():
-                 if node_data.get("class_type") == "CLIPTextEncode" and not prompt_id:
-                     prompt_id = node_id
-                 if node_data.get("class_type") == "KSampler" and not sampler_id:
-                     sampler_id = node_id
-
-        if not sampler_id:
-            raise ValueError("Kein KSampler im Workflow gefunden.")
-        if not prompt_id:
-            raise ValueError("Kein Prompt-Node (CLIPTextEncode) gefunden.")
-            
-        logger.info(f"🔍 Graph Analyse: KSampler ID='{sampler_id}', Prompt Node ID='{prompt_id}'")
-        return sampler_id, prompt_id
+        now = time.monotonic()
+        timeout = self.stall_timeout()
+        with self._lock:
+            jobs = list(self._jobs.values())
+        silent = [job for job in jobs if now - job.last_activity > timeout]
+        if not silent and not verify_all:
+            return
+        try:
+            running, pending = self.queue_state(COMFY_NODE_TIMEOUT, retries=0)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"❌ ComfyUI ({self.server_address}) antwortet nicht mehr: {e}. Trenne die Verbindung.")
+            self.disconnect()  # Offene Jobs enden als 'lost' (der ComfyPool verteilt sie neu)
+            return
+
+        suspect, stalled, gone, missed = [], [], [], False
+        for job in jobs if verify_all else silent:
+            if job.prompt_id in pending:
+                job.last_activity = now
+            elif job.prompt_id in running:
+                if job not in silent:
+                    continue
+                if self._session_started <= job.last_activity:
+                    suspect.append(job)
+                elif now - self._session_started >= COMFY_STALL_GRACE_SECONDS:
+                    stalled.append(job)
+            else:
+                finished = self._finish_from_history(job)
+                if finished is None:
+                    gone.append(job)
+                missed = missed or finished
+
+        for job in suspect:
+            logger.warning(f"⏳ '{job.filename_prefix}' seit {now - job.last_activity:.0f}s ohne Fortschritt "
+                           f"(Limit {timeout:.0f}s). Prüfe mit neuer WebSocket-Session...")
+        # Jobs, die inzwischen doch regulär fertig wurden, fallen hier heraus
+        stalled = [job for job in stalled if self._interrupt(job, now - job.last_activity)]
+        gone = [job for job in gone if self._unregister(job)]
+        reconnected = not (suspect or missed) or self._reconnect()
+        for job, reason in [(job, "hängt") for job in stalled] + [(job, "ist aus ComfyUI verschwunden") for job in gone]:
+            if reconnected:
+                self._requeue(job, reason)
+            else:
+                self._give_up(job, f"{reason}, ComfyUI nicht erreichbar")
+        if (suspect or missed) and not verify_all and self.ws is not None:
+            self._check_stalls(verify_all=True)
+
+    def _unregister(self, job: ComfyJob) -> bool:
+        """Nimmt den Job aus dem Routing. False, wenn er inzwischen regulär fertig wurde."""
+        with self._lock:
+            return self._jobs.pop(job.prompt_id, None) is job
+
+    def _finish_from_history(self, job: ComfyJob) -> Optional[bool]:
+        """
+        Job steht weder in /queue noch kam sein Ende an: Ergebnis aus /history übernehmen.
+        True = aus der History beendet, False = war schon fertig, None = ComfyUI kennt den Job nicht.
+        """
+        try:
+            res = transport.get(f"{self.server_address}/history/{job.prompt_id}", timeout=COMFY_NODE_TIMEOUT)
+            res.raise_for_status()
+            entry = res.json().get(job.prompt_id)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning(f"⚠️ History für {job.prompt_id} nicht abrufbar: {e}")
+            return False
+        if not entry:
+            return None
+        if not self._unregister(job):
+            return False
+        status = entry.get("status", {}).get("status_str", "success")
+        job.outputs.update(entry.get("outputs", {}))
+        logger.warning(f"🩹 Ende von '{job.filename_prefix}' per WebSocket verpasst, übernehme es aus der History.")
+        metrics.inc("comfy_stalls_total", labels={"node": self.server_address, "action": "recovered"})
+        job.finish(None if status == "success" else f"ComfyUI Status: {status}")
+        self._record_job(job)
+        return True
+
+    def _interrupt(self, job: ComfyJob, silence: float) -> bool:
+        """Bricht den hängenden Prompt ab und löscht ihn aus der Queue (falls er dort noch steht)."""
+        if not self._unregister(job):
+            return False
+        logger.error(f"⏰ '{job.filename_prefix}' hängt ({silence:.0f}s ohne Fortschritt). Breche Prompt {job.prompt_id} ab.")
+        for path, payload in (("/interrupt", {"prompt_id": job.prompt_id}), ("/queue", {"delete": [job.prompt_id]})):
+            try:
+                transport.post(f"{self.server_address}{path}", json=payload, idempotent=True,
+                               timeout=COMFY_NODE_TIMEOUT).raise_for_status()
+            except requests.exceptions.RequestException as e:
+                logger.warning(f"⚠️ {path} für {job.prompt_id} fehlgeschlagen: {e}")
+        return True
+
+    def _requeue(self, job: ComfyJob, reason: str):
+        """
+        Stellt denselben Workflow (schon aus dem Routing genommen) neu in die Queue.
+        Der Aufrufer wartet weiter auf denselben ComfyJob.
+        """
+        if job.workflow is None or job.attempts >= COMFY_STALL_RETRIES:
+            self._give_up(job, f"{reason}, {job.attempts} Neustarts aufgebraucht", node_failed=False)
+            return
+        def register(prompt_id: str) -> ComfyJob:
+            job.attempts += 1
+            job.outputs = {}
+            job.started_at = job.progress_at = None
+            job.progress = (0, 0)
+            job.last_activity = time.monotonic()
+            job.set_prompt_id(prompt_id)  # z.B. Art-Pipeline: neue prompt_id in den Lease der Szene
+            return job
+
+        try:
+            self._enqueue(job.workflow, register)
+        except Exception as e:
+            self._give_up(job, f"{reason}, neu einreihen fehlgeschlagen: {e}")
+            return
+        metrics.inc("comfy_stalls_total", labels={"node": self.server_address, "action": "requeue"})
+        logger.warning(f"🔁 '{job.filename_prefix}' {reason} -> neu eingereiht als {job.prompt_id} "
+                       f"(Neustart {job.attempts}/{COMFY_STALL_RETRIES}).")
+
+    def _give_up(self, job: ComfyJob, reason: str, node_failed: bool = True):
+        """
+        Beendet den Job mit Fehler. `node_failed`: die Instanz selbst ist das Problem ('lost', ein ComfyPool
+        übergeht sie eine Weile), sonst nur dieser Workflow ('stalled', die Instanz bleibt im Einsatz).
+        Ein ComfyPool versucht beides auf einer anderen Instanz, sonst geht die Szene zurück auf 'Pending'.
+        """
+        metrics.inc("comfy_stalls_total", labels={"node": self.server_address, "action": "give_up"})
+        logger.error(f"❌ '{job.filename_prefix}' {reason}. Gebe auf.")
+        job.lost = node_failed
+        job.stalled = not node_failed
+        job.finish(f"ComfyUI Job {reason}")
+
+    def _enqueue(self, workflow: Dict, register: Callable[[str], ComfyJob]) -> ComfyJob:
+        """
+        Stellt den Workflow in die ComfyUI Queue. Der Lock wird nicht über den HTTP-Request gehalten
+        (ein langsames /prompt würde sonst Empfänger, Watchdog und alle anderen Submits blockieren).
+        `register(prompt_id)` bereitet den Job unter dem Lock vor; Events, die vor der Registrierung
+        ankamen, werden danach nachgespielt.
+        """
+        with self._lock:
+            self._submitting += 1
+        try:
+            prompt_id = self.queue_prompt(workflow)
+        except Exception:
+            with self._lock:
+                self._end_submit()
+            raise
+        with self._lock:
+            early = self._early.pop(prompt_id, [])
+            self._end_submit()
+            job = register(prompt_id)
+            if self._session_lost:
+                # Session ist während des Requests abgerissen: wie die übrigen offenen Jobs beenden
+                job.lost = True
+                job.finish("WebSocket geschlossen")
+                return job
+            self._jobs[prompt_id] = job
+            for message in early:
+                self._dispatch_locked(message)
+        return job
+
+    def _end_submit(self):
+        """(Unter Lock) Ein /prompt Request ist durch. Ohne laufende Requests gehören gepufferte Events niemandem."""
+        self._submitting -= 1
+        if not self._submitting:
+            self._early.clear()
 
     def queue_prompt(self, workflow: Dict) -> str:
         """Sendet den Workflow an die API und gibt die Prompt-ID zurück."""
@@ -90,33 +485,90 @@ class ComfyClient:
         data = json.dumps(p).encode('utf-8')
         
         try:
-            req = requests.post(f"{self.server_address}/prompt", data=data)
+            req = transport.post(f"{self.server_address}/prompt", data=data)  # Nicht wiederholen: würde doppelt rendern
             return req.json()["prompt_id"]
         except Exception as e:
             logger.error(f"❌ Fehler beim Senden des Prompts: {e}")
             raise
 
-    def get_history(self, prompt_id: str) -> Dict:
-        """Holt die Metadaten des fertiggestellten Jobs."""
+    def free_memory(self) -> bool:
+        """Bittet ComfyUI, Modelle zu entladen und VRAM freizugeben (vor einem Wechsel zu Ollama)."""
         try:
-            res = requests.get(f"{self.server_address}/history/{prompt_id}")
+            res = transport.post(f"{self.server_address}/free", json={"unload_models": True, "free_memory": True},
+                                 idempotent=True)
+            res.raise_for_status()
+            logger.info("🧹 ComfyUI VRAM freigegeben.")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Fehler beim Freigeben des ComfyUI VRAM: {e}")
+            return False
+
+    def get_history(self, prompt_id: str, server_address: Optional[str] = None) -> Dict:
+        """Holt die Metadaten des fertiggestellten Jobs (von `server_address`, Default: diese Instanz)."""
+        try:
+            res = transport.get(f"{server_address or self.server_address}/history/{prompt_id}")
             return res.json()[prompt_id]
         except Exception as e:
              logger.error(f"❌ Fehler beim Abrufen der History: {e}")
              return {}
 
-    def download_image(self, filename: str, subfolder: str, folder_type: str, output_name: str):
-        """Lädt das Bild von ComfyUI herunter und speichert es lokal im Output-Ordner."""
+    def queue_state(self, timeout: float = 10, retries: int = HTTP_RETRIES) -> Tuple[set, set]:
+        """(laufende, wartende) prompt_ids laut /queue (aller Clients). Wirft bei Verbindungsfehlern."""
+        res = transport.get(f"{self.server_address}/queue", timeout=timeout, retries=retries)
+        res.raise_for_status()
+        data = res.json()
+        return tuple({item[1] for item in data.get(key, [])} for key in ("queue_running", "queue_pending"))
+
+    def active_prompt_ids(self) -> set:
+        """prompt_ids, die ComfyUI gerade ausführt oder in der Queue hat. Wirft bei Verbindungsfehlern."""
+        running, pending = self.queue_state()
+        return running | pending
+
+    def queue_depth(self, timeout: float = 10) -> int:
+        """
+        Laufende + wartende Prompts in der ComfyUI Queue (aller Clients). Wirft bei Verbindungsfehlern.
+        Ohne Wiederholungen: der Pool nutzt das als Health Check und soll ausgefallene Instanzen sofort übergehen.
+        """
+        running, pending = self.queue_state(timeout, retries=0)
+        return len(running) + len(pending)
+
+    def finished_image(self, prompt_id: str, filename_prefix: Optional[str] = None) -> Optional[Dict]:
+        """Bildinfos eines fertigen Jobs laut /history, None wenn ComfyUI ihn nicht (mehr) kennt."""
+        res = transport.get(f"{self.server_address}/history/{prompt_id}", timeout=10)
+        res.raise_for_status()
+        entry = res.json().get(prompt_id)
+        return self._first_image(entry.get("outputs", {}), filename_prefix) if entry else None
+
+    def fetch_finished(self, prompt_id: str, output_name: str) -> Optional[str]:
+        """
+        Lädt das Bild eines schon fertigen Jobs (laut /history) herunter. None, wenn es keins gibt.
+        Bei Batch-Prompts wird das Bild der Szene über den Prefix (= output_name) gefunden.
+        """
+        img_data = self.finished_image(prompt_id, output_name)
+        if img_data is None:
+            return None
+        return self.download_image(img_data["filename"], img_data["subfolder"], img_data["type"], output_name)
+
+    def download_image(self, filename: str, subfolder: str, folder_type: str, output_name: str,
+                       server_address: Optional[str] = None):
+        """
+        Lädt das Bild von ComfyUI herunter und speichert es lokal im Output-Ordner.
+        `server_address` ist die Instanz, die gerendert hat (Default: diese).
+        Das PNG wird blockweise in eine Temp-Datei gestreamt und erst komplett an seinen Platz verschoben
+        (die alte Datei kann ein Hardlink in den Bild-Cache sein, große Upscales landen nie ganz im Speicher).
+        """
         data = {"filename": filename, "subfolder": subfolder, "type": folder_type}
         
         try:
-            response = requests.get(f"{self.server_address}/view", params=data)
-            
+            start = time.monotonic()
             # Zieldatei
             target_path = OUTPUT_DIR / f"{output_name}.png"
-            
-            with open(target_path, "wb") as f:
-                f.write(response.content)
+            size = transport.download(f"{server_address or self.server_address}/view", target_path, params=data)
+
+            elapsed = time.monotonic() - start
+            metrics.observe("comfy_download_seconds", elapsed, file=output_name, bytes=size)
+            if elapsed > 0:
+                metrics.observe("comfy_download_bytes_per_second", size / elapsed, file=output_name)
             
             logger.info(f"💾 Bild gespeichert: {target_path}")
             return str(target_path)
@@ -125,67 +577,166 @@ class ComfyClient:
             logger.error(f"❌ Fehler beim Download des Bildes: {e}")
             return None
 
-    def generate_image(self, prompt_text: str, filename_prefix: str) -> Optional[str]:
+    @staticmethod
+    def image_seed(prompt_text: str) -> int:
+        """Seed laut IMAGE_SEED_POLICY: aus dem Prompt abgeleitet (Default) oder zufällig."""
+        if IMAGE_SEED_POLICY == "random":
+            # Random Seed setzen (MAX INT Sicherheitshalber begrenzen)
+            return random.randint(1, 1000000000)
+        return prompt_seed(prompt_text)
+
+    def _cache_key(self, prompt_text: str, seed: int) -> Optional[str]:
+        if self.cache is None:
+            return None
+        return self.cache.key(prompt_text, seed, get_workflow_template(self.workflow_name).fingerprint)
+
+    def cached_image(self, prompt_text: str, output_name: str, seed: Optional[int] = None) -> Optional[str]:
         """
-        Hauptmethode:
-        1. Lädt Workflow
-        2. Setzt Prompt & Seed
-        3. Sendet an ComfyUI
-        4. Wartet auf WebSocket Completion
-        5. Lädt Bild herunter
+        Liegt das Bild (gleicher Prompt, Seed & Workflow) schon im Cache, wird es ohne GPU
+        in den Output-Ordner gelegt und der Pfad zurückgegeben. Sonst None.
+        """
+        key = self._cache_key(prompt_text, seed if seed is not None else self.image_seed(prompt_text))
+        if key is None:
+            return None
+        target_path = OUTPUT_DIR / f"{output_name}.png"
+        if not self.cache.fetch(key, target_path):
+            return None
+        logger.info(f"♻️ Bild aus dem Cache: {target_path}")
+        return str(target_path)
+
+    def remember(self, job: ComfyJob, path: str, filename_prefix: Optional[str] = None):
+        """Legt ein heruntergeladenes Bild im Cache ab (für Reruns). Bei Batch-Jobs: Bild der Szene `filename_prefix`."""
+        key = job.branches.get(filename_prefix, job.cache_key) if filename_prefix else job.cache_key
+        if self.cache is not None and key:
+            self.cache.put(key, Path(path))
+
+    def submit(self, prompt_text: str, filename_prefix: str, seed: Optional[int] = None) -> ComfyJob:
+        """
+        Setzt Prompt & Seed, stellt den Workflow in die ComfyUI Queue und kehrt sofort zurück.
+        Der Job wird über den WebSocket-Empfänger fertig gemeldet.
         """
         logger.info(f"🎨 Starte Bild-Generierung: '{filename_prefix}'")
-        
-        workflow = self.load_workflow()
-        sampler_id, prompt_node_id = self.find_nodes(workflow)
-        
-        # Modifikationen am Workflow
-        # 1. Prompt setzen
-        workflow[prompt_node_id]["inputs"]["text"] = prompt_text
-        
-        # 2. Random Seed setzen (MAX INT Sicherheitshalber begrenzen)
-        seed = random.randint(1, 1000000000)
-        workflow[sampler_id]["inputs"]["seed"] = seed
-        
+
+        # Kompilierter Workflow (einmal pro Lauf geladen, neu nur bei geänderter Datei)
+        template = get_workflow_template(self.workflow_name)
+
+        if seed is None:
+            seed = self.image_seed(prompt_text)
+        workflow = template.render(prompt_text, seed, filename_prefix=filename_prefix)
+        cache_key = self.cache.key(prompt_text, seed, template.fingerprint) if self.cache is not None else None
+
+        def register(prompt_id: str) -> ComfyJob:
+            job = ComfyJob(prompt_id, filename_prefix, cache_key)
+            job.server_address = self.server_address
+            job.workflow = workflow
+            return job
+
+        self.connect()
+        return self._enqueue(workflow, register)
+
+    def submit_batch(self, scenes: List[Tuple[str, str]]) -> ComfyJob:
+        """
+        Stellt mehrere Szenen (prompt_text, filename_prefix) als einen Prompt in die Queue
+        (siehe WorkflowTemplate.render_batch). Die Bilder je Szene liefert resolve_images().
+        """
+        template = get_workflow_template(self.workflow_name)
+        items = [(prompt_text, self.image_seed(prompt_text), prefix) for prompt_text, prefix in scenes]
+        workflow = template.render_batch(items)
+        logger.info(f"🎨 Starte Batch-Generierung: {len(items)} Szenen ab '{items[0][2]}'")
+
+        def register(prompt_id: str) -> ComfyJob:
+            job = ComfyJob(prompt_id, items[0][2])
+            job.server_address = self.server_address
+            job.workflow = workflow
+            job.branches = {prefix: (self.cache.key(prompt_text, seed, template.fingerprint)
+                                     if self.cache is not None else None)
+                            for prompt_text, seed, prefix in items}
+            return job
+
         self.connect()
+        return self._enqueue(workflow, register)
+
+    def resolve_images(self, job: ComfyJob) -> Dict[str, Optional[Dict]]:
+        """Wartet auf einen Batch-Job und liefert je Szene (filename_prefix) die Bildinfos oder None."""
+        if not job.wait():
+            logger.error(f"❌ ComfyUI Batch-Job {job.prompt_id} fehlgeschlagen: {job.error}")
+            return {prefix: None for prefix in job.branches}
+        logger.info(f"✅ Batch-Generierung abgeschlossen ({len(job.branches)} Szenen).")
+
+        images = {prefix: self._first_image(job.outputs, prefix) for prefix in job.branches}
+        if None in images.values():
+            logger.warning("⚠️ Nicht alle Bild-Outputs per WebSocket erhalten. Frage History ab...")
+            outputs = self.get_history(job.prompt_id, job.server_address).get('outputs', {})
+            images = {prefix: img or self._first_image(outputs, prefix) for prefix, img in images.items()}
+        return images
+
+    @staticmethod
+    def _first_image(outputs: Dict[str, Dict], filename_prefix: Optional[str] = None) -> Optional[Dict]:
+        """
+        Sucht in den Outputs (Node ID -> Output) das erste Bild. SaveImage ('output') vor Previews ('temp').
+        Mit `filename_prefix` nur Bilder dieses Prefix (ComfyUI speichert als '<prefix>_00001_.png').
+        """
+        images = [img for node_output in outputs.values() for img in node_output.get('images', [])
+                  if filename_prefix is None or img.get('filename', '').startswith(f"{filename_prefix}_")]
+        for img in images:
+            if img.get('type') == 'output':
+                return img
+        return images[0] if images else None
+
+    def resolve_image(self, job: ComfyJob) -> Optional[Dict]:
+        """Wartet auf den Job und liefert die Bildinfos (filename, subfolder, type) oder None."""
         try:
-            prompt_id = self.queue_prompt(workflow)
-            
-            # WebSocket Loop: Warten bis fertig
-            while True:
-                out = self.ws.recv()
-                if isinstance(out, str):
-                    message = json.loads(out)
-                    
-                    # Check Executing
-                    if message['type'] == 'executing':
-                        data = message['data']
-                        if data['node'] is None and data['prompt_id'] == prompt_id:
-                            logger.info("✅ Generierung abgeschlossen (ComfyUI reported finish).")
-                            break
-            
-            # Bildinformationen aus History holen
-            history = self.get_history(prompt_id)
-            outputs = history['outputs']
-            
-            # Wir nehmen an, es gibt eine Output Node (meist die letzte)
-            # Iteriere über alle Outputs und finde Images
-            for node_id in outputs:
-                node_output = outputs[node_id]
-                if 'images' in node_output:
-                    # Nimm das erste Bild
-                    img_data = node_output['images'][0]
-                    return self.download_image(
-                        img_data['filename'], 
-                        img_data['subfolder'], 
-                        img_data['type'],
-                        filename_prefix
-                    )
-                    
+            if not job.wait():
+                logger.error(f"❌ ComfyUI Job {job.prompt_id} fehlgeschlagen: {job.error}")
+                return None
+            logger.info("✅ Generierung abgeschlossen (ComfyUI reported finish).")
+
+            # Bildinformationen kommen per 'executed' Event über den WebSocket.
+            # Die History ist nur Fallback (z.B. wenn Events verpasst wurden).
+            img_data = self._first_image(job.outputs)
+            if img_data is None:
+                logger.warning("⚠️ Keine Bild-Outputs per WebSocket erhalten. Frage History ab...")
+                history = self.get_history(job.prompt_id, job.server_address)
+                img_data = self._first_image(history.get('outputs', {}))
+            return img_data
+
+        except Exception as e:
+            logger.error(f"❌ Kritischer Fehler im Image-Loop: {e}")
             return None
-            
+
+    def collect(self, job: ComfyJob) -> Optional[str]:
+        """Wartet auf den Job und lädt das Bild herunter."""
+        img_data = self.resolve_image(job)
+        if img_data is None:
+            return None
+        path = self.download_image(
+            img_data['filename'],
+            img_data['subfolder'],
+            img_data['type'],
+            job.filename_prefix,
+            job.server_address
+        )
+        if path:
+            self.remember(job, path)
+        return path
+
+    def generate_image(self, prompt_text: str, filename_prefix: str) -> Optional[str]:
+        """
+        Hauptmethode (blockierend, ein Bild):
+        1. Holt den kompilierten Workflow
+        2. Setzt Prompt, Seed & Output-Prefix
+        3. Sendet an ComfyUI
+        4. Wartet auf WebSocket Completion (inkl. 'executed' Outputs)
+        5. Lädt Bild herunter
+        Die WebSocket-Verbindung bleibt offen und wird für weitere Bilder wiederverwendet.
+        Liegt das Bild schon im Cache, wird gar nicht gerendert.
+        """
+        try:
+            cached = self.cached_image(prompt_text, filename_prefix)
+            if cached:
+                return cached
+            job = self.submit(prompt_text, filename_prefix)
         except Exception as e:
             logger.error(f"❌ Kritischer Fehler im Image-Loop: {e}")
             return None
-        finally:
-            self.disconnect()
+        return self.collect(job)
@@ -0,0 +1,599 @@
+import fcntl
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List, Dict, Optional, Callable, Iterator
+from config import (
+    AIRTABLE_TABLE_BOOKS, AIRTABLE_TABLE_SCENES, JOB_STORE_PUSH_INTERVAL, JOB_STORE_PULL_INTERVAL,
+    JOB_STORE_RECONCILE_INTERVAL, SCENE_LEASE_SECONDS, SCENE_MAX_ATTEMPTS, SCENE_RETRY_BACKOFF_SECONDS
+)
+from modules.utils import setup_logging
+
+logger = setup_logging("JobStore")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    id TEXT PRIMARY KEY,
+    airtable_id TEXT UNIQUE,
+    title TEXT,
+    topic TEXT,
+    status TEXT,
+    dirty INTEGER NOT NULL DEFAULT 1,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scenes (
+    id TEXT PRIMARY KEY,
+    airtable_id TEXT UNIQUE,
+    book_id TEXT NOT NULL REFERENCES books(id),
+    scene_number INTEGER NOT NULL,
+    story_text TEXT,
+    image_prompt TEXT,
+    status TEXT NOT NULL,
+    image_path TEXT,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    dirty INTEGER NOT NULL DEFAULT 1,
+    updated_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    prompt_id TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    retry_after REAL
+);
+CREATE INDEX IF NOT EXISTS idx_scenes_status ON scenes(status);
+CREATE INDEX IF NOT EXISTS idx_scenes_book ON scenes(book_id, scene_number);
+CREATE INDEX IF NOT EXISTS idx_scenes_number ON scenes(scene_number);
+CREATE INDEX IF NOT EXISTS idx_scenes_dirty ON scenes(dirty) WHERE dirty = 1;
+CREATE INDEX IF NOT EXISTS idx_books_dirty ON books(dirty) WHERE dirty = 1;
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Spalte -> Airtable Feld (Szenen)
+SCENE_FIELDS = {
+    "scene_number": "Scene Number",
+    "story_text": "Story Text",
+    "image_prompt": "Image Prompt",
+    "status": "Image Status",
+    "image_path": "Local Image Path",
+}
+
+
+# Spalten, die nach der ersten Version dazukamen (werden bei alten Datenbanken per ALTER TABLE ergänzt)
+SCENE_MIGRATIONS = {
+    "lease_owner": "TEXT",
+    "lease_expires": "REAL",
+    "prompt_id": "TEXT",
+    "attempts": "INTEGER NOT NULL DEFAULT 0",
+    "retry_after": "REAL",
+}
+
+# Status während des Renderns. Nur lokal: nach Airtable wird er als 'Pending' gespiegelt.
+STATUS_IN_PROGRESS = "In Progress"
+
+
+def lease_owner() -> str:
+    """Kennung dieses Prozesses für Szenen-Leases (Host + PID)."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def owner_alive(owner: Optional[str]) -> bool:
+    """False, wenn der Lease-Besitzer ein beendeter Prozess auf diesem Host ist. Fremde Hosts gelten als lebendig."""
+    host, _, pid = (owner or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _new_id() -> str:
+    # Gleiche Länge wie Airtable Record IDs ("rec" + 14 Zeichen)
+    return "loc" + uuid.uuid4().hex[:14]
+
+
+class JobStore:
+    """
+    Lokaler SQLite Job Store als Source of Truth für die Pipeline.
+    Story- und Art-Modus lesen und schreiben hier mit Festplatten-Geschwindigkeit;
+    ein AirtableSyncer spiegelt Änderungen im Hintergrund nach Airtable und übernimmt
+    Änderungen aus der Airtable-Oberfläche. Airtable bleibt die Ansicht für Menschen.
+
+    Bietet dieselben Methoden wie AirtableClient (create_book, add_scene, get_pending_scenes, ...),
+    die Records haben dasselbe Format ({"id": ..., "fields": {...}}).
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(str(path), check_same_thread=False, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")  # Story- und Art-Prozess dürfen parallel zugreifen
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+        self.syncer: Optional["AirtableSyncer"] = None
+
+    def _migrate(self):
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(scenes)")}
+        with self.conn:
+            for column, kind in SCENE_MIGRATIONS.items():
+                if column not in columns:
+                    self.conn.execute(f"ALTER TABLE scenes ADD COLUMN {column} {kind}")
+
+    def _write(self, sql: str, params=()) -> sqlite3.Cursor:
+        with self._lock, self.conn:
+            cur = self.conn.execute(sql, params)
+        if self.syncer:
+            self.syncer.wake()
+        return cur
+
+    def _query(self, sql: str, params=()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    # --- Pipeline API (wie AirtableClient) ---
+
+    def create_book(self, title: str, topic: str) -> str:
+        book_id = _new_id()
+        self._write("INSERT INTO books (id, title, topic, status, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (book_id, title, topic, "Ready for Art", time.time()))
+        return book_id
+
+    def update_book_status(self, book_id: str, status: str):
+        self._write("UPDATE books SET status = ?, dirty = 1, updated_at = ? WHERE id = ?",
+                    (status, time.time(), book_id))
+
+    def add_scene(self, book_id: str, scene_number: int, text: str, image_prompt: str,
+                  on_created: Optional[Callable[[str], None]] = None):
+        scene_id = _new_id()
+        self._write(
+            "INSERT INTO scenes (id, book_id, scene_number, story_text, image_prompt, status, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, 'Pending', ?)",
+            (scene_id, book_id, scene_number, text, image_prompt, time.time()))
+        if on_created:
+            on_created(scene_id)
+
+    def delete_scenes(self, scene_ids: List[str]):
+        """Markiert Szenen als gelöscht (werden beim nächsten Sync auch in Airtable gelöscht)."""
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.executemany("UPDATE scenes SET deleted = 1, dirty = 1, updated_at = ? WHERE id = ?",
+                                  [(now, scene_id) for scene_id in scene_ids])
+        if self.syncer:
+            self.syncer.wake()
+
+    def iter_pending_scenes(self, incremental: bool = False, limit: Optional[int] = None) -> Iterator[Dict]:
+        """Wie AirtableClient.iter_pending_scenes. Lokal ist der volle Scan billig, `incremental` wird ignoriert."""
+        return iter(self.get_pending_scenes(limit))
+
+    def get_pending_scenes(self, limit: Optional[int] = None) -> List[Dict]:
+        """Offene Szenen ohne Szenen, die nach einem Fehlschlag noch warten (retry_after)."""
+        rows = self._query(
+            "SELECT * FROM scenes WHERE status = 'Pending' AND deleted = 0 AND "
+            "(retry_after IS NULL OR retry_after <= ?) ORDER BY book_id, scene_number LIMIT ?",
+            (time.time(), -1 if limit is None else limit))
+        logger.info(f"🔍 Gefundene Szenen zum Malen (lokal): {len(rows)}")
+        return [self._scene_record(row) for row in rows]
+
+    def count_pending_scenes(self, limit: Optional[int] = None) -> int:
+        """Anzahl offener Szenen (höchstens `limit`), wie get_pending_scenes ohne wartende Wiederholungen."""
+        rows = self._query(
+            "SELECT COUNT(*) AS n FROM (SELECT 1 FROM scenes WHERE status = 'Pending' AND deleted = 0 AND "
+            "(retry_after IS NULL OR retry_after <= ?) LIMIT ?)",
+            (time.time(), -1 if limit is None else limit))
+        return rows[0]["n"]
+
+    def get_book(self, book_id: str) -> Optional[Dict]:
+        """Buch-Record (Airtable-Format). `book_id` darf die lokale oder die Airtable ID sein."""
+        rows = self._query("SELECT * FROM books WHERE id = ? OR airtable_id = ?", (book_id, book_id))
+        if not rows:
+            return None
+        row = rows[0]
+        return {"id": row["id"], "fields": {"Title": row["title"], "Topic": row["topic"], "Status": row["status"]}}
+
+    def list_books(self) -> List[Dict]:
+        """Alle Bücher mit mindestens einer Szene, älteste zuerst."""
+        rows = self._query(
+            "SELECT * FROM books b WHERE EXISTS (SELECT 1 FROM scenes s WHERE s.book_id = b.id AND s.deleted = 0) "
+            "ORDER BY b.rowid")
+        return [{"id": row["id"], "fields": {"Title": row["title"], "Topic": row["topic"], "Status": row["status"]}}
+                for row in rows]
+
+    def get_book_scenes(self, book_id: str) -> List[Dict]:
+        """Szenen eines Buchs (lokale ID) in Szenen-Reihenfolge."""
+        rows = self._query("SELECT * FROM scenes WHERE book_id = ? AND deleted = 0 ORDER BY scene_number",
+                           (book_id,))
+        return [self._scene_record(row) for row in rows]
+
+    def update_scene_image(self, scene_id: str, image_path: str):
+        self._write("UPDATE scenes SET image_path = ?, status = 'Done', lease_owner = NULL, lease_expires = NULL, "
+                    "dirty = 1, updated_at = ? WHERE id = ?",
+                    (image_path, time.time(), scene_id))
+        logger.info(f"✅ Szene {scene_id} lokal aktualisiert.")
+
+    # --- Leases (Art-Modus): eine Szene wird nur von einem Lauf gerendert ---
+
+    def check_leases(self) -> bool:
+        """Leases gehen lokal immer (atomares UPDATE in SQLite)."""
+        return True
+
+    def claim_scene(self, scene_id: str, owner: str, ttl: float = SCENE_LEASE_SECONDS) -> bool:
+        """
+        Belegt eine offene Szene für `owner` (Status 'In Progress' bis `ttl` Sekunden).
+        Atomar auch zwischen Prozessen. False, wenn die Szene nicht (mehr) offen oder noch belegt ist.
+        """
+        now = time.time()
+        with self._lock, self.conn:
+            cur = self.conn.execute(
+                "UPDATE scenes SET status = ?, lease_owner = ?, lease_expires = ?, prompt_id = NULL "
+                "WHERE id = ? AND deleted = 0 AND (status = 'Pending' OR (status = ? AND lease_expires < ?))",
+                (STATUS_IN_PROGRESS, owner, now + ttl, scene_id, STATUS_IN_PROGRESS, now))
+        return cur.rowcount == 1
+
+    def set_scene_prompt(self, scene_id: str, owner: str, prompt_id: str, ttl: float = SCENE_LEASE_SECONDS):
+        """
+        Merkt sich die aktuelle ComfyUI prompt_id der Szene (für die Wiederherstellung nach einem Absturz)
+        und verlängert den Lease auf `ttl` Sekunden ab jetzt.
+        """
+        with self._lock, self.conn:
+            self.conn.execute("UPDATE scenes SET prompt_id = ?, lease_expires = ? "
+                              "WHERE id = ? AND lease_owner = ? AND status = ?",
+                              (prompt_id, time.time() + ttl, scene_id, owner, STATUS_IN_PROGRESS))
+
+    def release_scene(self, scene_id: str, owner: Optional[str] = None):
+        """Gibt eine belegte Szene wieder frei ('Pending'). Mit `owner` nur, wenn sie diesem gehört."""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE scenes SET status = 'Pending', lease_owner = NULL, lease_expires = NULL, prompt_id = NULL "
+                "WHERE id = ? AND status = ? AND (? IS NULL OR lease_owner = ?)",
+                (scene_id, STATUS_IN_PROGRESS, owner, owner))
+
+    def fail_scene(self, scene_id: str, owner: str, max_attempts: int = SCENE_MAX_ATTEMPTS,
+                   backoff: float = SCENE_RETRY_BACKOFF_SECONDS) -> bool:
+        """
+        Gibt eine belegte Szene nach einem Fehlschlag frei und zählt den Versuch. Bis zum nächsten Versuch
+        wartet sie `backoff` Sekunden (verdoppelt je Fehlschlag), nach `max_attempts` Versuchen bekommt sie
+        den Status 'Failed'. True, wenn die Szene damit aufgegeben ist.
+        """
+        with self._lock, self.conn:
+            row = self.conn.execute("SELECT attempts FROM scenes WHERE id = ? AND status = ? AND lease_owner = ?",
+                                    (scene_id, STATUS_IN_PROGRESS, owner)).fetchone()
+            if row is None:
+                return False
+            attempts = row["attempts"] + 1
+            given_up = attempts >= max_attempts
+            self.conn.execute(
+                "UPDATE scenes SET status = ?, attempts = ?, retry_after = ?, lease_owner = NULL, "
+                "lease_expires = NULL, prompt_id = NULL, dirty = MAX(dirty, ?), updated_at = ? WHERE id = ?",
+                ("Failed" if given_up else "Pending", attempts, time.time() + backoff * 2 ** (attempts - 1),
+                 int(given_up), time.time(), scene_id))
+        if given_up and self.syncer:
+            self.syncer.wake()
+        return given_up
+
+    def stale_leases(self) -> List[Dict]:
+        """
+        Belegte Szenen, deren Lauf nicht mehr lebt: Lease abgelaufen oder Besitzer-Prozess beendet.
+        Records wie get_pending_scenes, zusätzlich mit 'prompt_id' und 'lease_owner'.
+        """
+        rows = self._query("SELECT * FROM scenes WHERE status = ? AND deleted = 0", (STATUS_IN_PROGRESS,))
+        now = time.time()
+        stale = []
+        for row in rows:
+            if (row["lease_expires"] or 0) < now or not owner_alive(row["lease_owner"]):
+                stale.append({**self._scene_record(row), "prompt_id": row["prompt_id"],
+                              "lease_owner": row["lease_owner"]})
+        return stale
+
+    def flush(self) -> int:
+        """
+        Lokale Writes sind mit dem Commit dauerhaft gespeichert, es gibt hier nichts zu verlieren.
+        Stößt nur den Hintergrund-Sync an (Airtable wird asynchron nachgezogen).
+        """
+        if self.syncer:
+            self.syncer.wake()
+        return 0
+
+    def close(self):
+        """Beendet den Sync (inkl. letztem Push nach Airtable) und schließt die Datenbank."""
+        if self.syncer:
+            self.syncer.stop()
+        with self._lock:
+            self.conn.close()
+
+    @staticmethod
+    def _scene_record(row: sqlite3.Row) -> Dict:
+        fields = {airtable_name: row[column] for column, airtable_name in SCENE_FIELDS.items()}
+        fields["Book"] = [row["book_id"]]
+        return {"id": row["id"], "fields": fields}
+
+    # --- Sync API ---
+
+    def get_state(self, key: str) -> Optional[str]:
+        rows = self._query("SELECT value FROM sync_state WHERE key = ?", (key,))
+        return rows[0]["value"] if rows else None
+
+    def set_state(self, key: str, value: str):
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (key, value))
+
+    def dirty_books(self) -> List[sqlite3.Row]:
+        return self._query("SELECT * FROM books WHERE dirty = 1")
+
+    def dirty_scenes(self) -> List[sqlite3.Row]:
+        return self._query(
+            "SELECT s.*, b.airtable_id AS book_airtable_id FROM scenes s JOIN books b ON b.id = s.book_id "
+            "WHERE s.dirty = 1")
+
+    def mark_synced(self, table: str, local_id: str, updated_at: float, airtable_id: Optional[str] = None):
+        """Setzt die Airtable ID und löscht das Dirty-Flag – außer der Record wurde inzwischen erneut geändert."""
+        with self._lock, self.conn:
+            if airtable_id:
+                self.conn.execute(f"UPDATE {table} SET airtable_id = ? WHERE id = ?", (airtable_id, local_id))
+            self.conn.execute(f"UPDATE {table} SET dirty = 0 WHERE id = ? AND updated_at = ?",
+                              (local_id, updated_at))
+
+    def purge_scene(self, local_id: str):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM scenes WHERE id = ?", (local_id,))
+
+    def merge_remote_scenes(self, records: List[Dict]) -> int:
+        """
+        Übernimmt Szenen aus Airtable. Lokal ungesyncte Änderungen haben Vorrang, unveränderte Records
+        (z.B. unsere eigenen Pushes) werden übersprungen. Gibt die Anzahl Änderungen zurück.
+        Bücher, die es lokal noch nicht gibt, entstehen ohne Titel (siehe books_without_title).
+        """
+        changed = 0
+        now = time.time()
+        with self._lock, self.conn:
+            for record in records:
+                fields = record.get("fields", {})
+                book_links = fields.get("Book") or []
+                if not book_links:
+                    continue
+                book = self.conn.execute("SELECT id FROM books WHERE airtable_id = ?", (book_links[0],)).fetchone()
+                if book is None:
+                    book_id = _new_id()
+                    self.conn.execute("INSERT INTO books (id, airtable_id, dirty, updated_at) VALUES (?, ?, 0, ?)",
+                                      (book_id, book_links[0], now))
+                else:
+                    book_id = book["id"]
+
+                values = {column: fields.get(name) for column, name in SCENE_FIELDS.items()}
+                values["status"] = values["status"] or "Pending"
+                values["scene_number"] = values["scene_number"] or 0
+
+                local = self.conn.execute("SELECT * FROM scenes WHERE airtable_id = ?", (record["id"],)).fetchone()
+                if local is None:
+                    self.conn.execute(
+                        "INSERT INTO scenes (id, airtable_id, book_id, scene_number, story_text, image_prompt, "
+                        "status, image_path, dirty, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, ?)",
+                        (_new_id(), record["id"], book_id, values["scene_number"], values["story_text"],
+                         values["image_prompt"], values["status"], values["image_path"], now))
+                    changed += 1
+                elif not local["dirty"]:
+                    if local["status"] == STATUS_IN_PROGRESS and values["status"] == "Pending":
+                        values["status"] = STATUS_IN_PROGRESS  # Lease ist lokal, Airtable kennt nur 'Pending'
+                    if local["status"] == "Failed" and values["status"] == "Pending":
+                        # In Airtable zurückgesetzt: die Szene bekommt wieder alle Versuche
+                        self.conn.execute("UPDATE scenes SET attempts = 0, retry_after = NULL WHERE id = ?",
+                                          (local["id"],))
+                    if local["book_id"] == book_id and all(local[column] == value for column, value in values.items()):
+                        continue
+                    assignments = ", ".join(f"{column} = ?" for column in values)
+                    self.conn.execute(f"UPDATE scenes SET {assignments}, book_id = ?, updated_at = ? WHERE id = ?",
+                                      (*values.values(), book_id, now, local["id"]))
+                    changed += 1
+        return changed
+
+
+    def books_without_title(self) -> List[str]:
+        """Airtable IDs der Bücher, die ein Pull nur über ihre Szenen kennt (Titel fehlt noch)."""
+        rows = self._query("SELECT airtable_id FROM books WHERE title IS NULL AND airtable_id IS NOT NULL")
+        return [row["airtable_id"] for row in rows]
+
+    def merge_remote_books(self, records: List[Dict]) -> int:
+        """Übernimmt Titel, Thema und Status aus Airtable-Buch-Records (außer bei lokal ungesyncten Änderungen)."""
+        with self._lock, self.conn:
+            cur = self.conn.executemany(
+                "UPDATE books SET title = ?, topic = ?, status = ? WHERE airtable_id = ? AND dirty = 0",
+                [(r["fields"].get("Title"), r["fields"].get("Topic"), r["fields"].get("Status"), r["id"])
+                 for r in records])
+        return cur.rowcount
+
+    def reconcile_scenes(self, remote_ids: set) -> int:
+        """Löscht lokal alle Szenen mit Airtable ID, die es in Airtable nicht mehr gibt. Gibt die Anzahl zurück."""
+        rows = self._query("SELECT id, airtable_id FROM scenes WHERE airtable_id IS NOT NULL")
+        gone = [(row["id"],) for row in rows if row["airtable_id"] not in remote_ids]
+        with self._lock, self.conn:
+            self.conn.executemany("DELETE FROM scenes WHERE id = ?", gone)
+        return len(gone)
+
+
+class AirtableSyncer:
+    """
+    Hintergrund-Sync zwischen JobStore und Airtable.
+    - Push: lokale Änderungen (dirty) als 10er-Batches nach Airtable (alle JOB_STORE_PUSH_INTERVAL s
+      oder sofort nach Änderungen, gebündelt).
+    - Pull: in Airtable geänderte Szenen (LAST_MODIFIED_TIME seit dem letzten Pull) übernehmen,
+      fehlende Buchtitel nachladen und alle JOB_STORE_RECONCILE_INTERVAL s die Szenen-IDs abgleichen
+      (in der Airtable-Oberfläche gelöschte Szenen verschwinden dann auch lokal).
+    Ein Datei-Lock stellt sicher, dass parallel laufende Prozesse nicht doppelt anlegen.
+    """
+
+    PULL_CURSOR = "pull_cursor"
+    RECONCILED_AT = "reconciled_at"  # Unix-Zeit des letzten ID-Abgleichs (prozessübergreifend)
+    CLOCK_SKEW = timedelta(seconds=30)  # Puffer gegen Uhrabweichung zwischen uns und Airtable
+
+    def __init__(self, store: JobStore, airtable, push_interval: float = JOB_STORE_PUSH_INTERVAL,
+                 pull_interval: float = JOB_STORE_PULL_INTERVAL,
+                 reconcile_interval: float = JOB_STORE_RECONCILE_INTERVAL):
+        self.store = store
+        self.airtable = airtable
+        self.push_interval = push_interval
+        self.pull_interval = pull_interval
+        self.reconcile_interval = reconcile_interval
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._last_pull = 0.0
+        self._lock_path = store.path.with_suffix(".sync.lock")
+        store.syncer = self
+        self._thread = threading.Thread(target=self._run, name="AirtableSyncer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=10)
+        failed = self.push()
+        if failed:
+            logger.error(f"❌ {failed} lokale Änderungen konnten nicht nach Airtable gespiegelt werden.")
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.push_interval)
+            if self._stopped.is_set():
+                return
+            # Kurz sammeln, damit viele kleine Änderungen in einem Batch landen
+            time.sleep(min(1.0, self.push_interval))
+            self._wake.clear()
+            try:
+                self.push()
+                if time.monotonic() - self._last_pull >= self.pull_interval:
+                    self.pull()
+            except Exception as e:
+                logger.error(f"❌ Airtable Sync fehlgeschlagen: {e}")
+
+    def push(self) -> int:
+        """Spiegelt alle Dirty-Records nach Airtable. Gibt die Anzahl fehlgeschlagener Records zurück."""
+        with open(self._lock_path, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            return self._push_books() + self._push_scenes()
+
+    def _push_books(self) -> int:
+        rows = self.store.dirty_books()
+        creates = [r for r in rows if not r["airtable_id"]]
+        updates = [r for r in rows if r["airtable_id"]]
+        failed = 0
+        try:
+            if creates:
+                records = self.airtable.batch_create(AIRTABLE_TABLE_BOOKS, [
+                    {"Title": r["title"], "Topic": r["topic"], "Status": r["status"]} for r in creates])
+                for row, record in zip(creates, records):
+                    self.store.mark_synced("books", row["id"], row["updated_at"], record["id"])
+        except Exception as e:
+            logger.error(f"❌ Sync: Bücher anlegen fehlgeschlagen: {e}")
+            failed += len(creates)
+        try:
+            if updates:
+                self.airtable.batch_update(AIRTABLE_TABLE_BOOKS, [
+                    {"id": r["airtable_id"], "fields": {"Status": r["status"]}} for r in updates])
+                for row in updates:
+                    self.store.mark_synced("books", row["id"], row["updated_at"])
+        except Exception as e:
+            logger.error(f"❌ Sync: Bücher aktualisieren fehlgeschlagen: {e}")
+            failed += len(updates)
+        return failed
+
+    def _push_scenes(self) -> int:
+        rows = self.store.dirty_scenes()
+        deletes = [r for r in rows if r["deleted"]]
+        live = [r for r in rows if not r["deleted"] and r["book_airtable_id"]]
+        creates = [r for r in live if not r["airtable_id"]]
+        updates = [r for r in live if r["airtable_id"]]
+        failed = 0
+
+        try:
+            remote_deletes = [r["airtable_id"] for r in deletes if r["airtable_id"]]
+            if remote_deletes:
+                self.airtable.batch_delete(AIRTABLE_TABLE_SCENES, remote_deletes)
+            for row in deletes:
+                self.store.purge_scene(row["id"])
+        except Exception as e:
+            logger.error(f"❌ Sync: Szenen löschen fehlgeschlagen: {e}")
+            failed += len(deletes)
+
+        def scene_fields(row) -> Dict:
+            fields = {name: row[column] for column, name in SCENE_FIELDS.items() if row[column] is not None}
+            if fields.get("Image Status") == STATUS_IN_PROGRESS:
+                fields["Image Status"] = "Pending"
+            fields["Book"] = [row["book_airtable_id"]]
+            return fields
+
+        try:
+            if creates:
+                records = self.airtable.batch_create(AIRTABLE_TABLE_SCENES, [scene_fields(r) for r in creates])
+                for row, record in zip(creates, records):
+                    self.store.mark_synced("scenes", row["id"], row["updated_at"], record["id"])
+        except Exception as e:
+            logger.error(f"❌ Sync: Szenen anlegen fehlgeschlagen: {e}")
+            failed += len(creates)
+        try:
+            if updates:
+                self.airtable.batch_update(AIRTABLE_TABLE_SCENES, [
+                    {"id": r["airtable_id"], "fields": scene_fields(r)} for r in updates])
+                for row in updates:
+                    self.store.mark_synced("scenes", row["id"], row["updated_at"])
+        except Exception as e:
+            logger.error(f"❌ Sync: Szenen aktualisieren fehlgeschlagen: {e}")
+            failed += len(updates)
+
+        if creates or updates or deletes:
+            logger.info(f"🔄 Sync -> Airtable: {len(creates)} neu, {len(updates)} geändert, {len(deletes)} gelöscht.")
+        return failed
+
+    def pull(self) -> int:
+        """Übernimmt in Airtable geänderte Szenen (inkrementell über LAST_MODIFIED_TIME)."""
+        started = datetime.now(timezone.utc) - self.CLOCK_SKEW
+        cursor = self.store.get_state(self.PULL_CURSOR)
+        changed = 0
+        for page in self.airtable.iter_scenes_modified_since(cursor):
+            changed += self.store.merge_remote_scenes(page)
+        self.store.set_state(self.PULL_CURSOR, started.strftime("%Y-%m-%dT%H:%M:%S.000Z"))
+        self._last_pull = time.monotonic()
+        if changed:
+            logger.info(f"🔄 Sync <- Airtable: {changed} Szenen übernommen.")
+
+        # Bücher, die nur über ihre Szenen ankamen: Titel & Thema nachladen (klappt es nicht, beim nächsten Pull)
+        untitled = self.store.books_without_title()
+        if untitled:
+            filled = self.store.merge_remote_books(self.airtable.get_books(untitled))
+            logger.info(f"🔄 Sync <- Airtable: {filled}/{len(untitled)} Buchtitel nachgeladen.")
+
+        reconciled_at = float(self.store.get_state(self.RECONCILED_AT) or 0)
+        if time.time() - reconciled_at >= self.reconcile_interval:
+            self.reconcile()
+        return changed
+
+    def reconcile(self) -> int:
+        """
+        Gleicht die lokalen Szenen per Airtable ID mit Airtable ab: Szenen, die dort gelöscht wurden,
+        verschwinden auch lokal (das sieht der inkrementelle Pull nicht). Gibt die Anzahl zurück.
+        """
+        with open(self._lock_path, "w") as lock:
+            # Kein Push währenddessen, sonst fehlten frisch angelegte Szenen in der Liste
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            remote = {record["id"] for page in self.airtable.iter_scene_pages(fields=["Scene Number"])
+                      for record in page}
+            removed = self.store.reconcile_scenes(remote)
+        self.store.set_state(self.RECONCILED_AT, str(time.time()))
+        if removed:
+            logger.info(f"🔄 Sync <- Airtable: {removed} in Airtable gelöschte Szenen lokal entfernt.")
+        return removed
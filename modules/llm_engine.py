@@ -1,16 +1,111 @@
 import requests
 import json
+import random
 import time
-from typing import List, Dict, Optional, Any
-from config import OLLAMA_API_GENERATE, OLLAMA_MODEL, VRAM_COOLDOWN_SECONDS
+from typing import List, Dict, Optional, Any, Iterator
+from config import (
+    OLLAMA_API_GENERATE, OLLAMA_MODEL, OLLAMA_READ_TIMEOUT, HTTP_CONNECT_TIMEOUT, VRAM_COOLDOWN_SECONDS,
+    STORY_MIN_SCENES, STORY_MAX_ATTEMPTS, STORY_RETRY_TEMPERATURE_STEP, STORY_CACHE_ENABLED
+)
 from modules.utils import setup_logging
+from modules.metrics import metrics
+from modules.vram import VramHandoff
+from modules.story_stream import StoryStreamValidator, StoryStreamError, StoryEvent, EVENT_TITLE, EVENT_BLOCK
+from modules.story_cache import StoryCache
+from modules import transport
 
 logger = setup_logging("LLM_Engine")
 
+# High-Quality System Prompt für 8 Szenen mit Dramaturgie
+STORY_SYSTEM_PROMPT = (
+    "You are an award-winning Children's Book Author and Art Director. "
+    "Your goal is to write a captivating, emotionally resonant story (approx. 8 scenes) in GERMAN, suitable for ages 4-8. "
+    "Simultaneously, you must provide highly consistent, professional image prompts in ENGLISH for Stable Diffusion.\n\n"
+    
+    "### STEP 1: CHARACTER DESIGN (Mental Freeze)\n"
+    "Create a unique, lovable main character. Define:\n"
+    "- Species & Name\n"
+    "- Specific Colors (e.g., 'pastel blue body', 'orange beak')\n"
+    "- Iconic Item (e.g., 'red striped scarf', 'tiny backpack')\n"
+    "-> YOU MUST USE THESE EXACT VISUAL TRAITS IN EVERY SINGLE IMAGE PROMPT.\n\n"
+    
+    "### STEP 2: NARRATIVE STRUCTURE (8 Scenes)\n"
+    "- Scenes 1-2 (Intro): Introduce character and setting. Establish a wish or problem.\n"
+    "- Scenes 3-6 (Adventure): The journey, obstacles, meeting friends, or trying solutions.\n"
+    "- Scenes 7-8 (Resolution): Success, lesson learned, happy ending.\n\n"
+    "WRITING STYLE: Use direct dialogue, sensory words (smell, sound), and gentle humor.\n\n"
+    
+    "### STEP 3: PROMPT ENGINEERING RULES\n"
+    "Structure: [CHARACTER], [ACTION], [SETTING], [LIGHTING], [STYLE]\n"
+    "Style Suffix: '(children book illustration style:1.3), (whimsical:1.1), (hand-drawn:1.1), (vibrant colors:1.2), high quality, 8k, masterpiece'\n\n"
+    
+    "### OUTPUT FORMAT (STRICT JSON)\n"
+    "{\n"
+    '  "title": "Creative German Title",\n'
+    '  "blocks": [\n'
+    '    {"type": "text", "content": "German text for Scene 1..."},\n'
+    '    {"type": "image_prompt", "content": "[Character defined in Step 1], waking up in [Setting], morning light, [Style Suffix]"},\n'
+    '    {"type": "text", "content": "German text for Scene 2..."},\n'
+    '    {"type": "image_prompt", "content": "..."}\n'
+    '    // ... continue for exactly 8 scenes ...\n'
+    "  ]\n"
+    "}\n"
+    "Output ONLY valid JSON. No markdown."
+)
+
+
+class StoryGenerationError(Exception):
+    """Die Story-Generierung ist fehlgeschlagen (API-Fehler, ungültiges JSON oder Schema)."""
+
+
+class _TokenTiming:
+    """Misst einen Generierungsversuch: Time-to-First-Token, Tokens/s und Gesamtdauer."""
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.first_token: Optional[float] = None
+        self.tokens = 0
+        self.final: Dict[str, Any] = {}
+
+    def token(self, token: str, line: Dict[str, Any]):
+        if token:
+            self.tokens += 1
+            if self.first_token is None:
+                self.first_token = time.monotonic()
+        if line.get("done"):
+            self.final = line
+
+    def record(self, outcome: str, topic: str):
+        total = time.monotonic() - self.start
+        labels = {"outcome": outcome}
+        metrics.observe("ollama_story_seconds", total, labels, topic=topic, tokens=self.tokens)
+        if self.first_token is None:
+            return
+        metrics.observe("ollama_time_to_first_token_seconds", self.first_token - self.start, labels, topic=topic)
+        # Ollama liefert im letzten Chunk genaue Zahlen (eval_count, eval_duration in ns), sonst selbst zählen
+        eval_count = self.final.get("eval_count") or self.tokens
+        eval_seconds = (self.final.get("eval_duration") or 0) / 1e9 or (time.monotonic() - self.first_token)
+        if eval_count and eval_seconds > 0:
+            metrics.observe("ollama_tokens_per_second", eval_count / eval_seconds, labels,
+                            topic=topic, tokens=eval_count)
+
+
 class OllamaClient:
-    def __init__(self, model: str = OLLAMA_MODEL):
+    def __init__(self, model: str = OLLAMA_MODEL, keep_alive: Optional[str] = None, echo: bool = True,
+                 use_cache: bool = True):
+        """
+        keep_alive: Wie lange Ollama das Modell nach einem Request im VRAM hält (z.B. "30m").
+                    None = Ollama Default. Im Batch-Modus bleibt das Modell so über alle Bücher geladen.
+        echo: Tokens live auf stdout ausgeben (bei parallelen Generierungen aus).
+        use_cache: False = Story-Cache nicht lesen, immer neu generieren (das Ergebnis wird trotzdem gecacht).
+        """
         self.model = model
         self.api_url = OLLAMA_API_GENERATE
+        self.keep_alive = keep_alive
+        self.echo = echo
+        self.cache = StoryCache() if STORY_CACHE_ENABLED else None
+        self.use_cache = use_cache
+        self.requests = 0  # Gesendete Generierungs-Requests (0 = alles kam aus dem Cache, Modell nie geladen)
 
     def unload_model(self) -> bool:
         """
@@ -26,115 +121,168 @@ class OllamaClient:
         }
         
         try:
-            response = requests.post(self.api_url, json=payload)
+            # keep_alive=0 ist idempotent -> darf wiederholt werden
+            response = transport.post(self.api_url, json=payload, idempotent=True)
             response.raise_for_status()
-            logger.info("✅ Modell erfolgreich entladen (VRAM frei).")
-            
-            # Sicherheits-Pause, damit der GPU-Speicher wirklich freigegeben wird
-            time.sleep(VRAM_COOLDOWN_SECONDS)
+            logger.info("✅ Entlade-Request angenommen. Warte auf Freigabe des VRAM...")
+
+            # Aktiv prüfen, ob das Modell wirklich weg ist. Feste Pause nur als Fallback.
+            if not VramHandoff().wait_for_ollama_unloaded(self.model):
+                logger.warning(f"⏳ Fallback: warte {VRAM_COOLDOWN_SECONDS}s Cooldown.")
+                time.sleep(VRAM_COOLDOWN_SECONDS)
             return True
-            
+
         except requests.exceptions.RequestException as e:
             logger.error(f"❌ Fehler beim Entladen des Modells: {e}")
             return False
 
-    def generate_story(self, topic: str) -> Optional[Dict[str, Any]]:
+    def _echo(self, text: str):
+        if self.echo:
+            print(text, end="", flush=True)
+
+    def story_options(self, attempt: int = 1) -> Dict[str, Any]:
+        """Generierungs-Optionen. Jeder Wiederholungsversuch bekommt neuen Seed & etwas mehr Temperatur."""
+        options = {
+            "temperature": 0.7,
+            "num_ctx": 8192  # Erhöhtes Kontext-Fenster für längere Stories
+        }
+        if attempt > 1:
+            options["temperature"] = round(0.7 + (attempt - 1) * STORY_RETRY_TEMPERATURE_STEP, 2)
+            options["seed"] = random.randint(1, 2**31 - 1)
+        return options
+
+    def stream_story(self, topic: str) -> Iterator[StoryEvent]:
         """
-        Generiert eine Kindergeschichte basierend auf dem Thema.
-        Erwartet striktes JSON Format vom LLM mit flexiblen Content-Blöcken.
+        Generiert eine Kindergeschichte und liefert Events, sobald sie vollständig im Token-Strom stehen:
+        ("title", str), ("block", dict) und zum Schluss ("story", dict) mit der validierten Geschichte.
+        So können Buch und Szenen schon gespeichert werden, während das LLM noch schreibt.
+
+        Die Ausgabe wird schon während des Streamens validiert. Ist klar, dass sie das Schema nicht
+        mehr erfüllen kann, wird der Request abgebrochen und (max. STORY_MAX_ATTEMPTS mal) mit
+        anderem Seed wiederholt. Vorher kommt ein ("retry", attempt) Event: bis dahin gelieferte
+        Events sind verworfen.
+        Wirft StoryGenerationError, wenn kein Versuch erfolgreich war oder die API nicht erreichbar ist.
+
+        Validierte Stories landen im Story-Cache. Ein erneuter Aufruf mit gleichem Modell, System-Prompt,
+        Thema und Optionen spielt sie ohne LLM-Lauf als dieselben Events ab (außer use_cache=False).
         """
+        # Cache-Schlüssel aus den Optionen des ersten Versuchs: die fragt der nächste Aufruf wieder an
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.key(self.model, STORY_SYSTEM_PROMPT, topic, self.story_options(1))
+            story_data = self.cache.get(cache_key) if self.use_cache else None
+            if story_data is not None:
+                logger.info(f"♻️ Geschichte '{story_data.get('title')}' aus dem Cache (kein LLM-Lauf).")
+                yield from self._replay_story(story_data)
+                return
+
         logger.info(f"📖 Generiere Geschichte zum Thema: '{topic}'...")
 
-        # High-Quality System Prompt für 8 Szenen mit Dramaturgie
-        system_prompt = (
-            "You are an award-winning Children's Book Author and Art Director. "
-            "Your goal is to write a captivating, emotionally resonant story (approx. 8 scenes) in GERMAN, suitable for ages 4-8. "
-            "Simultaneously, you must provide highly consistent, professional image prompts in ENGLISH for Stable Diffusion.\n\n"
-            
-            "### STEP 1: CHARACTER DESIGN (Mental Freeze)\n"
-            "Create a unique, lovable main character. Define:\n"
-            "- Species & Name\n"
-            "- Specific Colors (e.g., 'pastel blue body', 'orange beak')\n"
-            "- Iconic Item (e.g., 'red striped scarf', 'tiny backpack')\n"
-            "-> YOU MUST USE THESE EXACT VISUAL TRAITS IN EVERY SINGLE IMAGE PROMPT.\n\n"
-            
-            "### STEP 2: NARRATIVE STRUCTURE (8 Scenes)\n"
-            "- Scenes 1-2 (Intro): Introduce character and setting. Establish a wish or problem.\n"
-            "- Scenes 3-6 (Adventure): The journey, obstacles, meeting friends, or trying solutions.\n"
-            "- Scenes 7-8 (Resolution): Success, lesson learned, happy ending.\n\n"
-            "WRITING STYLE: Use direct dialogue, sensory words (smell, sound), and gentle humor.\n\n"
-            
-            "### STEP 3: PROMPT ENGINEERING RULES\n"
-            "Structure: [CHARACTER], [ACTION], [SETTING], [LIGHTING], [STYLE]\n"
-            "Style Suffix: '(children book illustration style:1.3), (whimsical:1.1), (hand-drawn:1.1), (vibrant colors:1.2), high quality, 8k, masterpiece'\n\n"
-            
-            "### OUTPUT FORMAT (STRICT JSON)\n"
-            "{\n"
-            '  "title": "Creative German Title",\n'
-            '  "blocks": [\n'
-            '    {"type": "text", "content": "German text for Scene 1..."},\n'
-            '    {"type": "image_prompt", "content": "[Character defined in Step 1], waking up in [Setting], morning light, [Style Suffix]"},\n'
-            '    {"type": "text", "content": "German text for Scene 2..."},\n'
-            '    {"type": "image_prompt", "content": "..."}\n'
-            '    // ... continue for exactly 8 scenes ...\n'
-            "  ]\n"
-            "}\n"
-            "Output ONLY valid JSON. No markdown."
-        )
+        for attempt in range(1, STORY_MAX_ATTEMPTS + 1):
+            try:
+                for event in self._stream_story_attempt(topic, self.story_options(attempt)):
+                    if event[0] == "story" and cache_key:
+                        # Vor dem Weiterreichen cachen: scheitert danach das Speichern, ist die Story nicht verloren
+                        self.cache.put(cache_key, topic, self.model, event[1])
+                    yield event
+                return
+            except StoryStreamError as e:
+                if attempt >= STORY_MAX_ATTEMPTS:
+                    raise StoryGenerationError(f"Kein gültiges JSON nach {attempt} Versuchen: {e}") from e
+                logger.warning(f"🔁 Versuch {attempt}/{STORY_MAX_ATTEMPTS} abgebrochen ({e}). Neuer Versuch...")
+                yield ("retry", attempt)
+
+    @staticmethod
+    def _replay_story(story_data: Dict[str, Any]) -> Iterator[StoryEvent]:
+        """Liefert eine fertige Story als dieselben Events wie der Token-Strom."""
+        if isinstance(story_data.get("title"), str):
+            yield (EVENT_TITLE, story_data["title"])
+        for block in story_data.get("blocks", []):
+            yield (EVENT_BLOCK, block)
+        yield ("story", story_data)
 
+    def _stream_story_attempt(self, topic: str, options: Dict[str, Any]) -> Iterator[StoryEvent]:
+        """Ein Generierungsversuch. Wirft StoryStreamError, sobald die Ausgabe ungültig ist."""
         prompt = f"Write a complete story about: {topic}"
 
         payload = {
             "model": self.model,
             "prompt": prompt,
-            "system": system_prompt,
+            "system": STORY_SYSTEM_PROMPT,
             "stream": True,  # Streaming aktivieren
             "format": "json",
-            "options": {
-                "temperature": 0.7,
-                "num_ctx": 8192  # Erhöhtes Kontext-Fenster für längere Stories
-            }
+            "options": options
         }
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+
+        validator = StoryStreamValidator(min_scenes=STORY_MIN_SCENES)
+        timing = _TokenTiming()
 
         try:
-            print(f"\n🤖 {self.model} schreibt...\n" + "-"*50)
-            
-            response = requests.post(self.api_url, json=payload, stream=True)
+            self._echo(f"\n🤖 {self.model} schreibt...\n" + "-"*50 + "\n")
+
+            self.requests += 1
+            response = transport.post(self.api_url, json=payload, stream=True,
+                                      timeout=(HTTP_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT))
             response.raise_for_status()
-            
-            full_response = ""
-            
-            for line in response.iter_lines():
-                if line:
-                    decoded_line = line.decode('utf-8')
-                    try:
-                        json_line = json.loads(decoded_line)
+
+            # Verbindung schließen bricht die Generierung in Ollama ab (auch beim Early-Abort)
+            try:
+                for line in response.iter_lines():
+                    if line:
+                        decoded_line = line.decode('utf-8')
+                        try:
+                            json_line = json.loads(decoded_line)
+                        except json.JSONDecodeError:
+                            continue
+
                         token = json_line.get("response", "")
-                        print(token, end="", flush=True)
-                        full_response += token
-                        
+                        timing.token(token, json_line)
+                        self._echo(token)
+                        yield from validator.feed(token)
+
                         if json_line.get("done", False):
                             break
-                    except json.JSONDecodeError:
-                        continue
-            
-            print("\n" + "-"*50 + "\n") # Abschluss
-            
-            try:
-                story_data = json.loads(full_response)
-                
-                # Validierung
-                if "title" in story_data and "blocks" in story_data and isinstance(story_data["blocks"], list):
-                    logger.info(f"✅ Geschichte '{story_data['title']}' mit {len(story_data['blocks'])} Blöcken generiert.")
-                    return story_data
-                else:
-                    logger.error(f"⚠️ Ungültiges JSON-Schema: {full_response[:100]}...")
-                    return None
-                    
-            except json.JSONDecodeError as je:
-                logger.error(f"❌ JSON Parsing Fehler: {je}. Raw Output: {full_response[:200]}...")
-                return None
+            finally:
+                response.close()
+
+            self._echo("\n" + "-"*50 + "\n\n") # Abschluss
 
         except requests.exceptions.RequestException as e:
             logger.error(f"❌ API Fehler bei Story-Generierung: {e}")
-            return None
\ No newline at end of file
+            timing.record("api_error", topic)
+            raise StoryGenerationError(str(e)) from e
+        except StoryStreamError as e:
+            self._echo("\n" + "-"*50 + "\n\n")
+            logger.error(f"❌ Ungültige Ausgabe, breche ab: {e}. Raw Output: {validator.parser.text[:200]}...")
+            timing.record("invalid", topic)
+            raise
+        except GeneratorExit:
+            # Aufrufer hat den Strom verlassen (z.B. Fehler beim Speichern)
+            timing.record("cancelled", topic)
+            raise
+
+        try:
+            story_data = validator.result()
+        except StoryStreamError as je:
+            logger.error(f"❌ JSON Parsing Fehler: {je}. Raw Output: {validator.parser.text[:200]}...")
+            raise
+
+        timing.record("ok", topic)
+        logger.info(f"✅ Geschichte '{story_data['title']}' mit {len(story_data['blocks'])} Blöcken generiert.")
+        yield ("story", story_data)
+
+    def generate_story(self, topic: str) -> Optional[Dict[str, Any]]:
+        """
+        Generiert eine Kindergeschichte basierend auf dem Thema.
+        Erwartet striktes JSON Format vom LLM mit flexiblen Content-Blöcken.
+        Blockierende Variante von `stream_story`.
+        """
+        try:
+            for event, value in self.stream_story(topic):
+                if event == "story":
+                    return value
+        except StoryGenerationError:
+            return None
+        return None
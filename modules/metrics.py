@@ -0,0 +1,234 @@
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from config import (
+    METRICS_ENABLED, METRICS_TRACE_FILE, METRICS_TRACE_MAX_BYTES, METRICS_PROM_FILE, METRICS_WRITE_SECONDS
+)
+from modules.utils import setup_logging
+
+logger = setup_logging("Metrics")
+
+PROM_PREFIX = "kidsbook_"
+
+Labels = Dict[str, str]
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _escape(value) -> str:
+    """Label-Wert für das Prometheus Textformat (Backslash, Anführungszeichen, Zeilenumbruch)."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Aggregate:
+    __slots__ = ("count", "total", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+
+class Metrics:
+    """
+    Strukturierte Messwerte für einen Lauf.
+    Jeder Messwert (z.B. Dauer einer Stufe) wird als JSON-Zeile in die Trace-Datei geschrieben und
+    pro (Name, Labels) aggregiert (Anzahl, Summe, Min, Max). Die Aggregate landen als
+    Prometheus Textfile (node_exporter textfile collector) – am Ende und bei langen Läufen
+    zwischendurch (write_if_due) – und können mit `print_summary()` als Tabelle ausgegeben werden
+    (main.py --profile). Die Trace-Datei wird ab `trace_max_bytes` nach `<name>.1` rotiert.
+
+    Labels sollten wenige Werte haben (Methode, Status, ...); IDs, Themen usw. gehören in die Trace-Felder.
+    """
+
+    def __init__(self, trace_path: Optional[Path] = None, prom_path: Optional[Path] = None,
+                 trace_max_bytes: int = METRICS_TRACE_MAX_BYTES):
+        self.trace_path = trace_path
+        self.prom_path = prom_path
+        self.trace_max_bytes = trace_max_bytes
+        self.command: Optional[str] = None
+        self.started = time.time()
+        self._aggregates: Dict[_Key, _Aggregate] = {}
+        self._lock = threading.Lock()
+        self._trace = None
+        self._written_at = time.monotonic()
+        atexit.register(self.close)
+
+    def set_command(self, command: str):
+        """
+        Ordnet die Messwerte einem Befehl zu (story, art, serve, ...): eigenes Textfile
+        `<prom>_<befehl>.prom` und Label `command` an jeder Reihe. So überschreiben sich
+        parallele oder aufeinanderfolgende Befehle nicht gegenseitig.
+        """
+        self.command = command
+        if self.prom_path is not None:
+            self.prom_path = self.prom_path.with_name(f"{self.prom_path.stem}_{command}{self.prom_path.suffix}")
+
+    @staticmethod
+    def _key(name: str, labels: Optional[Labels]) -> _Key:
+        return name, tuple(sorted((labels or {}).items()))
+
+    def observe(self, name: str, value: float, labels: Optional[Labels] = None, **fields):
+        """Erfasst einen Messwert (Sekunden, Bytes, Tokens/s, ...). `fields` landen nur im Trace."""
+        with self._lock:
+            key = self._key(name, labels)
+            aggregate = self._aggregates.get(key)
+            if aggregate is None:
+                aggregate = self._aggregates[key] = _Aggregate()
+            aggregate.add(value)
+            self._write_trace({"metric": name, "value": round(value, 6), "labels": labels or {}, **fields})
+
+    def inc(self, name: str, amount: float = 1, labels: Optional[Labels] = None, **fields):
+        """Zähler: wie observe, aber für Ereignisse (Retries, Fehler, ...). Namen enden auf `_total`."""
+        self.observe(name, amount, labels, **fields)
+
+    @contextmanager
+    def span(self, name: str, labels: Optional[Labels] = None, **fields) -> Iterator[Dict]:
+        """
+        Misst die Dauer eines Blocks in Sekunden. Das Label 'status' wird 'ok' bzw. 'error'.
+        Der Block kann über das gelieferte Dict weitere Trace-Felder setzen.
+        """
+        extra: Dict = {}
+        status = "ok"
+        start = time.monotonic()
+        try:
+            yield extra
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            fields.update(extra)
+            self.observe(name, time.monotonic() - start, {**(labels or {}), "status": status}, **fields)
+
+    def _write_trace(self, record: Dict):
+        if self.trace_path is None:
+            return
+        try:
+            if self._trace is None:
+                self.trace_path.parent.mkdir(parents=True, exist_ok=True)
+                self._trace = open(self.trace_path, "a", encoding="utf-8", buffering=1)
+            record = {"ts": round(time.time(), 3), "pid": os.getpid(), **record}
+            self._trace.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            if os.fstat(self._trace.fileno()).st_size >= self.trace_max_bytes:
+                self._rotate_trace()
+        except OSError as e:
+            logger.warning(f"⚠️ Trace nicht schreibbar ({e}), Tracing deaktiviert.")
+            self.trace_path = None
+
+    def _rotate_trace(self):
+        """
+        Verschiebt die volle Trace-Datei nach `<name>.1` (eine ältere fällt weg) und schreibt neu.
+        Hat ein anderer Prozess schon rotiert, wird nur die neue Datei geöffnet.
+        """
+        ours = os.fstat(self._trace.fileno()).st_ino
+        self._trace.close()
+        self._trace = None
+        try:
+            if os.stat(self.trace_path).st_ino == ours:
+                os.replace(self.trace_path, self.trace_path.with_name(self.trace_path.name + ".1"))
+        except FileNotFoundError:
+            pass
+        self._trace = open(self.trace_path, "a", encoding="utf-8", buffering=1)
+
+    def snapshot(self) -> List[Tuple[str, Labels, int, float, float, float]]:
+        """(Name, Labels, Anzahl, Summe, Min, Max) je Messreihe, sortiert nach Name."""
+        with self._lock:
+            rows = [(name, dict(labels), a.count, a.total, a.min, a.max)
+                    for (name, labels), a in self._aggregates.items()]
+        return sorted(rows, key=lambda row: (row[0], sorted(row[1].items())))
+
+    def write_textfile(self, path: Optional[Path] = None):
+        """
+        Schreibt die Aggregate atomar im Prometheus Textformat. Zähler (`*_total`, siehe inc) werden
+        eine counter-Familie mit der Summe. Jede andere Messreihe wird zwei Familien, jede mit allen
+        Label-Sets unter einem TYPE-Header: `<name>` als summary (_count, _sum) und `<name>_max`
+        als gauge (summary erlaubt nur _count, _sum und Quantile). Mit set_command trägt jede Reihe
+        zusätzlich das Label `command`.
+        """
+        path = path or self.prom_path
+        if path is None:
+            return
+        run_labels = {"command": self.command} if self.command else {}
+        counters: Dict[str, List[str]] = {}
+        summaries: Dict[str, List[str]] = {}
+        maxima: Dict[str, List[str]] = {}
+        for name, labels, count, total, _, maximum in self.snapshot():
+            metric = PROM_PREFIX + name
+            label_str = ",".join(f'{k}="{_escape(v)}"' for k, v in sorted({**labels, **run_labels}.items()))
+            suffix = f"{{{label_str}}}" if label_str else ""
+            if name.endswith("_total"):
+                counters.setdefault(metric, []).append(f"{metric}{suffix} {total:.6f}")
+                continue
+            summaries.setdefault(metric, []).extend([f"{metric}_count{suffix} {count}",
+                                                     f"{metric}_sum{suffix} {total:.6f}"])
+            maxima.setdefault(metric, []).append(f"{metric}_max{suffix} {maximum:.6f}")
+        lines = []
+        for metric, samples in counters.items():
+            lines.append(f"# TYPE {metric} counter")
+            lines.extend(samples)
+        for metric, samples in summaries.items():
+            lines.append(f"# TYPE {metric} summary")
+            lines.extend(samples)
+            lines.append(f"# TYPE {metric}_max gauge")
+            lines.extend(maxima[metric])
+        run_str = ",".join(f'{k}="{_escape(v)}"' for k, v in run_labels.items())
+        run_suffix = f"{{{run_str}}}" if run_str else ""
+        lines.append(f"# TYPE {PROM_PREFIX}last_run_timestamp_seconds gauge")
+        lines.append(f"{PROM_PREFIX}last_run_timestamp_seconds{run_suffix} {self.started:.0f}")
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, path)
+        self._written_at = time.monotonic()
+
+    def write_if_due(self, interval: float = METRICS_WRITE_SECONDS):
+        """Schreibt das Textfile, wenn das letzte länger als `interval` Sekunden her ist (für lange Läufe)."""
+        if self.prom_path is None or time.monotonic() - self._written_at < interval:
+            return
+        try:
+            self.write_textfile()
+        except OSError as e:
+            logger.warning(f"⚠️ Prometheus Textfile nicht schreibbar: {e}")
+            self._written_at = time.monotonic()  # Nicht bei jedem Aufruf erneut versuchen
+
+    def print_summary(self):
+        """Tabelle pro Messreihe: Anzahl, Summe, Mittelwert, Max (für --profile)."""
+        rows = self.snapshot()
+        if not rows:
+            print("📊 Keine Messwerte erfasst.")
+            return
+        print(f"\n📊 Profil ({time.time() - self.started:.1f}s Laufzeit)")
+        print(f"{'Messreihe':<58}{'Anzahl':>8}{'Summe':>12}{'Mittel':>11}{'Max':>11}")
+        print("-" * 100)
+        for name, labels, count, total, _, maximum in rows:
+            label_str = ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+            title = f"{name}{{{label_str}}}" if label_str else name
+            print(f"{title:<58}{count:>8}{total:>12.3f}{total / count:>11.3f}{maximum:>11.3f}")
+
+    def close(self):
+        try:
+            if self._aggregates:
+                self.write_textfile()
+        except OSError as e:
+            logger.warning(f"⚠️ Prometheus Textfile nicht schreibbar: {e}")
+        if self._trace is not None:
+            self._trace.close()
+            self._trace = None
+
+
+# Prozessweite Instanz (wie der Workflow-Cache): alle Module messen in dieselben Aggregate
+metrics = Metrics(METRICS_TRACE_FILE if METRICS_ENABLED else None,
+                  METRICS_PROM_FILE if METRICS_ENABLED else None)
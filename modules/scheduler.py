@@ -0,0 +1,167 @@
+import fcntl
+import os
+import signal
+import time
+from pathlib import Path
+from typing import Callable, List, Optional
+from modules.metrics import metrics
+from modules.utils import setup_logging
+
+logger = setup_logging("Scheduler")
+
+PHASE_IDLE = "idle"
+PHASE_STORY = "story"
+PHASE_ART = "art"
+
+
+class TopicQueue:
+    """
+    Warteschlange für Themen als Textdatei (ein Thema pro Zeile).
+    Neue Themen kann man einfach anhängen: echo "Ein Drache lernt tanzen" >> topics_queue.txt
+    `pop()` entnimmt das erste Thema unter Datei-Lock und schreibt den Rest atomar zurück.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def _read(self) -> List[str]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return [line.strip() for line in f if line.strip() and not line.strip().startswith("#")]
+        except FileNotFoundError:
+            return []
+
+    def depth(self) -> int:
+        return len(self._read())
+
+    def push(self, topic: str):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(topic.strip() + "\n")
+
+    def pop(self) -> Optional[str]:
+        if not self.path.exists():
+            return None
+        with open(self.path.with_suffix(".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            topics = self._read()
+            if not topics:
+                return None
+            tmp = self.path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.writelines(t + "\n" for t in topics[1:])
+            os.replace(tmp, self.path)
+            return topics[0]
+
+
+class PhaseScheduler:
+    """
+    Entscheidet, wann die GPU zwischen Ollama (Story) und ComfyUI (Art) wechselt.
+
+    Regeln (Hysterese, damit sich jeder Modell-Wechsel lohnt):
+    - Eine Phase läuft mindestens `min_dwell` Sekunden (außer ihre Queue ist leer).
+    - Ist die Queue der aktiven Phase leer, wird direkt zur anderen gewechselt (falls dort Arbeit liegt).
+    - Sonst wird gewechselt, wenn die andere Queue ihre High-Watermark erreicht und die aktive
+      auf ihre Low-Watermark abgearbeitet ist – oder spätestens nach `max_dwell` Sekunden.
+    - Im Leerlauf startet eine Phase, sobald ihre Queue die High-Watermark erreicht oder
+      Arbeit länger als `max_idle_wait` Sekunden wartet.
+
+    Die eigentliche Arbeit liefern Callbacks; eine Arbeitseinheit ist ein Thema bzw. ein Szenen-Paket.
+    `switch(alt, neu)` wird nur bei einem echten Modell-Wechsel aufgerufen, `shutdown(aktiv)` am Ende.
+    """
+
+    def __init__(self,
+                 story_depth: Callable[[], int], art_depth: Callable[[], int],
+                 do_story: Callable[[], None], do_art: Callable[[], None],
+                 switch: Callable[[str, str], None], shutdown: Callable[[str], None],
+                 story_high: int, story_low: int, art_high: int, art_low: int,
+                 min_dwell: float, max_dwell: float, max_idle_wait: float, poll_interval: float):
+        self.story_depth = story_depth
+        self.art_depth = art_depth
+        self.do_story = do_story
+        self.do_art = do_art
+        self.switch = switch
+        self.shutdown = shutdown
+        self.high = {PHASE_STORY: story_high, PHASE_ART: art_high}
+        self.low = {PHASE_STORY: story_low, PHASE_ART: art_low}
+        self.min_dwell = min_dwell
+        self.max_dwell = max_dwell
+        self.max_idle_wait = max_idle_wait
+        self.poll_interval = poll_interval
+
+        self.phase = PHASE_IDLE
+        self.last_active = PHASE_IDLE  # Welches Modell zuletzt geladen war
+        self.phase_since = time.monotonic()
+        self.waiting_since: Optional[float] = None
+        self.switches = 0
+        self._stop = False
+
+    def decide(self, story_depth: int, art_depth: int, now: float) -> str:
+        """Nächste Phase anhand der Queue-Tiefen (reine Funktion des Zustands)."""
+        depth = {PHASE_STORY: story_depth, PHASE_ART: art_depth}
+
+        if self.phase == PHASE_IDLE:
+            for phase in (PHASE_STORY, PHASE_ART):
+                if depth[phase] >= self.high[phase]:
+                    return phase
+            if story_depth or art_depth:
+                if self.waiting_since is not None and now - self.waiting_since >= self.max_idle_wait:
+                    # Bevorzugt das Modell, das noch geladen ist
+                    if self.last_active != PHASE_IDLE and depth[self.last_active]:
+                        return self.last_active
+                    return PHASE_STORY if story_depth else PHASE_ART
+            return PHASE_IDLE
+
+        current = self.phase
+        other = PHASE_ART if current == PHASE_STORY else PHASE_STORY
+        dwell = now - self.phase_since
+
+        if depth[current] == 0:
+            return other if depth[other] else PHASE_IDLE
+        if depth[other] and dwell >= self.min_dwell:
+            if depth[other] >= self.high[other] and depth[current] <= self.low[current]:
+                return other
+            if dwell >= self.max_dwell:
+                return other
+        return current
+
+    def stop(self, *_):
+        logger.info("🛑 Stop angefordert. Beende nach der aktuellen Arbeitseinheit...")
+        self._stop = True
+
+    def run_forever(self):
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        logger.info("🗓 Scheduler läuft. Beenden mit Ctrl+C.")
+
+        while not self._stop:
+            metrics.write_if_due()  # Dauerbetrieb: Textfile zwischendurch aktualisieren, nicht erst beim Beenden
+            now = time.monotonic()
+            story_depth, art_depth = self.story_depth(), self.art_depth()
+            if self.phase == PHASE_IDLE and (story_depth or art_depth):
+                if self.waiting_since is None:
+                    self.waiting_since = now
+            else:
+                self.waiting_since = None
+
+            target = self.decide(story_depth, art_depth, now)
+            if target != self.phase:
+                logger.info(f"🔀 Phase {self.phase} -> {target} (Topics: {story_depth}, Szenen: {art_depth})")
+                if target not in (PHASE_IDLE, self.last_active):
+                    # Nur echte Modell-Wechsel kosten etwas; Leerlauf lässt das Modell geladen
+                    if self.last_active != PHASE_IDLE:
+                        self.switches += 1
+                    self.switch(self.last_active, target)
+                self.phase = target
+                self.phase_since = now
+                if target != PHASE_IDLE:
+                    self.last_active = target
+
+            if self.phase == PHASE_STORY:
+                self.do_story()
+            elif self.phase == PHASE_ART:
+                self.do_art()
+            else:
+                time.sleep(self.poll_interval)
+
+        self.shutdown(self.last_active)
+        logger.info(f"👋 Scheduler beendet ({self.switches} GPU-Wechsel).")
@@ -0,0 +1,94 @@
+import fcntl
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+from config import STORY_CACHE_DIR, STORY_CACHE_TTL_DAYS, STORY_CACHE_MAX_ENTRIES
+from modules.utils import setup_logging
+from modules.metrics import metrics
+
+logger = setup_logging("Story_Cache")
+
+
+class StoryCache:
+    """
+    Lokaler Cache für validierte Stories (eine JSON-Datei pro Eintrag, prozessübergreifend).
+    Schlüssel ist der Hash aus Modell, System-Prompt, Thema und Generierungs-Optionen: ändert sich
+    einer davon, wird neu generiert. Einträge verfallen nach `ttl` Sekunden; bei mehr als
+    `max_entries` Einträgen fliegen die am längsten nicht benutzten raus (mtime = letzter Zugriff).
+    """
+
+    def __init__(self, root: Path = STORY_CACHE_DIR, ttl: float = STORY_CACHE_TTL_DAYS * 86400,
+                 max_entries: int = STORY_CACHE_MAX_ENTRIES):
+        self.root = root
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    @staticmethod
+    def key(model: str, system_prompt: str, topic: str, options: Dict[str, Any]) -> str:
+        system_hash = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+        payload = json.dumps([model, system_hash, topic.strip(), options], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.root / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Die gecachte Story oder None (nicht vorhanden, abgelaufen oder kaputt)."""
+        path = self.path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            if time.time() - entry["created"] > self.ttl:
+                path.unlink(missing_ok=True)
+                raise KeyError("abgelaufen")
+            story = entry["story"]
+            if not isinstance(story, dict):
+                raise TypeError("kaputter Eintrag")
+            os.utime(path)  # LRU: Zugriff merken
+        except (FileNotFoundError, json.JSONDecodeError, KeyError, TypeError):
+            metrics.inc("story_cache_total", labels={"result": "miss"})
+            return None
+        metrics.inc("story_cache_total", labels={"result": "hit"})
+        return story
+
+    def put(self, key: str, topic: str, model: str, story: Dict[str, Any]):
+        """Speichert eine validierte Story (atomar)."""
+        entry = {"created": time.time(), "model": model, "topic": topic, "story": story}
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            tmp = self.path(key).with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp, self.path(key))
+        except OSError as e:
+            logger.warning(f"⚠️ Story konnte nicht gecacht werden: {e}")
+            return
+        self._evict()
+
+    def _evict(self):
+        """Entfernt abgelaufene Einträge und die ältesten über `max_entries` hinaus."""
+        with open(self.root / ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            now = time.time()
+            entries = []
+            for f in self.root.glob("*.json"):
+                try:
+                    mtime = f.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                entries.append((mtime, f))
+            if len(entries) <= self.max_entries and all(now - m <= self.ttl for m, _ in entries):
+                return
+            entries.sort()
+            excess = len(entries) - self.max_entries
+            removed = 0
+            for i, (mtime, f) in enumerate(entries):
+                # mtime >= created, also ist ein Eintrag mit alter mtime sicher abgelaufen
+                if i < excess or now - mtime > self.ttl:
+                    f.unlink(missing_ok=True)
+                    removed += 1
+        if removed:
+            logger.info(f"🧹 Story-Cache: {removed} Einträge entfernt.")
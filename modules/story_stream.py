@@ -0,0 +1,198 @@
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+# Event-Typen, die der Parser liefert
+EVENT_TITLE = "title"
+EVENT_BLOCK = "block"
+
+StoryEvent = Tuple[str, Any]
+
+
+class StoryStreamError(ValueError):
+    """Der Token-Strom ist kein gültiges JSON (mehr)."""
+
+
+class StoryStreamParser:
+    """
+    Inkrementeller Parser für das Story-JSON ({"title": ..., "blocks": [...]}).
+    Verarbeitet den Token-Strom Zeichen für Zeichen und meldet den Titel und jeden
+    Block, sobald er vollständig ist – nicht erst nach dem letzten Token.
+    Die Tokens werden als Liste gesammelt (kein quadratisches String-Anhängen).
+    """
+
+    def __init__(self):
+        self._chunks: List[str] = []
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._expect_key = False
+        self._key: Optional[str] = None
+        self._string: Optional[List[str]] = None  # String auf Top-Level (Key oder Wert)
+        self._block: Optional[List[str]] = None   # Aktuell gelesener Block
+        self.closed = False
+        self.blocks_closed = False
+        # Top-Level Key -> Typ des Werts ('object', 'array', 'string', 'scalar'), sobald er beginnt
+        self.value_types: Dict[str, str] = {}
+        self.title: Optional[str] = None
+        self.blocks: List[Dict] = []
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    @property
+    def depth(self) -> int:
+        return len(self._stack)
+
+    @property
+    def key(self) -> Optional[str]:
+        """Aktueller Top-Level Key (z.B. 'title' oder 'blocks')."""
+        return self._key
+
+    def feed(self, chunk: str) -> List[StoryEvent]:
+        """Verarbeitet ein Token und gibt die dadurch fertig gewordenen Events zurück."""
+        self._chunks.append(chunk)
+        events: List[StoryEvent] = []
+
+        for ch in chunk:
+            if self._block is not None:
+                self._block.append(ch)
+
+            if self._in_string:
+                if self._string is not None:
+                    self._string.append(ch)
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._string is not None:
+                        self._top_level_string(self._loads(self._string), events)
+                        self._string = None
+                continue
+
+            if ch.isspace():
+                continue
+            if self.closed:
+                raise StoryStreamError(f"Zeichen nach dem Ende des JSON-Objekts: {ch!r}")
+
+            if self.depth == 1 and not self._expect_key and self._key not in self.value_types \
+                    and ch not in ":,}":
+                self.value_types[self._key] = {"{": "object", "[": "array", '"': "string"}.get(ch, "scalar")
+
+            if ch == '"':
+                self._in_string = True
+                if self.depth == 1:
+                    self._string = [ch]
+            elif ch in "{[":
+                if not self._stack and ch != "{":
+                    raise StoryStreamError("JSON muss mit einem Objekt beginnen")
+                if ch == "{" and self._stack == ["{", "["] and self._key == "blocks":
+                    self._block = [ch]
+                self._stack.append(ch)
+                if self.depth == 1:
+                    self._expect_key = True
+            elif ch in "}]":
+                expected = "{" if ch == "}" else "["
+                if not self._stack or self._stack[-1] != expected:
+                    raise StoryStreamError(f"Unerwartete Klammer {ch!r}")
+                self._stack.pop()
+                if self._block is not None and self.depth == 2:
+                    block = self._loads(self._block)
+                    self._block = None
+                    self.blocks.append(block)
+                    events.append((EVENT_BLOCK, block))
+                if self.depth == 1 and ch == "]" and self._key == "blocks":
+                    self.blocks_closed = True
+                if not self._stack:
+                    self.closed = True
+            elif not self._stack:
+                raise StoryStreamError(f"Unerwartetes Zeichen vor dem JSON-Objekt: {ch!r}")
+            elif self.depth == 1:
+                if ch == ":":
+                    self._expect_key = False
+                elif ch == ",":
+                    self._expect_key = True
+
+        return events
+
+    @staticmethod
+    def _loads(chars: List[str]) -> Any:
+        try:
+            return json.loads("".join(chars))
+        except json.JSONDecodeError as e:
+            raise StoryStreamError(str(e)) from e
+
+    def _top_level_string(self, value: str, events: List[StoryEvent]):
+        if self._expect_key:
+            self._key = value
+        elif self._key == "title":
+            self.title = value
+            events.append((EVENT_TITLE, value))
+
+    def result(self) -> Dict[str, Any]:
+        """Parst den kompletten Text (nach dem letzten Token)."""
+        try:
+            return json.loads(self.text)
+        except json.JSONDecodeError as e:
+            raise StoryStreamError(str(e)) from e
+
+
+class StoryValidationError(StoryStreamError):
+    """Die Ausgabe kann das erwartete Story-Schema nicht mehr erfüllen."""
+
+
+class StoryStreamValidator:
+    """
+    Prüft die teilweise empfangene Story gegen das Schema, während die Tokens ankommen.
+    Wirft StoryValidationError, sobald klar ist, dass die Ausgabe nicht mehr passen kann
+    (falscher Typ für 'title'/'blocks', unbekannter Block-Typ, zu wenige Szenen beim
+    Schließen der Block-Liste, endlos weiterlaufende Ausgabe). So kann der Aufrufer die
+    Generierung abbrechen, statt auf das Ende zu warten.
+    """
+
+    BLOCK_TYPES = ("text", "image_prompt")
+
+    def __init__(self, min_scenes: int, max_blocks: Optional[int] = None):
+        self.parser = StoryStreamParser()
+        self.min_scenes = min_scenes
+        self.max_blocks = max_blocks or min_scenes * 4
+        self.scenes = 0
+
+    def feed(self, chunk: str) -> List[StoryEvent]:
+        events = self.parser.feed(chunk)
+        for event, value in events:
+            if event == EVENT_BLOCK:
+                self._check_block(value)
+        self._check_structure()
+        return events
+
+    def _check_block(self, block: Any):
+        if not isinstance(block, dict):
+            raise StoryValidationError(f"Block ist kein Objekt: {block!r}")
+        if block.get("type") not in self.BLOCK_TYPES:
+            raise StoryValidationError(f"Unbekannter Block-Typ: {block.get('type')!r}")
+        if not isinstance(block.get("content"), str) or not block["content"].strip():
+            raise StoryValidationError(f"Block ohne Inhalt: {block!r}")
+        if block["type"] == "image_prompt":
+            self.scenes += 1
+
+    def _check_structure(self):
+        parser = self.parser
+        for key, expected in (("title", "string"), ("blocks", "array")):
+            actual = parser.value_types.get(key)
+            if actual is not None and actual != expected:
+                raise StoryValidationError(f"'{key}' ist vom Typ {actual}, erwartet {expected}")
+        if len(parser.blocks) > self.max_blocks:
+            raise StoryValidationError(f"Mehr als {self.max_blocks} Blöcke – Ausgabe läuft aus dem Ruder")
+        if parser.blocks_closed and self.scenes < self.min_scenes:
+            raise StoryValidationError(f"Nur {self.scenes} von {self.min_scenes} Szenen")
+        if parser.closed and (parser.title is None or "blocks" not in parser.value_types):
+            raise StoryValidationError("Objekt ohne 'title' oder 'blocks' geschlossen")
+
+    def result(self) -> Dict[str, Any]:
+        """Validiert und parst die komplette Ausgabe (nach dem letzten Token)."""
+        if not self.parser.closed:
+            raise StoryValidationError("Ausgabe endet mitten im JSON")
+        return self.parser.result()
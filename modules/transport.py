@@ -0,0 +1,152 @@
+import os
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import (
+    HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_POOL_SIZE, HTTP_RETRIES, HTTP_BACKOFF_SECONDS,
+    HTTP_BACKOFF_MAX_SECONDS, HTTP_DOWNLOAD_CHUNK_BYTES
+)
+from modules.utils import setup_logging
+from modules.metrics import metrics
+
+logger = setup_logging("Transport")
+
+Timeout = Union[float, Tuple[float, float]]
+
+# Requests, die man ohne Nebenwirkung wiederholen darf. POST nur, wenn der Aufrufer es ausdrücklich sagt
+# (ComfyUI /prompt würde doppelt rendern, Ollama /generate doppelt generieren).
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# Antworten, nach denen sich ein neuer Versuch lohnt (Überlast, Proxy/Neustart)
+RETRY_STATUSES = {429, 502, 503, 504}
+
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def _host(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def session_for(url: str) -> requests.Session:
+    """
+    Keep-Alive Session für den Host von `url` (eine pro scheme://host:port, prozessweit geteilt).
+    Der Pool hält bis zu HTTP_POOL_SIZE Verbindungen, genug für alle Render- und Download-Threads.
+    """
+    host = _host(url)
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount(f"{host}/", adapter)
+            _sessions[host] = session
+        return session
+
+
+def _backoff(attempt: int) -> float:
+    """Exponentiell mit Jitter: 0.5s, 1s, 2s, ... (gedeckelt), damit Wiederholungen nicht gleichzeitig kommen."""
+    return min(HTTP_BACKOFF_MAX_SECONDS, HTTP_BACKOFF_SECONDS * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+def _retry_wait(response: Optional[requests.Response], attempt: int) -> float:
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return min(HTTP_BACKOFF_MAX_SECONDS, float(retry_after))
+    return _backoff(attempt)
+
+
+def _note_retry(method: str, url: str, attempt: int, attempts: int, reason, wait: float):
+    metrics.inc("http_retries_total", labels={"host": _host(url), "method": method})
+    logger.warning(f"🔁 {method} {url} fehlgeschlagen ({reason}), Versuch {attempt + 2}/{attempts} in {wait:.1f}s...")
+
+
+def request(method: str, url: str, timeout: Optional[Timeout] = None, idempotent: Optional[bool] = None,
+            retries: int = HTTP_RETRIES, **kwargs) -> requests.Response:
+    """
+    Wie requests.request, aber über die gepoolte Session des Hosts und immer mit Timeout
+    (Default: HTTP_CONNECT_TIMEOUT für den Verbindungsaufbau, HTTP_READ_TIMEOUT zwischen zwei Datenpaketen).
+    Idempotente Requests werden bei Verbindungsfehlern, Timeouts und 429/5xx bis zu `retries` mal mit
+    exponentiellem Backoff wiederholt. Die letzte Antwort wird unverändert zurückgegeben (kein raise_for_status).
+    """
+    method = method.upper()
+    if idempotent is None:
+        idempotent = method in IDEMPOTENT_METHODS
+    attempts = 1 + (max(0, retries) if idempotent else 0)
+    session = session_for(url)
+    if timeout is None:
+        timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+
+    for attempt in range(attempts):
+        last = attempt + 1 >= attempts
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if last:
+                raise
+            wait = _backoff(attempt)
+            _note_retry(method, url, attempt, attempts, e, wait)
+        else:
+            if last or response.status_code not in RETRY_STATUSES:
+                return response
+            wait = _retry_wait(response, attempt)
+            _note_retry(method, url, attempt, attempts, f"HTTP {response.status_code}", wait)
+            response.close()
+        time.sleep(wait)
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def download(url: str, target: Path, params: Optional[Dict] = None, timeout: Optional[Timeout] = None,
+             retries: int = HTTP_RETRIES) -> int:
+    """
+    Lädt `url` in Blöcken (HTTP_DOWNLOAD_CHUNK_BYTES) in eine Temp-Datei neben `target` und
+    ersetzt `target` erst danach atomar: ein Absturz hinterlässt nie eine halbe Datei, und eine
+    bestehende Datei (z.B. ein Hardlink in den Bild-Cache) wird ersetzt statt überschrieben.
+    Auch Abbrüche mitten im Body werden mit Backoff wiederholt. Gibt die Anzahl Bytes zurück.
+    """
+    target = Path(target)
+    attempts = 1 + max(0, retries)
+    for attempt in range(attempts):
+        last = attempt + 1 >= attempts
+        fd, tmp_name = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.", suffix=".tmp")
+        size = None
+        try:
+            with os.fdopen(fd, "wb") as f:
+                # Wiederholt wird hier (inkl. Abbrüchen im Body), nicht zusätzlich in request()
+                with request("GET", url, params=params, timeout=timeout, retries=0, stream=True) as response:
+                    if last or response.status_code not in RETRY_STATUSES:
+                        response.raise_for_status()
+                        size = 0
+                        for chunk in response.iter_content(chunk_size=HTTP_DOWNLOAD_CHUNK_BYTES):
+                            f.write(chunk)
+                            size += len(chunk)
+                    else:
+                        reason, wait = f"HTTP {response.status_code}", _retry_wait(response, attempt)
+            if size is not None:
+                os.replace(tmp_name, target)
+                return size
+        except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout) as e:
+            if last:
+                raise
+            reason, wait = e, _backoff(attempt)
+        finally:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+        _note_retry("GET", url, attempt, attempts, reason, wait)
+        time.sleep(wait)
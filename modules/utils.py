@@ -1,5 +1,10 @@
 import logging
 import sys
+import threading
+import time
+from typing import Callable, Generic, Optional, TypeVar
+
+T = TypeVar("T")
 
 def setup_logging(name: str = "KidsBookGen") -> logging.Logger:
     """
@@ -21,3 +26,62 @@ def setup_logging(name: str = "KidsBookGen") -> logging.Logger:
         logger.addHandler(handler)
 
     return logger
+
+
+class TokenBucket:
+    """
+    Einfacher, thread-sicherer Token Bucket für Rate Limits (z.B. Airtable: 5 Requests/s).
+    `acquire()` blockiert, bis ein Token frei ist, und gibt die Wartezeit in Sekunden zurück.
+    `capacity` ist der erlaubte Burst (Default: `rate`). Ein voller Bucket plus Nachschub erlaubt in einer
+    Sekunde bis zu capacity + rate Requests; für ein hartes "max. N pro Sekunde" capacity=1 nehmen.
+    `on_wait(sekunden)` wird nach jedem acquire() aufgerufen (z.B. für Metriken).
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None,
+                 on_wait: Optional[Callable[[float], None]] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.on_wait = on_wait
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    break
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+        if self.on_wait:
+            self.on_wait(waited)
+        return waited
+
+
+class Lazy(Generic[T]):
+    """
+    Baut ein Objekt erst beim ersten `get()` (thread-sicher), z.B. Clients, die ein Lauf vielleicht nie braucht.
+    `built` sagt, ob es schon existiert – etwa um beim Aufräumen nichts zu bauen, nur um es zu schließen.
+    """
+
+    def __init__(self, factory: Callable[[], T]):
+        self._factory = factory
+        self._value: Optional[T] = None
+        self._lock = threading.Lock()
+
+    @property
+    def built(self) -> bool:
+        return self._value is not None
+
+    def get(self) -> T:
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    self._value = self._factory()
+        return self._value
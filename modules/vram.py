@@ -0,0 +1,96 @@
+import time
+import requests
+from typing import Callable, Optional, Tuple
+from config import (
+    OLLAMA_API_PS, COMFY_URL, VRAM_HANDOFF_TIMEOUT, VRAM_POLL_INTERVAL, COMFY_MIN_FREE_VRAM_MB
+)
+from modules.utils import setup_logging
+from modules import transport
+
+logger = setup_logging("VRAM")
+
+
+class VramHandoff:
+    """
+    Übergabe der GPU zwischen Ollama und ComfyUI anhand des echten Zustands statt fester Pausen:
+    - Ollama: pollt /api/ps, bis das Modell nicht mehr geladen ist.
+    - ComfyUI: pollt /system_stats, bis genug VRAM für ComfyUI da ist (nur solange Ollama noch ein Modell hält).
+    Beide Checks kehren zurück, sobald die Bedingung erfüllt ist, und geben False nach dem Timeout.
+    """
+
+    def __init__(self, timeout: float = VRAM_HANDOFF_TIMEOUT, poll_interval: float = VRAM_POLL_INTERVAL):
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+
+    def _poll(self, check: Callable[[], bool], what: str) -> bool:
+        start = time.monotonic()
+        deadline = start + self.timeout
+        last_error = None
+        while True:
+            try:
+                if check():
+                    logger.info(f"✅ {what} nach {time.monotonic() - start:.1f}s.")
+                    return True
+            except requests.exceptions.HTTPError as e:
+                if e.response is not None and e.response.status_code == 404:
+                    # Endpoint gibt es nicht (alte Version) -> sofort auf Fallback gehen
+                    logger.warning(f"⚠️ {what}: Endpoint nicht verfügbar ({e}).")
+                    return False
+                last_error = e
+            except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+                last_error = e
+            if time.monotonic() >= deadline:
+                reason = f" (letzter Fehler: {last_error})" if last_error else ""
+                logger.warning(f"⚠️ Timeout nach {self.timeout:.0f}s: {what} nicht bestätigt{reason}.")
+                return False
+            time.sleep(self.poll_interval)
+
+    @staticmethod
+    def ollama_loaded_models() -> list:
+        """Namen der aktuell von Ollama geladenen Modelle (z.B. 'llama3.1:latest')."""
+        res = transport.get(OLLAMA_API_PS, timeout=5, retries=0)  # _poll wiederholt selbst
+        res.raise_for_status()
+        return [m.get("name") or m.get("model", "") for m in res.json().get("models", [])]
+
+    @staticmethod
+    def comfy_vram_mb() -> Optional[Tuple[float, float]]:
+        """
+        (freier VRAM, von ComfyUI selbst belegter VRAM) in MB laut /system_stats (größtes Device),
+        None wenn kein Device gemeldet wird. ComfyUIs Anteil ist das, was torch reserviert und belegt hat
+        (v.a. der zwischen zwei Prompts geladene Checkpoint).
+        """
+        res = transport.get(f"{COMFY_URL}/system_stats", timeout=5, retries=0)
+        res.raise_for_status()
+        devices = res.json().get("devices", [])
+        if not devices:
+            return None
+        device = max(devices, key=lambda d: d.get("vram_total", 0))
+        held = max(0, device.get("torch_vram_total", 0) - device.get("torch_vram_free", 0))
+        return device.get("vram_free", 0) / (1024 * 1024), held / (1024 * 1024)
+
+    def wait_for_ollama_unloaded(self, model: str) -> bool:
+        """Wartet, bis `model` nicht mehr in Ollamas /api/ps auftaucht."""
+        def unloaded() -> bool:
+            names = self.ollama_loaded_models()
+            return not any(name == model or name.startswith(f"{model}:") for name in names)
+        return self._poll(unloaded, f"Ollama hat '{model}' entladen")
+
+    def wait_for_comfy_vram(self, min_free_mb: float = COMFY_MIN_FREE_VRAM_MB) -> bool:
+        """
+        Wartet, bis ComfyUI mindestens `min_free_mb` VRAM zur Verfügung hat: frei plus das, was ComfyUI
+        selbst schon belegt (sein geladener Checkpoint zählt nicht gegen ihn).
+        Hat Ollama kein Modell geladen, gibt es nichts abzuwarten -> sofort True ohne /system_stats.
+        """
+        try:
+            loaded = self.ollama_loaded_models()
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"⚠️ Ollama /api/ps nicht erreichbar ({e}), prüfe nur den ComfyUI VRAM.")
+            loaded = None
+        if loaded == []:
+            logger.info("✅ Kein Ollama-Modell geladen, die GPU gehört ComfyUI.")
+            return True
+
+        def enough() -> bool:
+            vram = self.comfy_vram_mb()
+            return vram is None or sum(vram) >= min_free_mb
+        return self._poll(enough, f"ComfyUI hat >= {min_free_mb:.0f} MB VRAM (frei + eigener)")
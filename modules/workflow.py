@@ -0,0 +1,216 @@
+import hashlib
+import json
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Any, Set, Tuple
+from config import WORKFLOWS_DIR, COMFY_WORKFLOW
+from modules.utils import setup_logging
+
+logger = setup_logging("Workflow")
+
+# Patch-Punkte: Name -> (Node ID, Input-Name)
+PatchPoints = Dict[str, Tuple[str, str]]
+
+# Node IDs der Zweige 2..N in einem Batch-Prompt: "<Original-ID>_b<Index>" (Zweig 1 behält die Original-IDs).
+# Gibt es die ID im Workflow schon, wird so lange "_" angehängt, bis sie frei ist.
+BRANCH_SEPARATOR = "_b"
+
+
+def find_nodes(workflow: Dict) -> Tuple[str, str]:
+    """
+    Analysiert den Graphen und findet dynamisch:
+    1. Die KSampler Node (für Seed)
+    2. Die Positive Prompt Node (CLIPTextEncode)
+
+    Returns: (sampler_id, prompt_node_id)
+    """
+    sampler_id = None
+    prompt_id = None
+
+    # 1. Suche KSampler
+    for node_id, node_data in workflow.items():
+        if node_data.get("class_type") == "KSampler":
+            sampler_id = node_id
+            # Finde den Input Link für "positive"
+            # Format: "positive": ["6", 0] -> Node ID ist "6"
+            positive_input = node_data.get("inputs", {}).get("positive")
+            if positive_input and isinstance(positive_input, list):
+                prompt_id = positive_input[0]
+            break
+
+    if not sampler_id or not prompt_id:
+        # Fallback Suche: Falls kein KSampler gefunden (z.B. anderer Sampler Name), suche einfach nach CLIPTextEncode
+        logger.warning("⚠️ Standard KSampler Verbindung nicht gefunden. Suche nach erstem CLIPTextEncode...")
+        for node_id, node_data in workflow.items():
+            if node_data.get("class_type") == "CLIPTextEncode" and not prompt_id:
+                prompt_id = node_id
+            if node_data.get("class_type") == "KSampler" and not sampler_id:
+                sampler_id = node_id
+
+    if not sampler_id:
+        raise ValueError("Kein KSampler im Workflow gefunden.")
+    if not prompt_id:
+        raise ValueError("Kein Prompt-Node (CLIPTextEncode) gefunden.")
+
+    return sampler_id, prompt_id
+
+
+def _linked_node(workflow: Dict, node_id: str, input_name: str) -> Optional[str]:
+    """Folgt einem Input-Link (["6", 0]) und gibt die Quell-Node ID zurück."""
+    link = workflow.get(node_id, {}).get("inputs", {}).get(input_name)
+    if isinstance(link, list) and link and str(link[0]) in workflow:
+        return str(link[0])
+    return None
+
+
+def _is_link(workflow: Dict, value: Any) -> bool:
+    return isinstance(value, list) and len(value) == 2 and str(value[0]) in workflow
+
+
+def downstream_nodes(workflow: Dict, roots: List[str]) -> Set[str]:
+    """Alle Nodes, die (direkt oder indirekt) von `roots` abhängen, inklusive der Roots selbst."""
+    consumers: Dict[str, List[str]] = {}
+    for node_id, node_data in workflow.items():
+        for value in node_data.get("inputs", {}).values():
+            if _is_link(workflow, value):
+                consumers.setdefault(str(value[0]), []).append(node_id)
+
+    seen = set(roots)
+    stack = list(roots)
+    while stack:
+        for consumer in consumers.get(stack.pop(), []):
+            if consumer not in seen:
+                seen.add(consumer)
+                stack.append(consumer)
+    return seen
+
+
+class WorkflowTemplate:
+    """
+    Ein einmal geladener und analysierter ComfyUI Workflow.
+    Die Graph-Analyse läuft nur beim Laden; `render()` erzeugt danach pro Job ein Payload,
+    indem nur die gepatchten Nodes kopiert werden (kein erneutes JSON-Parsing).
+    `render_batch()` packt mehrere Szenen in einen Prompt (siehe dort).
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        raw = path.read_bytes()
+        self.mtime = path.stat().st_mtime
+        self.graph: Dict[str, Dict] = json.loads(raw)
+        # Fingerprint des Workflows (z.B. für Caches): ändert sich mit jeder Dateiänderung
+        self.fingerprint = hashlib.sha256(raw).hexdigest()
+        self.patch_points = self._compile()
+        # Nodes, die pro Szene existieren müssen: alles ab Prompt-Node und Sampler abwärts
+        # (Sampler, VAE Decode, SaveImage, ...). Checkpoint, Negative Prompt & Latent werden geteilt.
+        self.branch_nodes = downstream_nodes(
+            self.graph, [self.patch_points["prompt"][0], self.patch_points["seed"][0]])
+
+    def _compile(self) -> PatchPoints:
+        sampler_id, prompt_node_id = find_nodes(self.graph)
+        points: PatchPoints = {
+            "prompt": (prompt_node_id, "text"),
+            "seed": (sampler_id, "seed"),
+        }
+
+        negative_id = _linked_node(self.graph, sampler_id, "negative")
+        if negative_id and "text" in self.graph[negative_id].get("inputs", {}):
+            points["negative"] = (negative_id, "text")
+
+        latent_id = _linked_node(self.graph, sampler_id, "latent_image")
+        if latent_id and "batch_size" in self.graph[latent_id].get("inputs", {}):
+            points["batch_size"] = (latent_id, "batch_size")
+
+        for node_id, node_data in self.graph.items():
+            if node_data.get("class_type") == "SaveImage":
+                points["prefix"] = (node_id, "filename_prefix")
+                break
+
+        summary = ", ".join(f"{name}='{node_id}'" for name, (node_id, _) in points.items())
+        logger.info(f"🔍 Graph Analyse ({self.path.name}): {summary}")
+        return points
+
+    def is_stale(self) -> bool:
+        """True, wenn die Datei seit dem Laden geändert wurde."""
+        try:
+            return self.path.stat().st_mtime != self.mtime
+        except FileNotFoundError:
+            return False
+
+    def render(self, prompt_text: str, seed: int, negative: Optional[str] = None,
+               batch_size: Optional[int] = None, filename_prefix: Optional[str] = None) -> Dict[str, Any]:
+        """Erzeugt das API-Payload für einen Job. Nicht gepatchte Nodes werden geteilt, nicht kopiert."""
+        values = {"prompt": prompt_text, "seed": seed, "negative": negative,
+                  "batch_size": batch_size, "prefix": filename_prefix}
+
+        payload = dict(self.graph)
+        copied = set()
+        for name, value in values.items():
+            if value is None or name not in self.patch_points:
+                continue
+            node_id, input_name = self.patch_points[name]
+            if node_id not in copied:
+                node = payload[node_id]
+                payload[node_id] = {**node, "inputs": dict(node.get("inputs", {}))}
+                copied.add(node_id)
+            payload[node_id]["inputs"][input_name] = value
+        return payload
+
+    def render_batch(self, scenes: List[Tuple[str, int, str]], negative: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Erzeugt ein Payload mit einem Zweig pro Szene (prompt_text, seed, filename_prefix).
+        Jeder Zweig bekommt eigene Kopien der Zweig-Nodes (Prompt, Sampler, Decode, SaveImage) und
+        speichert unter seinem eigenen Prefix; Checkpoint Loader, Negative Prompt und Latent sind geteilt.
+        ComfyUI lädt das Modell so nur einmal und validiert/plant den Graphen einmal für alle Szenen.
+        """
+        if "prefix" not in self.patch_points or self.patch_points["prefix"][0] not in self.branch_nodes:
+            raise ValueError(f"{self.path.name}: SaveImage hängt nicht am Prompt, Workflow kann nicht gebündelt werden.")
+
+        payload = dict(self.graph)
+        for index, (prompt_text, seed, filename_prefix) in enumerate(scenes):
+            ids = {node_id: node_id for node_id in self.branch_nodes}
+            if index:
+                for node_id in self.branch_nodes:
+                    branch_id = f"{node_id}{BRANCH_SEPARATOR}{index}"
+                    while branch_id in payload:
+                        branch_id += "_"
+                    ids[node_id] = branch_id
+            for node_id in self.branch_nodes:
+                node = self.graph[node_id]
+                inputs = {}
+                for name, value in node.get("inputs", {}).items():
+                    if _is_link(self.graph, value) and str(value[0]) in ids:
+                        value = [ids[str(value[0])], value[1]]
+                    inputs[name] = value
+                payload[ids[node_id]] = {**node, "inputs": inputs}
+            for name, value in (("prompt", prompt_text), ("seed", seed), ("prefix", filename_prefix)):
+                node_id, input_name = self.patch_points[name]
+                payload[ids[node_id]]["inputs"][input_name] = value
+
+        if negative is not None and "negative" in self.patch_points:
+            node_id, input_name = self.patch_points["negative"]
+            node = payload[node_id]
+            payload[node_id] = {**node, "inputs": {**node.get("inputs", {}), input_name: negative}}
+        return payload
+
+
+_templates: Dict[str, WorkflowTemplate] = {}
+_templates_lock = threading.Lock()
+
+
+def get_workflow_template(workflow_name: str = COMFY_WORKFLOW) -> WorkflowTemplate:
+    """
+    Liefert den kompilierten Workflow aus dem Prozess-Cache.
+    Neu geladen wird nur, wenn sich die mtime der Datei geändert hat.
+    """
+    with _templates_lock:
+        template = _templates.get(workflow_name)
+        if template is None or template.is_stale():
+            path = WORKFLOWS_DIR / workflow_name
+            try:
+                template = WorkflowTemplate(path)
+            except FileNotFoundError:
+                logger.error(f"❌ Workflow Datei nicht gefunden: {path}")
+                raise
+            _templates[workflow_name] = template
+        return template
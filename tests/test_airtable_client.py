@@ -0,0 +1,96 @@
+import threading
+import time
+import pytest
+import modules.airtable_client as airtable_client
+from benchmarks.fake_servers import FakeAirtable
+from config import AIRTABLE_RATE_LIMIT, AIRTABLE_TABLE_SCENES
+
+
+def busiest_second(times):
+    """Höchste Anzahl Zeitpunkte in einem beliebigen Fenster von 1s."""
+    times = sorted(times)
+    return max(sum(1 for t in times[i:] if t - start < 1.0) for i, start in enumerate(times))
+
+
+@pytest.fixture
+def fake_airtable(monkeypatch):
+    server = FakeAirtable(rate_limit=AIRTABLE_RATE_LIMIT).start()
+    monkeypatch.setattr(airtable_client, "AIRTABLE_API_KEY", "patTest")
+    monkeypatch.setattr(airtable_client, "AIRTABLE_BASE_ID", "appTest")
+    monkeypatch.setattr(airtable_client, "AIRTABLE_ENDPOINT_URL", server.url)
+    yield server
+    server.stop()
+
+
+def test_bucket_never_exceeds_rate_limit_per_second():
+    bucket = airtable_client._base_bucket("appBucketTest")
+    times, lock = [], threading.Lock()
+
+    def worker():
+        for _ in range(4):
+            bucket.acquire()
+            with lock:
+                times.append(time.monotonic())
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(times) == 16
+    assert busiest_second(times) <= AIRTABLE_RATE_LIMIT
+
+
+def test_client_requests_stay_under_rate_limit(fake_airtable):
+    client = airtable_client.AirtableClient()
+    book_id = client.create_book("Igel", "Igel im Wald")
+
+    def reader():
+        for _ in range(3):
+            assert client.get_book(book_id)["fields"]["Title"] == "Igel"
+
+    threads = [threading.Thread(target=reader) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for number in range(1, 25):
+        client.add_scene(book_id, number, f"Text {number}", f"prompt {number}")
+    client.flush()
+    for thread in threads:
+        thread.join()
+
+    assert len(fake_airtable.tables[AIRTABLE_TABLE_SCENES]) == 24
+    assert fake_airtable.throttled == 0
+    client.close()
+
+
+def test_429_is_retried_through_the_bucket(fake_airtable, monkeypatch):
+    fake_airtable.rate_limit = 2
+    monkeypatch.setattr(airtable_client, "AIRTABLE_RETRY_SECONDS", 0.5)
+    monkeypatch.setattr(airtable_client, "AIRTABLE_BASE_ID", "appRetryTest")  # eigener, leerer Bucket
+    client = airtable_client.AirtableClient()
+    book_ids = [client.create_book(f"Buch {i}", "t") for i in range(6)]
+    assert all(client.get_book(book_id) for book_id in book_ids)
+    assert fake_airtable.throttled > 0
+
+
+def test_failed_scene_waits_and_gives_up(fake_airtable, monkeypatch):
+    monkeypatch.setattr(airtable_client, "AIRTABLE_LEASE_SETTLE_SECONDS", 0)
+    client = airtable_client.AirtableClient()
+    book_id = client.create_book("Igel", "Igel im Wald")
+    for number in (1, 2):
+        client.add_scene(book_id, number, f"Text {number}", f"prompt {number}")
+    client.flush()
+    first, second = (scene["id"] for scene in client.get_pending_scenes())
+
+    assert client.claim_scene(first, "host:1")
+    assert not client.fail_scene(first, "host:1", max_attempts=2, backoff=3600)
+    assert [scene["id"] for scene in client.get_pending_scenes(limit=1)] == [second]
+    assert client.count_pending_scenes() == 1
+
+    client._attempts[first] = (1, 0.0)  # Wartezeit vorbei
+    assert client.claim_scene(first, "host:1")
+    assert client.fail_scene(first, "host:1", max_attempts=2)
+    client.flush()
+    assert fake_airtable.tables[AIRTABLE_TABLE_SCENES][first]["fields"]["Image Status"] == "Failed"
+    assert [scene["id"] for scene in client.get_pending_scenes()] == [second]
+    client.close()
@@ -0,0 +1,53 @@
+import threading
+import time
+import pytest
+import modules.comfy_pool as comfy_pool
+from modules.comfy_pool import ComfyPool
+from modules.image_cache import ImageCache
+
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    pool = ComfyPool(["http://127.0.0.1:9", "http://127.0.0.2:9"], cache=ImageCache(tmp_path / "cache"))
+    pool.calls = []
+    pool.depths = {node.address: 0 for node in pool.nodes}
+    lock = threading.Lock()
+
+    for node in pool.nodes:
+        def queue_depth(timeout, address=node.address):
+            with lock:
+                pool.calls.append(address)
+            time.sleep(0.2)
+            depth = pool.depths[address]
+            if depth is None:
+                raise ConnectionError("down")
+            return depth
+        monkeypatch.setattr(node.client, "queue_depth", queue_depth)
+        monkeypatch.setattr(node.client, "connect", lambda: None)
+        monkeypatch.setattr(node.client, "disconnect", lambda: None)
+    return pool
+
+
+def test_pick_caches_queue_depth_and_uses_inflight(pool):
+    pool.depths["http://127.0.0.1:9"] = 3
+    start = time.monotonic()
+    first = pool._pick(set())
+    assert time.monotonic() - start < 0.35  # beide Instanzen parallel abgefragt
+    assert first.address == "http://127.0.0.2:9"
+    assert len(pool.calls) == 2
+
+    picks = [pool._pick(set()).address for _ in range(4)]
+    assert len(pool.calls) == 2  # innerhalb der TTL keine weiteren /queue Requests
+    # Eigene Jobs zählen: .2 bekommt Jobs, bis seine Warteschlange so lang ist wie die von .1
+    assert picks == ["http://127.0.0.2:9", "http://127.0.0.2:9", "http://127.0.0.1:9", "http://127.0.0.1:9"]
+
+
+def test_pick_refreshes_stale_depth_and_skips_dead_nodes(pool, monkeypatch):
+    monkeypatch.setattr(comfy_pool, "COMFY_QUEUE_DEPTH_TTL", 0)
+    pool.depths["http://127.0.0.2:9"] = None
+    assert pool._pick(set()).address == "http://127.0.0.1:9"
+    assert not pool.nodes[1].healthy
+
+    pool.calls.clear()
+    assert pool._pick(set()).address == "http://127.0.0.1:9"
+    assert pool.calls == ["http://127.0.0.1:9"]  # ausgefallene Instanz erst nach COMFY_NODE_RETRY_SECONDS
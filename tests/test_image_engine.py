@@ -0,0 +1,82 @@
+import pytest
+from modules.image_cache import ImageCache
+from modules.image_engine import ComfyClient, ComfyJob
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    client = ComfyClient(cache=ImageCache(tmp_path / "cache"), server_address="http://127.0.0.1:9")
+
+    def no_history(*_):
+        raise AssertionError("History darf nicht abgefragt werden")
+    monkeypatch.setattr(client, "get_history", no_history)
+    return client
+
+
+def register(client: ComfyClient, prompt_id: str, filename_prefix: str) -> ComfyJob:
+    job = ComfyJob(prompt_id, filename_prefix)
+    client._jobs[prompt_id] = job
+    return job
+
+
+def image(filename: str, folder_type: str = "output"):
+    return {"filename": filename, "subfolder": "", "type": folder_type}
+
+
+def send(client: ComfyClient, prompt_id: str, *messages):
+    for msg_type, data in messages:
+        client._dispatch({"type": msg_type, "data": {"prompt_id": prompt_id, **data}})
+
+
+def test_outputs_from_executed_events(client):
+    job = register(client, "p1", "scene_1")
+    send(client, "p1",
+         ("execution_start", {}),
+         ("executing", {"node": "3"}),
+         ("progress", {"value": 1, "max": 20}),
+         ("executed", {"node": "10", "output": {"images": [image("preview_00001_.png", "temp")]}}),
+         ("executed", {"node": "9", "output": {"images": [image("scene_1_00001_.png")]}}),
+         ("executing", {"node": None}))
+
+    assert job.done.is_set() and job.error is None
+    assert job.started_at is not None and job.progress == (1, 20)
+    assert client.resolve_image(job) == image("scene_1_00001_.png")  # SaveImage vor Preview
+    assert "p1" not in client._jobs
+
+
+def test_batch_outputs_per_prefix(client):
+    job = register(client, "p2", "scene_1")
+    job.branches = {"scene_1": None, "scene_2": None}
+    send(client, "p2",
+         ("executed", {"node": "9", "output": {"images": [image("scene_1_00001_.png")]}}),
+         ("executed", {"node": "9_b1", "output": {"images": [image("scene_2_00001_.png")]}}),
+         ("executing", {"node": None}))
+
+    assert client.resolve_images(job) == {"scene_1": image("scene_1_00001_.png"),
+                                          "scene_2": image("scene_2_00001_.png")}
+
+
+def test_execution_error_finishes_job(client):
+    job = register(client, "p3", "scene_1")
+    send(client, "p3", ("execution_error", {"exception_message": "CUDA out of memory"}))
+    assert job.done.is_set() and job.error == "CUDA out of memory"
+    assert client.resolve_image(job) is None
+
+
+def test_events_of_other_prompts_are_ignored(client):
+    job = register(client, "p4", "scene_1")
+    send(client, "other", ("executing", {"node": None}))
+    assert not job.done.is_set()
+
+
+def test_requeue_reports_new_prompt_id(client, monkeypatch):
+    job = register(client, "p5", "scene_1")
+    job.workflow = {"3": {"class_type": "KSampler", "inputs": {}}}
+    seen = []
+    job.add_prompt_callback(lambda job: seen.append(job.prompt_id))
+    monkeypatch.setattr(client, "queue_prompt", lambda workflow: "p5-neu")
+
+    del client._jobs["p5"]  # wie nach _interrupt
+    client._requeue(job, "hängt")
+    assert seen == ["p5-neu"]
+    assert client._jobs["p5-neu"] is job and job.attempts == 1
@@ -0,0 +1,179 @@
+import socket
+import time
+import pytest
+from modules.job_store import STATUS_IN_PROGRESS, AirtableSyncer, JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(tmp_path / "jobs.db")
+    yield store
+    store.close()
+
+
+def remote_scene(record_id: str, book: str = "recBook", number: int = 1, status: str = "Pending", **fields):
+    return {"id": record_id, "fields": {"Book": [book], "Scene Number": number, "Story Text": f"Text {number}",
+                                        "Image Prompt": f"prompt {number}", "Image Status": status, **fields}}
+
+
+def add_scenes(store: JobStore, count: int) -> str:
+    book_id = store.create_book("Der Igel", "Igel")
+    for number in range(1, count + 1):
+        store.add_scene(book_id, number, f"Text {number}", f"prompt {number}")
+    return book_id
+
+
+def test_create_and_pending_scenes(store):
+    book_id = add_scenes(store, 3)
+    pending = store.get_pending_scenes()
+    assert [scene["fields"]["Scene Number"] for scene in pending] == [1, 2, 3]
+    assert pending[0]["fields"]["Book"] == [book_id]
+    assert len(store.get_pending_scenes(limit=2)) == 2
+    assert store.count_pending_scenes() == 3
+    assert store.count_pending_scenes(limit=2) == 2
+    assert store.get_book(book_id)["fields"]["Title"] == "Der Igel"
+
+    store.update_scene_image(pending[0]["id"], "/tmp/1.png")
+    store.delete_scenes([pending[1]["id"]])
+    assert [scene["id"] for scene in store.get_pending_scenes()] == [pending[2]["id"]]
+
+
+def test_claim_is_exclusive(store):
+    add_scenes(store, 1)
+    scene_id = store.get_pending_scenes()[0]["id"]
+    assert store.claim_scene(scene_id, "host:1")
+    assert not store.claim_scene(scene_id, "host:2")
+    assert store.count_pending_scenes() == 0
+
+    store.release_scene(scene_id, "host:2")  # fremder Besitzer: bleibt belegt
+    assert not store.claim_scene(scene_id, "host:2")
+    store.release_scene(scene_id, "host:1")
+    assert store.claim_scene(scene_id, "host:2")
+
+
+def test_expired_lease_is_stale_and_reclaimable(store):
+    add_scenes(store, 2)
+    first, second = (scene["id"] for scene in store.get_pending_scenes())
+    assert store.claim_scene(first, "otherhost:1", ttl=-1)
+    assert store.claim_scene(second, "otherhost:1", ttl=3600)
+    store.set_scene_prompt(first, "otherhost:1", "prompt-1", ttl=-1)
+
+    stale = store.stale_leases()
+    assert [(s["id"], s["prompt_id"]) for s in stale] == [(first, "prompt-1")]
+    assert store.claim_scene(first, "otherhost:2")
+    assert not store.claim_scene(second, "otherhost:2")
+
+
+def test_dead_local_owner_is_stale(store):
+    add_scenes(store, 1)
+    scene_id = store.get_pending_scenes()[0]["id"]
+    owner = f"{socket.gethostname()}:999999999"
+    assert store.claim_scene(scene_id, owner)
+    assert [s["id"] for s in store.stale_leases()] == [scene_id]
+
+
+def test_merge_inserts_updates_and_skips_unchanged(store):
+    assert store.merge_remote_scenes([remote_scene("rec1"), remote_scene("rec2", number=2)]) == 2
+    assert store.books_without_title() == ["recBook"]
+    assert store.merge_remote_scenes([remote_scene("rec1"), remote_scene("rec2", number=2)]) == 0
+
+    assert store.merge_remote_scenes([remote_scene("rec1", status="Done", **{"Local Image Path": "/x.png"})]) == 1
+    assert store.count_pending_scenes() == 1
+
+    assert store.merge_remote_books([{"id": "recBook", "fields": {"Title": "Igel", "Topic": "t", "Status": "s"}}]) == 1
+    assert store.books_without_title() == []
+
+
+def test_merge_keeps_local_changes_and_leases(store):
+    store.merge_remote_scenes([remote_scene("rec1"), remote_scene("rec2", number=2)])
+    first, second = (scene["id"] for scene in store.get_pending_scenes())
+    store.update_scene_image(first, "/tmp/1.png")  # lokal geändert, noch nicht gepusht
+    assert store.claim_scene(second, "host:1")
+
+    store.merge_remote_scenes([remote_scene("rec1", status="Pending"), remote_scene("rec2", number=2)])
+    rows = {row["id"]: row for row in store._query("SELECT * FROM scenes")}
+    assert rows[first]["status"] == "Done"
+    assert rows[second]["status"] == STATUS_IN_PROGRESS
+
+
+def test_reconcile_removes_scenes_deleted_remotely(store):
+    add_scenes(store, 1)  # lokal, noch ohne Airtable ID
+    store.merge_remote_scenes([remote_scene("rec1"), remote_scene("rec2", number=2)])
+    assert store.reconcile_scenes({"rec2"}) == 1
+    assert store.count_pending_scenes() == 2
+
+
+class FakeAirtable:
+    """Nur die Lese-Methoden, die AirtableSyncer.pull braucht."""
+
+    def __init__(self, scenes, books):
+        self.scenes = scenes
+        self.books = books
+
+    def iter_scenes_modified_since(self, cursor):
+        yield self.scenes
+
+    def iter_scene_pages(self, fields=None):
+        yield self.scenes
+
+    def get_books(self, book_ids):
+        return [book for book in self.books if book["id"] in book_ids]
+
+
+def test_syncer_pull_fills_titles_and_reconciles(store):
+    airtable = FakeAirtable([remote_scene("rec1"), remote_scene("rec2", number=2)],
+                            [{"id": "recBook", "fields": {"Title": "Igel", "Topic": "t", "Status": "Ready for Art"}}])
+    syncer = AirtableSyncer(store, airtable, reconcile_interval=3600)
+    assert syncer.pull() == 2
+    assert store.list_books()[0]["fields"]["Title"] == "Igel"
+    assert store.get_state(syncer.PULL_CURSOR)
+
+    airtable.scenes = airtable.scenes[1:]
+    assert syncer.pull() == 0
+    assert store.count_pending_scenes() == 2  # Abgleich erst nach dem Intervall
+    store.set_state(syncer.RECONCILED_AT, str(time.time() - 3600))
+    syncer.pull()
+    assert store.count_pending_scenes() == 1
+
+
+def test_set_scene_prompt_renews_lease(store):
+    add_scenes(store, 1)
+    scene_id = store.get_pending_scenes()[0]["id"]
+    assert store.claim_scene(scene_id, "otherhost:1", ttl=-1)
+    assert store.stale_leases()
+
+    store.set_scene_prompt(scene_id, "otherhost:2", "prompt-x")  # fremder Besitzer: keine Wirkung
+    assert store.stale_leases()
+    store.set_scene_prompt(scene_id, "otherhost:1", "prompt-2")
+    assert store.stale_leases() == []
+    assert store._query("SELECT prompt_id FROM scenes")[0]["prompt_id"] == "prompt-2"
+
+
+def test_failed_scene_backs_off_and_gives_up(store):
+    add_scenes(store, 2)
+    first, second = (scene["id"] for scene in store.get_pending_scenes())
+    assert store.claim_scene(first, "host:1")
+    assert not store.fail_scene(first, "host:2")  # fremder Besitzer: zählt nicht
+    assert not store.fail_scene(first, "host:1", max_attempts=2, backoff=3600)
+    assert [scene["id"] for scene in store.get_pending_scenes()] == [second]  # wartet, blockiert nicht
+    assert store.count_pending_scenes() == 1
+
+    store._write("UPDATE scenes SET retry_after = ? WHERE id = ?", (time.time() - 1, first))
+    assert store.get_pending_scenes(limit=1)[0]["id"] == first
+    assert store.claim_scene(first, "host:1")
+    assert store.fail_scene(first, "host:1", max_attempts=2, backoff=0)
+    row = store._query("SELECT * FROM scenes WHERE id = ?", (first,))[0]
+    assert (row["status"], row["attempts"], row["dirty"]) == ("Failed", 2, 1)
+    assert [scene["id"] for scene in store.get_pending_scenes()] == [second]
+
+
+def test_failed_scene_reset_in_airtable_gets_new_attempts(store):
+    store.merge_remote_scenes([remote_scene("rec1")])
+    scene_id = store.get_pending_scenes()[0]["id"]
+    assert store.claim_scene(scene_id, "host:1")
+    assert store.fail_scene(scene_id, "host:1", max_attempts=1)
+    store._write("UPDATE scenes SET dirty = 0")  # gepusht
+
+    store.merge_remote_scenes([remote_scene("rec1", status="Pending")])
+    assert store.get_pending_scenes()[0]["id"] == scene_id
+    assert store._query("SELECT attempts FROM scenes")[0]["attempts"] == 0
@@ -0,0 +1,42 @@
+import json
+from modules.metrics import Metrics
+
+
+def test_textfile_per_command_with_counters(tmp_path):
+    metrics = Metrics(tmp_path / "trace.jsonl", tmp_path / "kidsbook.prom")
+    metrics.set_command("serve")
+    metrics.inc("comfy_stalls_total", labels={"node": "a"})
+    metrics.inc("comfy_stalls_total", labels={"node": "a"})
+    metrics.observe("comfy_exec_seconds", 1.5)
+    metrics.write_if_due(interval=0)
+
+    text = (tmp_path / "kidsbook_serve.prom").read_text()
+    assert "# TYPE kidsbook_comfy_stalls_total counter" in text
+    assert 'kidsbook_comfy_stalls_total{command="serve",node="a"} 2.000000' in text
+    assert "kidsbook_comfy_stalls_total_count" not in text
+    assert "# TYPE kidsbook_comfy_exec_seconds summary" in text
+    assert 'kidsbook_comfy_exec_seconds_count{command="serve"} 1' in text
+    assert not (tmp_path / "kidsbook.prom").exists()
+    metrics.close()
+
+
+def test_write_if_due_waits_for_interval(tmp_path):
+    metrics = Metrics(None, tmp_path / "kidsbook.prom")
+    metrics.observe("x_seconds", 1)
+    metrics.write_if_due(interval=3600)
+    assert not (tmp_path / "kidsbook.prom").exists()
+    metrics.write_if_due(interval=0)
+    assert (tmp_path / "kidsbook.prom").exists()
+
+
+def test_trace_is_rotated(tmp_path):
+    trace = tmp_path / "trace.jsonl"
+    metrics = Metrics(trace, None, trace_max_bytes=500)
+    for i in range(20):
+        metrics.observe("x_seconds", i)
+    metrics.close()
+
+    rotated = tmp_path / "trace.jsonl.1"
+    assert rotated.exists()
+    assert trace.stat().st_size < 500 and rotated.stat().st_size >= 500
+    assert json.loads(trace.read_text().splitlines()[-1])["value"] == 19
@@ -0,0 +1,80 @@
+import pytest
+from modules.scheduler import PHASE_ART, PHASE_IDLE, PHASE_STORY, PhaseScheduler, TopicQueue
+
+
+def scheduler(**overrides) -> PhaseScheduler:
+    settings = dict(story_high=3, story_low=1, art_high=10, art_low=2,
+                    min_dwell=60, max_dwell=600, max_idle_wait=30, poll_interval=0)
+    settings.update(overrides)
+    noop = lambda *_: None
+    return PhaseScheduler(lambda: 0, lambda: 0, noop, noop, noop, noop, **settings)
+
+
+def in_phase(s: PhaseScheduler, phase: str, since: float = 0.0, last_active=None) -> PhaseScheduler:
+    s.phase = phase
+    s.phase_since = since
+    s.last_active = last_active or phase
+    return s
+
+
+@pytest.mark.parametrize("story, art, expected", [
+    (0, 0, PHASE_IDLE),
+    (2, 9, PHASE_IDLE),      # beide unter der High-Watermark
+    (3, 0, PHASE_STORY),
+    (0, 10, PHASE_ART),
+    (3, 10, PHASE_STORY),    # Story hat Vorrang
+])
+def test_idle_starts_at_high_watermark(story, art, expected):
+    assert scheduler().decide(story, art, now=0) == expected
+
+
+def test_idle_starts_after_max_idle_wait():
+    s = scheduler()
+    s.waiting_since = 100.0
+    assert s.decide(0, 1, now=129) == PHASE_IDLE
+    assert s.decide(0, 1, now=130) == PHASE_ART
+    assert s.decide(1, 1, now=130) == PHASE_STORY
+
+
+def test_idle_wait_prefers_loaded_model():
+    s = scheduler()
+    s.waiting_since, s.last_active = 0.0, PHASE_ART
+    assert s.decide(1, 1, now=30) == PHASE_ART
+    assert s.decide(1, 0, now=30) == PHASE_STORY
+
+
+def test_empty_queue_switches_immediately():
+    s = in_phase(scheduler(), PHASE_STORY, since=0)
+    assert s.decide(0, 1, now=1) == PHASE_ART
+    assert s.decide(0, 0, now=1) == PHASE_IDLE
+
+
+def test_min_dwell_holds_phase():
+    s = in_phase(scheduler(), PHASE_STORY, since=0)
+    assert s.decide(1, 50, now=59) == PHASE_STORY
+    assert s.decide(1, 50, now=60) == PHASE_ART
+
+
+@pytest.mark.parametrize("story, art, expected", [
+    (1, 10, PHASE_ART),      # Art an High, Story an Low
+    (2, 10, PHASE_STORY),    # Story noch über Low
+    (1, 9, PHASE_STORY),     # Art noch unter High
+])
+def test_hysteresis_after_min_dwell(story, art, expected):
+    s = in_phase(scheduler(), PHASE_STORY, since=0)
+    assert s.decide(story, art, now=100) == expected
+
+
+def test_max_dwell_forces_switch():
+    s = in_phase(scheduler(), PHASE_ART, since=0)
+    assert s.decide(1, 50, now=599) == PHASE_ART
+    assert s.decide(1, 50, now=600) == PHASE_STORY
+
+
+def test_topic_queue_pops_in_order(tmp_path):
+    queue = TopicQueue(tmp_path / "topics.txt")
+    assert queue.pop() is None
+    (tmp_path / "topics.txt").write_text("# Kommentar\nIgel\n\nFuchs\n", encoding="utf-8")
+    queue.push("Drache")
+    assert queue.depth() == 3
+    assert [queue.pop(), queue.pop(), queue.pop(), queue.pop()] == ["Igel", "Fuchs", "Drache", None]
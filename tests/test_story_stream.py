@@ -0,0 +1,94 @@
+import json
+import pytest
+from modules.story_stream import (EVENT_BLOCK, EVENT_TITLE, StoryStreamError, StoryStreamParser,
+                                  StoryStreamValidator, StoryValidationError)
+
+STORY = {
+    "title": "Der mutige \"Igel\"",
+    "blocks": [
+        {"type": "text", "content": "Es war einmal ein Igel. {Klammern} und [Listen] im Text."},
+        {"type": "image_prompt", "content": "a small hedgehog in a forest"},
+        {"type": "text", "content": "Er fand einen Freund."},
+        {"type": "image_prompt", "content": "a hedgehog and a fox, watercolor"},
+    ],
+}
+
+
+def chunks(text: str, size: int):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", [1, 3, 17, 10_000])
+def test_parser_events_independent_of_chunking(size):
+    parser = StoryStreamParser()
+    events = []
+    for chunk in chunks(json.dumps(STORY, ensure_ascii=False, indent=2), size):
+        events.extend(parser.feed(chunk))
+
+    assert events[0] == (EVENT_TITLE, STORY["title"])
+    assert [value for event, value in events if event == EVENT_BLOCK] == STORY["blocks"]
+    assert parser.closed and parser.blocks_closed
+    assert parser.result() == STORY
+
+
+def test_parser_reports_block_before_stream_ends():
+    text = json.dumps(STORY)
+    first_block_end = text.index("}, {") + 1
+    parser = StoryStreamParser()
+    events = parser.feed(text[:first_block_end])
+    assert events[-1] == (EVENT_BLOCK, STORY["blocks"][0])
+    assert not parser.closed
+
+
+def test_parser_truncated_stream_is_not_closed():
+    text = json.dumps(STORY)
+    parser = StoryStreamParser()
+    parser.feed(text[:len(text) // 2])
+    assert not parser.closed
+    with pytest.raises(StoryStreamError):
+        parser.result()
+
+
+@pytest.mark.parametrize("text", ['["title"]', 'Hier ist die Story: {}', '{"title": "x"}}', '{"a": [}'])
+def test_parser_rejects_invalid_json(text):
+    with pytest.raises(StoryStreamError):
+        StoryStreamParser().feed(text)
+
+
+def test_validator_accepts_streamed_story():
+    validator = StoryStreamValidator(min_scenes=2)
+    for chunk in chunks(json.dumps(STORY), 5):
+        validator.feed(chunk)
+    assert validator.scenes == 2
+    assert validator.result() == STORY
+
+
+def test_validator_truncated_output():
+    validator = StoryStreamValidator(min_scenes=2)
+    validator.feed(json.dumps(STORY)[:40])
+    with pytest.raises(StoryValidationError, match="mitten im JSON"):
+        validator.result()
+
+
+@pytest.mark.parametrize("story, message", [
+    ({"title": ["x"], "blocks": []}, "'title'"),
+    ({"title": "x", "blocks": {"type": "text"}}, "'blocks'"),
+    ({"title": "x", "blocks": [{"type": "video", "content": "x"}]}, "Block-Typ"),
+    ({"title": "x", "blocks": [{"type": "text", "content": "  "}]}, "ohne Inhalt"),
+    ({"title": "x", "blocks": [{"type": "image_prompt", "content": "a"}]}, "Nur 1 von 2"),
+    ({"blocks": [{"type": "image_prompt", "content": "a"}] * 2}, "ohne 'title'"),
+])
+def test_validator_aborts_early(story, message):
+    validator = StoryStreamValidator(min_scenes=2)
+    with pytest.raises(StoryValidationError, match=message):
+        for chunk in chunks(json.dumps(story), 4):
+            validator.feed(chunk)
+
+
+def test_validator_aborts_runaway_output():
+    validator = StoryStreamValidator(min_scenes=1, max_blocks=3)
+    block = json.dumps({"type": "text", "content": "und dann"})
+    with pytest.raises(StoryValidationError, match="Mehr als 3"):
+        validator.feed('{"title": "x", "blocks": [')
+        for _ in range(10):
+            validator.feed(block + ",")
@@ -0,0 +1,90 @@
+import json
+import pytest
+from modules.workflow import WorkflowTemplate, downstream_nodes
+
+WORKFLOW = {
+    "3": {"class_type": "KSampler", "inputs": {"seed": 1, "steps": 20, "model": ["4", 0], "positive": ["6", 0],
+                                               "negative": ["7", 0], "latent_image": ["5", 0]}},
+    "4": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "model.safetensors"}},
+    "5": {"class_type": "EmptyLatentImage", "inputs": {"width": 1024, "height": 1024, "batch_size": 1}},
+    "6": {"class_type": "CLIPTextEncode", "inputs": {"text": "", "clip": ["4", 1]}},
+    "7": {"class_type": "CLIPTextEncode", "inputs": {"text": "blurry", "clip": ["4", 1]}},
+    "8": {"class_type": "VAEDecode", "inputs": {"samples": ["3", 0], "vae": ["4", 2]}},
+    "9": {"class_type": "SaveImage", "inputs": {"filename_prefix": "ComfyUI", "images": ["8", 0]}},
+}
+
+SCENES = [("a hedgehog", 11, "book_scene_1"), ("a fox", 22, "book_scene_2"), ("an owl", 33, "book_scene_3")]
+
+
+def template(tmp_path, workflow=WORKFLOW) -> WorkflowTemplate:
+    path = tmp_path / "workflow_api.json"
+    path.write_text(json.dumps(workflow), encoding="utf-8")
+    return WorkflowTemplate(path)
+
+
+def links(payload):
+    for node_id, node in payload.items():
+        for value in node["inputs"].values():
+            if isinstance(value, list) and len(value) == 2:
+                yield node_id, str(value[0])
+
+
+def test_compile_finds_patch_points(tmp_path):
+    points = template(tmp_path).patch_points
+    assert points == {"prompt": ("6", "text"), "seed": ("3", "seed"), "negative": ("7", "text"),
+                      "batch_size": ("5", "batch_size"), "prefix": ("9", "filename_prefix")}
+    assert downstream_nodes(WORKFLOW, ["6", "3"]) == {"3", "6", "8", "9"}
+
+
+def test_render_does_not_touch_graph(tmp_path):
+    wf = template(tmp_path)
+    payload = wf.render("a hedgehog", 42, filename_prefix="scene_1")
+    assert payload["6"]["inputs"]["text"] == "a hedgehog"
+    assert payload["3"]["inputs"]["seed"] == 42
+    assert wf.graph["6"]["inputs"]["text"] == ""
+    assert payload["4"] is wf.graph["4"]  # nicht gepatchte Nodes werden geteilt
+
+
+def test_render_batch_has_one_branch_per_scene(tmp_path):
+    wf = template(tmp_path)
+    payload = wf.render_batch(SCENES, negative="ugly")
+
+    saves = [node for node in payload.values() if node["class_type"] == "SaveImage"]
+    assert sorted(node["inputs"]["filename_prefix"] for node in saves) == [prefix for _, _, prefix in SCENES]
+    samplers = [node for node in payload.values() if node["class_type"] == "KSampler"]
+    assert sorted(node["inputs"]["seed"] for node in samplers) == [11, 22, 33]
+    # Geteilte Nodes gibt es nur einmal
+    assert [node_id for node_id, node in payload.items() if node["class_type"] == "CheckpointLoaderSimple"] == ["4"]
+    assert payload["7"]["inputs"]["text"] == "ugly"
+    assert len(payload) == len(WORKFLOW) + 2 * len(wf.branch_nodes)
+    assert all(source in payload for _, source in links(payload))
+    assert wf.graph == WORKFLOW
+
+
+def test_render_batch_branches_are_wired_to_their_own_nodes(tmp_path):
+    payload = template(tmp_path).render_batch(SCENES)
+    for save_id, save in payload.items():
+        if save["class_type"] != "SaveImage":
+            continue
+        sampler = payload[payload[save["inputs"]["images"][0]]["inputs"]["samples"][0]]
+        prompt = payload[sampler["inputs"]["positive"][0]]
+        scene = next(scene for scene in SCENES if scene[2] == save["inputs"]["filename_prefix"])
+        assert (prompt["inputs"]["text"], sampler["inputs"]["seed"]) == scene[:2]
+
+
+def test_render_batch_node_ids_do_not_collide(tmp_path):
+    # Ein Workflow, der schon eine Node mit dem Namensschema der Zweige enthält
+    workflow = {**WORKFLOW, "9_b1": {"class_type": "PreviewImage", "inputs": {"images": ["8", 0]}}}
+    wf = template(tmp_path, workflow)
+    payload = wf.render_batch(SCENES)
+
+    assert payload["9_b1"]["class_type"] == "PreviewImage"
+    assert len(payload) == len(workflow) + 2 * len(wf.branch_nodes)
+    prefixes = [node["inputs"]["filename_prefix"] for node in payload.values() if node["class_type"] == "SaveImage"]
+    assert sorted(prefixes) == [prefix for _, _, prefix in SCENES]
+
+
+def test_render_batch_needs_save_image_on_prompt(tmp_path):
+    workflow = {node_id: node for node_id, node in WORKFLOW.items() if node_id != "9"}
+    with pytest.raises(ValueError):
+        template(tmp_path, workflow).render_batch(SCENES)